@@ -0,0 +1,430 @@
+import math
+import time
+
+import numpy as np
+
+from infrastructure import Batch
+from heuristic import BatchingInstance, cheapest_insertion, route_length, two_opt
+
+
+# scores of an operator pair for a new best solution, an improvement and an accepted worse solution
+SCORE_BEST = 33.0
+SCORE_BETTER = 9.0
+SCORE_ACCEPTED = 3.0
+
+
+def solve(dist, orders, volume=6, time_limit=10.0, seed=None):
+    """Batches and routes the orders with adaptive large neighbourhood search, without gurobipy.
+
+    This is a second solver backend for instances that are too large for model.Model. It takes
+    the same inputs and returns the batches with their routes.
+
+    Args:
+        dist (:obj: `DistanceMatrix` or `dict`): distances, eg dist['node_id_i']['node_id_j'].
+                       orders (:obj: `dict`): Dict of all orders.
+                                              key: order_id (str) and item: infrastructure.Order
+                     volume (int, optional): Maximum number of orders in a batch, default is 6.
+             time_limit (float, optional): seconds of search after the start solution is built,
+                                           default is 10.
+                     seed (int, optional): seed of the random number generator.
+
+    Returns:
+        batches (:obj: `list`): list of infrastructure.Batch, with orders, route and distance set.
+
+    Example:
+    >>> batches = solve(dist, read_orders("../data/example.csv"), volume=6, time_limit=1)
+    >>> sum(batch.distance for batch in batches)
+    189400
+    """
+    instance = BatchingInstance.from_orders(dist, orders)
+    search = ALNS(instance, volume=volume, seed=seed)
+    search.run(time_limit)
+    return search.best_batches(orders)
+
+
+class ALNS:
+    """Adaptive large neighbourhood search over the assignment of orders to batches.
+
+    Every iteration removes a few orders (destroy) and inserts them again (repair), choosing the
+    operators by adaptive weights. Insertions are priced with cheapest-insertion deltas on the
+    current routes; changed routes are improved with 2-opt. Worse solutions are accepted as in
+    simulated annealing, with a temperature that falls over the time budget.
+
+    Batches are kept in slots 0, ..., n_orders-1; an empty slot is an unused batch.
+
+    Attributes:
+        instance (:obj: `BatchingInstance`): orders and distances.
+                                volume (int): Maximum number of orders in a batch.
+                   batches (:obj: `list`): batches[k] is the list of orders in slot k.
+                    routes (:obj: `list`): routes[k] is the path of slot k, node indices from START to END.
+                  costs (:obj: `ndarray`): costs[k] is the route length of slot k, 0 if empty.
+                    stats (:obj: `dict`): 'iterations', 'accepted', 'best_cost', 'start_cost',
+                                          'construction_seconds' and 'search_seconds'.
+    """
+
+    def __init__(self, instance, volume=6, seed=None, n_candidates=20, max_removed=10,
+                 segment=100, reaction=0.2):
+        """
+        Args:
+            instance (:obj: `BatchingInstance`): orders and distances.
+                                 volume (int, optional): Maximum number of orders in a batch.
+                                   seed (int, optional): seed of the random number generator.
+                           n_candidates (int, optional): number of nearby batches tried for every insertion.
+                            max_removed (int, optional): maximum number of orders removed per iteration.
+                                segment (int, optional): iterations between updates of the operator weights.
+                             reaction (float, optional): how fast the operator weights follow their scores.
+        """
+        construction_start = time.perf_counter()
+        self.instance = instance
+        self.volume = volume
+        self.n_candidates = n_candidates
+        self.max_removed = max_removed
+        self.segment = segment
+        self.reaction = reaction
+        self._rng = np.random.default_rng(seed)
+        self._distances = instance.distances
+
+        n_orders = len(instance.order_ids)
+        self._order_nodes = [set(nodes_o.tolist()) for nodes_o in instance.order_nodes]
+
+        # orders and batches that are close along one tour through all nodes are close in the warehouse
+        self._order_position = instance.order_positions()
+
+        self.batches = [[] for k in range(n_orders)]
+        self.routes = [[] for k in range(n_orders)]
+        self.costs = np.zeros(n_orders, dtype=np.int64)
+        self._batch_position = np.full(n_orders, np.inf)
+        # used slots, and used slots with room, by int(position), to find the batches near a
+        # position without a full scan
+        self._buckets = dict()
+        self._room_buckets = dict()
+        self._slot_bucket = dict()
+        self._empty_slots = set(range(n_orders))
+        self._batch_size = np.zeros(n_orders, dtype=np.int64)
+        self._order_batch = np.zeros(n_orders, dtype=np.int64)
+        self._build_start_solution()
+
+        self._destroy_operators = [self._random_removal, self._related_removal, self._worst_removal,
+                                   self._batch_removal]
+        self._repair_operators = [self._greedy_insertion, self._regret_insertion]
+        self._destroy_weights = np.ones(len(self._destroy_operators))
+        self._repair_weights = np.ones(len(self._repair_operators))
+
+        self._best_cost = int(self.costs.sum())
+        self._best = {k: (list(self.batches[k]), list(self.routes[k]), self.costs[k]) for k in range(n_orders)}
+        self._changed_since_best = set()
+        self.stats = {
+            'iterations': 0,
+            'accepted': 0,
+            'start_cost': self._best_cost,
+            'best_cost': self._best_cost,
+            'construction_seconds': time.perf_counter() - construction_start,
+            'search_seconds': 0.0,
+        }
+
+    def _build_start_solution(self, chunk_size=None):
+        """Builds the start solution with seed_batches on consecutive chunks of the orders sorted by
+        position (BatchingInstance.construct_chunked). The plan of the constructive heuristic,
+        seed_batches on all orders as heuristic.construct_batches, is the start solution instead if
+        it is shorter, so the search never returns a worse plan."""
+        chunked = self.instance.construct_chunked(self.volume, chunk_size)
+        for k, batch in enumerate(chunked):
+            self._set_batch(k, batch)
+
+        constructed = self.instance.construct(self.volume)
+        routes = [self.instance.route(batch) for batch in constructed]
+        if sum(cost for route, cost in routes) < self.costs.sum():
+            for k in range(len(chunked)):
+                self._set_batch(k, [])
+            for k, (batch, (route, cost)) in enumerate(zip(constructed, routes)):
+                self._set_batch(k, batch, route, cost)
+
+    def run(self, time_limit):
+        """Searches until time_limit seconds have passed.
+
+        Returns:
+            best_cost (int): total route length of the best solution found.
+        """
+        search_start = time.perf_counter()
+        deadline = search_start + time_limit
+        current_cost = int(self.costs.sum())
+        used = np.count_nonzero(self._batch_size)
+        # a 5% worse average batch is accepted with probability 1/2 at the start, 1/1000 of that at the end
+        start_temperature = 0.05 * current_cost / max(used, 1) / math.log(2)
+        end_temperature = start_temperature / 1000
+        destroy_scores = np.zeros(len(self._destroy_operators))
+        repair_scores = np.zeros(len(self._repair_operators))
+        destroy_uses = np.zeros(len(self._destroy_operators))
+        repair_uses = np.zeros(len(self._repair_operators))
+
+        while True:
+            now = time.perf_counter()
+            if now >= deadline or len(self.instance.order_ids) < 2:
+                break
+            progress = (now - search_start) / time_limit if time_limit > 0 else 1.0
+            temperature = start_temperature * (end_temperature / start_temperature) ** progress
+
+            d = self._choose(self._destroy_weights)
+            r = self._choose(self._repair_weights)
+            n_removed = int(self._rng.integers(2, min(self.max_removed, len(self.instance.order_ids)) + 1))
+
+            backup = dict()
+            removed = self._destroy_operators[d](n_removed)
+            self._remove(removed, backup)
+            self._repair_operators[r](removed, backup)
+
+            new_cost = current_cost + int(sum(self.costs[k] - cost for k, (orders_k, route, cost) in backup.items()))
+            score = 0.0
+            if new_cost < self._best_cost:
+                score = SCORE_BEST
+            elif new_cost < current_cost:
+                score = SCORE_BETTER
+            elif self._rng.random() < math.exp(-(new_cost - current_cost) / max(temperature, 1e-9)):
+                score = SCORE_ACCEPTED
+
+            if score > 0:
+                current_cost = new_cost
+                self._changed_since_best.update(backup)
+                self.stats['accepted'] += 1
+                if score == SCORE_BEST:
+                    self._save_best(new_cost)
+            else:
+                for k, (orders_k, route, cost) in backup.items():
+                    self._set_batch(k, orders_k, route, cost)
+
+            destroy_scores[d] += score
+            repair_scores[r] += score
+            destroy_uses[d] += 1
+            repair_uses[r] += 1
+            self.stats['iterations'] += 1
+            if self.stats['iterations'] % self.segment == 0:
+                self._update_weights(self._destroy_weights, destroy_scores, destroy_uses)
+                self._update_weights(self._repair_weights, repair_scores, repair_uses)
+
+        self.stats['search_seconds'] += time.perf_counter() - search_start
+        return self._best_cost
+
+    def best_batches(self, orders=None):
+        """Returns the best solution as a list of infrastructure.Batch.
+
+        Args:
+            orders (:obj: `dict`, optional): the orders, to fill in the picks of the batches.
+        """
+        batches = []
+        for orders_k, route, cost in self._best.values():
+            if len(orders_k) > 0:
+                batch = Batch(orders=[self.instance.order_ids[order] for order in orders_k],
+                              route=[self.instance.nodes[node] for node in route], distance=int(cost))
+                if orders is not None:
+                    for order_id in batch.orders:
+                        batch.picks.extend(orders[order_id].picks)
+                batches.append(batch)
+        return batches
+
+    def _choose(self, weights):
+        """Roulette wheel selection of an operator index."""
+        return int(self._rng.choice(len(weights), p=weights / weights.sum()))
+
+    def _update_weights(self, weights, scores, uses):
+        """Moves the weights towards the average score of the last segment and resets the scores."""
+        used = uses > 0
+        weights[used] = (1 - self.reaction) * weights[used] + self.reaction * scores[used] / uses[used]
+        np.maximum(weights, 0.1, out=weights)
+        scores[:] = 0
+        uses[:] = 0
+
+    def _save_best(self, cost):
+        """Copies the batches that changed since the last best solution."""
+        for k in self._changed_since_best:
+            self._best[k] = (list(self.batches[k]), list(self.routes[k]), self.costs[k])
+        self._changed_since_best.clear()
+        self._best_cost = cost
+        self.stats['best_cost'] = cost
+
+    def _set_batch(self, k, orders_k, route=None, cost=None):
+        """Sets the orders of slot k, and routes them if no route is given."""
+        self.batches[k] = list(orders_k)
+        if len(orders_k) == 0:
+            route, cost = [], 0
+        elif route is None:
+            route, cost = self.instance.route(orders_k)
+        self.routes[k] = list(route)
+        self.costs[k] = cost
+        self._batch_size[k] = len(orders_k)
+        self._batch_position[k] = self._order_position[orders_k].mean() if len(orders_k) > 0 else np.inf
+        if k in self._slot_bucket:
+            bucket = self._slot_bucket.pop(k)
+            self._buckets[bucket].discard(k)
+            self._room_buckets[bucket].discard(k)
+        if len(orders_k) > 0:
+            bucket = int(self._batch_position[k])
+            self._buckets.setdefault(bucket, set()).add(k)
+            self._room_buckets.setdefault(bucket, set())
+            if len(orders_k) < self.volume:
+                self._room_buckets[bucket].add(k)
+            self._slot_bucket[k] = bucket
+            self._empty_slots.discard(k)
+        else:
+            self._empty_slots.add(k)
+        for order in orders_k:
+            self._order_batch[order] = k
+
+    def _backup(self, k, backup):
+        """Stores slot k in backup before its first change in this iteration."""
+        if k not in backup:
+            backup[k] = (list(self.batches[k]), list(self.routes[k]), self.costs[k])
+
+    def _nodes_of(self, orders_k):
+        nodes = set()
+        for order in orders_k:
+            nodes.update(self._order_nodes[order])
+        return nodes
+
+    def _remove(self, removed, backup):
+        """Removes the orders from their batches; nodes no longer needed are cut out of the route,
+        which keeps the order of the remaining nodes."""
+        by_batch = dict()
+        for order in removed:
+            by_batch.setdefault(int(self._order_batch[order]), []).append(order)
+        start, end = self.instance.START, self.instance.END
+        for k, orders_removed in by_batch.items():
+            self._backup(k, backup)
+            remaining = [order for order in self.batches[k] if order not in orders_removed]
+            if len(remaining) == 0:
+                self._set_batch(k, [])
+                continue
+            needed = self._nodes_of(remaining)
+            route = [node for node in self.routes[k] if node in needed or node == start or node == end]
+            self._set_batch(k, remaining, route, route_length(self._distances, route))
+
+    # destroy operators, each returns a list of orders to remove
+
+    def _random_removal(self, n_removed):
+        return self._rng.choice(len(self.instance.order_ids), size=n_removed, replace=False).tolist()
+
+    def _related_removal(self, n_removed):
+        """Removes an order and the orders in nearby batches that are closest to it."""
+        order = int(self._rng.integers(len(self.instance.order_ids)))
+        candidates = [other for k in self._nearby_batches(self._order_position[order], self.n_candidates)
+                      for other in self.batches[k] if other != order]
+        if len(candidates) == 0:
+            return [order]
+        nodes_o = self.instance.order_nodes[order]
+        relatedness = [self._distances[np.ix_(nodes_o, self.instance.order_nodes[other])].min(axis=1).mean()
+                       for other in candidates]
+        closest = np.argsort(relatedness)[:(n_removed-1)]
+        return [order] + [candidates[i] for i in closest]
+
+    def _worst_removal(self, n_removed, sample_size=50):
+        """Removes the orders with the largest saving in a random sample of batches."""
+        used = np.flatnonzero(self._batch_size)
+        sample = self._rng.choice(used, size=min(sample_size, len(used)), replace=False)
+        start, end = self.instance.START, self.instance.END
+        savings = []
+        for k in sample.tolist():
+            for order in self.batches[k]:
+                needed = self._nodes_of(other for other in self.batches[k] if other != order)
+                route = [node for node in self.routes[k] if node in needed or node == start or node == end]
+                savings.append((self.costs[k] - route_length(self._distances, route), order))
+        savings.sort(reverse=True)
+        # randomised, so that the same orders are not removed every time
+        chosen = set()
+        while len(chosen) < min(n_removed, len(savings)):
+            chosen.add(savings[int(len(savings) * self._rng.random() ** 3)][1])
+        return list(chosen)
+
+    def _batch_removal(self, n_removed):
+        """Removes all orders of a random batch, preferring small batches, so batches can be merged."""
+        used = np.flatnonzero(self._batch_size)
+        weights = 1.0 / self._batch_size[used]
+        k = int(self._rng.choice(used, p=weights / weights.sum()))
+        return list(self.batches[k])
+
+    # repair operators, each inserts all removed orders again
+
+    def _greedy_insertion(self, removed, backup):
+        """Inserts the orders in random order, each at its cheapest position."""
+        for order in self._rng.permutation(removed).tolist():
+            delta, k = self._best_insertions(order)[0]
+            self._insert(order, k, backup)
+
+    def _regret_insertion(self, removed, backup):
+        """Inserts first the order that loses most if it is not inserted at its best position."""
+        remaining = list(removed)
+        while remaining:
+            best_regret, best = -1.0, None
+            for order in remaining:
+                insertions = self._best_insertions(order)
+                regret = insertions[1][0] - insertions[0][0] if len(insertions) > 1 else math.inf
+                if regret > best_regret:
+                    best_regret, best = regret, (order, insertions[0][1])
+            order, k = best
+            self._insert(order, k, backup)
+            remaining.remove(order)
+
+    def _best_insertions(self, order):
+        """Prices inserting order into nearby batches with room, and into a new batch.
+
+        All candidate routes are priced in one vectorised computation: every node of the order is
+        priced at its cheapest edge of every route, and the prices of the nodes are summed. A node
+        that is already on a route costs 0, as the edge leaving it prices it at D[i, i] = 0.
+
+        Returns:
+            insertions (:obj: `list`): (delta, slot) sorted by delta.
+        """
+        nodes = np.fromiter(self._order_nodes[order], dtype=np.intp)
+        start, end = self.instance.START, self.instance.END
+        insertions = []
+
+        candidates = self._nearby_batches(self._order_position[order], self.n_candidates, with_room=True)
+        if len(candidates) > 0:
+            routes = [self.routes[k] for k in candidates]
+            edge_from = np.concatenate([route[:-1] for route in routes])
+            edge_to = np.concatenate([route[1:] for route in routes])
+            offsets = np.r_[0, np.cumsum([len(route) - 1 for route in routes])][:-1]
+            # added[e, n] is the length added by walking edge e through node n
+            added = (self._distances[edge_from[:, None], nodes[None, :]] + self._distances[nodes[None, :], edge_to[:, None]]
+                     - self._distances[edge_from, edge_to][:, None])
+            deltas = np.minimum.reduceat(added, offsets, axis=0).sum(axis=1)
+            insertions = list(zip(deltas.tolist(), candidates))
+
+        if len(self._empty_slots) > 0:
+            # a new batch costs its whole route, with the edge from start to end and the way back
+            delta, route = cheapest_insertion(self._distances, [start, end], self._order_nodes[order])
+            insertions.append((route_length(self._distances, route), next(iter(self._empty_slots))))
+        insertions.sort()
+        return insertions
+
+    def _insert(self, order, k, backup):
+        """Adds order to slot k by cheapest insertion of its nodes, and improves the route with 2-opt."""
+        self._backup(k, backup)
+        route = self.routes[k] if len(self.routes[k]) > 0 else [self.instance.START, self.instance.END]
+        delta, route = cheapest_insertion(self._distances, route, self._order_nodes[order])
+        route = two_opt(self._distances, route)
+        self._set_batch(k, self.batches[k] + [order], route, route_length(self._distances, route))
+
+    def _nearby_batches(self, position, n, with_room=False):
+        """Returns up to n used slots whose batch position is closest to position.
+
+        The buckets around position are searched outwards until n slots are found or the search
+        radius is reached, so the work does not grow with the number of batches.
+        """
+        buckets = self._room_buckets if with_room else self._buckets
+        center = int(position)
+        lowest, highest = min(buckets, default=0), max(buckets, default=0)
+        # the radius that holds about 4n batches if the batches were spread evenly
+        search_radius = max(2, (highest - lowest + 1) * 4 * n // max(len(self._slot_bucket), 1))
+        found = []
+        radius = 0
+        while (len(found) < n and radius <= search_radius
+               and (center - radius >= lowest or center + radius <= highest)):
+            found.extend(buckets.get(center - radius, ()))
+            if radius > 0:
+                found.extend(buckets.get(center + radius, ()))
+            radius += 1
+        if len(found) > n:
+            # the buckets of the last radius may hold slots further away than slots not yet found,
+            # keep the n closest of those found
+            found.sort(key=lambda k: abs(self._batch_position[k] - position))
+            found = found[:n]
+        return found
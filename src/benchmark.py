@@ -0,0 +1,283 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from infrastructure import NAME_START_NODE, NAME_END_NODE, DistanceMatrix, Warehouse, read_orders
+from instrumentation import peak_rss_mb
+
+
+ORDERS_HEADER = ['Auftrag', 'Datum', 'Lagerort', 'Begin Komm. am', 'Begin Komm. um', 'Ende Komm. am',
+                 'Ende Komm. Auftrag um', 'Ende Komm. Pos. um', 'Batch', 'Reihenfolge der Komm.',
+                 'Wagen Nr', 'Artikel', 'Kistennummer', 'Erstellt am', 'Erstellt um']
+
+# share of orders with 1, 2, ... picks
+ORDER_SIZES = {1: 0.40, 2: 0.25, 3: 0.15, 4: 0.10, 5: 0.05, 6: 0.03, 8: 0.02}
+
+# columns of the result files, in this order
+RESULT_FIELDS = ['timestamp', 'label', 'solver', 'aisles', 'slots', 'n_nodes', 'n_orders_generated',
+                 'num_picks', 'volume', 'n_orders', 'n_picks', 'n_used_nodes', 'dist_load_seconds',
+                 'orders_load_seconds', 'build_seconds', 'solve_seconds', 'objective', 'mip_gap',
+                 'status', 'num_vars', 'num_constrs', 'lazy_cuts', 'user_cuts', 'peak_rss_mb', 'error']
+
+
+def generate_layout(aisles, slots, slot_length=1300, aisle_width=4000, prefix='F'):
+    """Distances of a synthetic rectangular warehouse.
+
+    The aisles are parallel, with a cross aisle in front of and behind them. Locations are named
+    prefix-aisle-slot as in the real warehouse, eg. F-03-19, with aisles 1, ..., aisles and slots
+    0, ..., slots-1. A walk between two aisles goes around the front or the back, whichever is
+    shorter. NAME_START_NODE and NAME_END_NODE are always nodes: if the grid does not have them,
+    they are added in the front cross aisle of the last aisle.
+
+    Args:
+                   aisles (int): number of aisles.
+                    slots (int): number of slots per aisle.
+        slot_length (int, optional): distance between neighbouring slots in mm, default is 1300.
+        aisle_width (int, optional): distance between neighbouring aisles in mm, default is 4000.
+         prefix (str, optional): prefix of the location names, default is 'F'.
+
+    Returns:
+        dist (:obj: `DistanceMatrix`): distances in mm between all locations.
+
+    Example:
+    >>> dist = generate_layout(20, 29)
+    >>> len(dist), dist['F-20-28']['F-20-27']
+    (580, 1300)
+    """
+    nodes = []
+    x, y = [], []
+    for aisle in range(1, aisles + 1):
+        for slot in range(slots):
+            nodes.append(prefix + '-' + str(aisle).zfill(2) + '-' + str(slot).zfill(2))
+            x.append((aisle - 1) * aisle_width)
+            y.append((slot + 1) * slot_length)
+    for depot in (NAME_START_NODE, NAME_END_NODE):
+        if depot not in nodes:
+            nodes.append(depot)
+            x.append((aisles - 1) * aisle_width)
+            y.append(0)
+
+    x, y = np.array(x, dtype=np.int64), np.array(y, dtype=np.int64)
+    length = (slots + 1) * slot_length # position of the back cross aisle
+    same_aisle = x[:, None] == x[None, :]
+    around = np.minimum(y[:, None] + y[None, :], 2 * length - y[:, None] - y[None, :])
+    array = np.where(same_aisle, np.abs(y[:, None] - y[None, :]), np.abs(x[:, None] - x[None, :]) + around)
+    return DistanceMatrix(nodes, array.astype(DistanceMatrix.DTYPE))
+
+
+def write_distances(dist, data_file):
+    """Writes the distances as a csv in the format of ../data/dist.csv, which
+    Warehouse.read_distances can read."""
+    with open(data_file, 'w', newline='') as the_file:
+        writer = csv.writer(the_file, delimiter=';', lineterminator='\r\n')
+        writer.writerow([''] + dist.nodes)
+        for node, row in zip(dist.nodes, np.asarray(dist.array)):
+            writer.writerow([node] + row.tolist())
+
+
+def generate_orders(dist, n_orders, data_file, sizes=None, skew=1.0, orders_per_hour=300, seed=None,
+                    start=datetime(2017, 7, 1, 6, 0)):
+    """Writes a synthetic stream of orders as a csv in the format of ../data/example.csv.
+
+    The number of picks of an order is drawn from sizes. Locations are drawn without
+    replacement within an order, with popularity falling as 1 / rank^skew over a random
+    ranking of the locations, so a few locations get most of the picks. Orders are created
+    at random times, orders_per_hour on average, from start on. The historical columns
+    (picking times, Batch, Reihenfolge, ...) are filled in with plausible values.
+
+    Args:
+         dist (:obj: `DistanceMatrix`): the layout, eg. from generate_layout.
+                        n_orders (int): number of orders.
+                    data_file (string): name of the csv to write.
+        sizes (:obj: `dict`, optional): key: number of picks (int) and item: weight (float),
+                                        default is ORDER_SIZES.
+               skew (float, optional): skew of the location popularity, 0 is uniform. Default is 1.
+       orders_per_hour (int, optional): mean rate of new orders, default is 300.
+                  seed (int, optional): seed of the random number generator.
+        start (:obj: `datetime`, optional): creation time of the first order.
+
+    Returns:
+        n_picks (int): number of picks written.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = sizes if sizes is not None else ORDER_SIZES
+    size_values = np.array(list(sizes))
+    size_weights = np.array([sizes[size] for size in size_values], dtype=float)
+    locations = [node for node in dist.nodes if node not in (NAME_START_NODE, NAME_END_NODE)]
+    popularity = 1.0 / np.arange(1, len(locations) + 1) ** skew
+    popularity = rng.permutation(popularity) / popularity.sum()
+
+    order_sizes = rng.choice(size_values, size=n_orders, p=size_weights / size_weights.sum())
+    created = start + np.cumsum(rng.exponential(3600.0 / orders_per_hour, size=n_orders)) * timedelta(seconds=1)
+    n_picks = 0
+    with open(data_file, 'w', newline='') as the_file:
+        writer = csv.writer(the_file, delimiter=';', lineterminator='\r\n')
+        writer.writerow(ORDERS_HEADER + [''])
+        for order in range(n_orders):
+            size = int(min(order_sizes[order], len(locations)))
+            picked = rng.choice(len(locations), size=size, replace=False, p=popularity)
+            begin = created[order] + timedelta(minutes=int(rng.integers(30, 180)))
+            end = begin + timedelta(minutes=int(rng.integers(5, 60)))
+            for row, location in enumerate(picked.tolist()):
+                writer.writerow([str(order + 1).zfill(6), begin.strftime('%d.%m.%y'), locations[location],
+                                 begin.strftime('%d.%m.%y'), begin.strftime('%H:%M'), end.strftime('%d.%m.%y'),
+                                 end.strftime('%H:%M'), end.strftime('%H:%M'), str(1000 + order // 6),
+                                 str(row + 1), str(1000 + order % 10), str(n_picks + 10).zfill(6),
+                                 str(order % 6 + 1), created[order].strftime('%d.%m.%y'),
+                                 created[order].strftime('%H:%M'), ''])
+                n_picks += 1
+    return n_picks
+
+
+def run_benchmark(layouts, n_orders, num_picks=(None,), volumes=(6,), solvers=('model',), time_limit=60.0,
+                  data_dir='results/benchmark_data', seed=0, label=''):
+    """Sweeps layouts, orders, picks and volumes and measures every step of every solver.
+
+    Every run is done in a fresh process, so the peak memory is the one of that run only.
+    A run that fails, eg. because gurobipy is missing or its license is too small, is recorded
+    with its error.
+
+    Args:
+        layouts (:obj: `list`): (aisles, slots) tuples, see generate_layout.
+        n_orders (:obj: `list`): numbers of orders to generate.
+        num_picks (:obj: `list`, optional): numbers of picks to read, see read_orders; None reads all.
+          volumes (:obj: `list`, optional): values of VOL.
+          solvers (:obj: `list`, optional): 'model', 'set_partitioning', 'alns' or 'heuristic'.
+           time_limit (float, optional): seconds per solve.
+             data_dir (string, optional): directory for the generated csv files.
+                  seed (int, optional): seed of the order generator.
+                  label (str, optional): stored with every result, eg. a branch name.
+
+    Returns:
+        results (:obj: `list`): one dict per run, with the keys of RESULT_FIELDS.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    results = []
+    for aisles, slots in layouts:
+        dist = generate_layout(aisles, slots)
+        dist_file = os.path.join(data_dir, 'dist_' + str(aisles) + 'x' + str(slots) + '.csv')
+        write_distances(dist, dist_file)
+        for n in n_orders:
+            orders_file = os.path.join(data_dir, 'orders_' + str(aisles) + 'x' + str(slots) + '_'
+                                       + str(n) + '_' + str(seed) + '.csv')
+            generate_orders(dist, n, orders_file, seed=seed)
+            for picks, volume, solver in itertools.product(num_picks, volumes, solvers):
+                result = {'timestamp': timestamp, 'label': label, 'solver': solver, 'aisles': aisles,
+                          'slots': slots, 'n_nodes': len(dist), 'n_orders_generated': n,
+                          'num_picks': picks, 'volume': volume}
+                # a new process per run, spawned so it does not inherit the memory of this one
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                    result.update(executor.submit(_run, dist_file, orders_file, picks, volume,
+                                                  solver, time_limit).result())
+                results.append(result)
+    return results
+
+
+def _run(dist_file, orders_file, num_picks, volume, solver, time_limit):
+    """Loads, builds and solves one instance, see run_benchmark. Runs in its own process."""
+    result = dict()
+    try:
+        start = time.perf_counter()
+        dist = Warehouse().read_distances(dist_file, cache=False)
+        result['dist_load_seconds'] = time.perf_counter() - start
+        start = time.perf_counter()
+        orders = read_orders(orders_file, num_picks=num_picks)
+        result['orders_load_seconds'] = time.perf_counter() - start
+        result['n_orders'] = len(orders)
+        result['n_picks'] = sum(order.num_picks() for order in orders.values())
+        result['n_used_nodes'] = len(set(node for order in orders.values() for node in order.locations()))
+
+        if solver in ('model', 'set_partitioning'):
+            start = time.perf_counter()
+            if solver == 'model':
+                from model import Model
+                model = Model(dist, orders, volume=volume)
+            else:
+                from set_partitioning import SetPartitioningModel
+                model = SetPartitioningModel(dist, orders, volume=volume)
+            result['build_seconds'] = time.perf_counter() - start
+            model.Params.OutputFlag = 0
+            model.Params.TimeLimit = time_limit
+            start = time.perf_counter()
+            if solver == 'model':
+                model.optimize()
+                result['lazy_cuts'] = model.separation_stats()['lazy_cuts']
+                result['user_cuts'] = model.separation_stats()['user_cuts']
+            else:
+                model.optimize(time_limit=time_limit)
+            result['solve_seconds'] = time.perf_counter() - start
+            result['status'] = model.Status
+            result['num_vars'] = model.NumVars
+            result['num_constrs'] = model.NumConstrs
+            if model.SolCount > 0:
+                result['objective'] = model.ObjVal
+                result['mip_gap'] = model.MIPGap
+        else:
+            start = time.perf_counter()
+            if solver == 'alns':
+                import alns
+                batches = alns.solve(dist, orders, volume=volume, time_limit=time_limit)
+            else:
+                from heuristic import construct_batches
+                batches = construct_batches(dist, orders, volume=volume)
+            result['solve_seconds'] = time.perf_counter() - start
+            result['objective'] = sum(batch.distance for batch in batches)
+    except Exception as error:
+        result['error'] = type(error).__name__ + ': ' + str(error)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def write_results(results, json_file=None, csv_file=None):
+    """Writes the results of run_benchmark. The csv is appended to, so it keeps the history
+    of all benchmark runs; the json holds the results of this run."""
+    if json_file is not None:
+        with open(json_file, 'w') as the_file:
+            json.dump(results, the_file, indent=2)
+    if csv_file is not None:
+        new_file = not os.path.exists(csv_file)
+        with open(csv_file, 'a', newline='') as the_file:
+            writer = csv.DictWriter(the_file, fieldnames=RESULT_FIELDS)
+            if new_file:
+                writer.writeheader()
+            for result in results:
+                writer.writerow({field: result.get(field) for field in RESULT_FIELDS})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the readers, the model build and the solvers "
+                                                 "on synthetic warehouses.")
+    parser.add_argument('--aisles', type=int, nargs='+', default=[10, 20], help="numbers of aisles")
+    parser.add_argument('--slots', type=int, nargs='+', default=[29], help="numbers of slots per aisle")
+    parser.add_argument('--orders', type=int, nargs='+', default=[10, 20], help="numbers of orders to generate")
+    parser.add_argument('--picks', type=int, nargs='+', default=[None], help="numbers of picks to read")
+    parser.add_argument('--volume', type=int, nargs='+', default=[6], help="values of VOL")
+    parser.add_argument('--solver', nargs='+', default=['model'],
+                        choices=['model', 'set_partitioning', 'alns', 'heuristic'])
+    parser.add_argument('--time-limit', type=float, default=60.0, help="seconds per solve")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', default='', help="stored with every result, eg. a branch name")
+    parser.add_argument('--out', default='results/benchmark', help="results are written to OUT.json and OUT.csv")
+    args = parser.parse_args()
+
+    layouts = list(itertools.product(args.aisles, args.slots))
+    results = run_benchmark(layouts, args.orders, num_picks=args.picks, volumes=args.volume,
+                            solvers=args.solver, time_limit=args.time_limit,
+                            data_dir=args.out + '_data', seed=args.seed, label=args.label)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    write_results(results, json_file=args.out + '.json', csv_file=args.out + '.csv')
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
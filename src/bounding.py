@@ -0,0 +1,194 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from decomposition import split_orders
+from heuristic import BatchingInstance, construct_batches, route_length
+from infrastructure import Warehouse, read_orders
+from routing import _parse_locations, held_karp
+
+
+def lower_bound(dist, orders, volume=6, exact_limit=6):
+    """Valid lower bound on the total walking distance of any plan of the orders, without gurobipy.
+
+    Every batch is a route from NAME_START_NODE to NAME_END_NODE and back, as in the Model
+    objective, so with the distances being shortest paths:
+    - a batch is at least as long as the shortest route of any of its orders (order bound), which
+      is exact for orders with at most exact_limit locations. For larger orders it is the best of
+      the exact route through the outermost location of every end of every aisle visited (aisle
+      visits), limited to the exact_limit farthest, and the minimum spanning tree of its locations.
+    - with at most volume orders per batch, the j-th longest batch is at least as long as the
+      (j-1)*volume+1-th largest order bound, so the sum of every volume-th order bound, largest
+      first, bounds the plan (batches bound). It needs at least ceil(orders / volume) batches.
+    - the routes of all batches, without their way back, connect all locations, so the plan is
+      at least the minimum spanning tree of all locations plus the way back of every batch
+      (spanning tree bound).
+
+    Args:
+        dist (:obj: `DistanceMatrix` or `dict`): distances, eg dist['node_id_i']['node_id_j'].
+                       orders (:obj: `dict`): Dict of all orders.
+                                              key: order_id (str) and item: infrastructure.Order
+                     volume (int, optional): Maximum number of orders in a batch, default is 6.
+                exact_limit (int, optional): orders with at most this many locations are routed
+                                             exactly, default is 6.
+
+    Returns:
+                   bound (int): the largest of the bounds, in mm.
+        parts (:obj: `dict`): 'min_batches' (int), 'batches' and 'spanning_tree' (int) bounds and
+                              'seconds' (float).
+
+    Example:
+    >>> bound, parts = lower_bound(dist, read_orders("../data/example.csv"), volume=6)
+    >>> bound, parts['min_batches']
+    (155800, 1)
+    """
+    start_time = time.perf_counter()
+    instance = BatchingInstance.from_orders(dist, orders)
+    start, end = instance.START, instance.END
+    back = int(instance.distances[end, start])
+    n_orders = len(instance.order_ids)
+    min_batches = -(-n_orders // volume)
+
+    bounds = order_bounds(instance, exact_limit=exact_limit)
+    batches_bound = grouped_bound(bounds, volume)
+    tree_bound = 0
+    if n_orders > 0:
+        tree_bound = spanning_tree_length(instance.distances) + min_batches * back
+
+    parts = {'min_batches': min_batches, 'batches': batches_bound, 'spanning_tree': tree_bound,
+             'seconds': time.perf_counter() - start_time}
+    return max(batches_bound, tree_bound), parts
+
+
+def order_bounds(instance, exact_limit=6):
+    """Returns the lower bound on the route of every order of a heuristic.BatchingInstance, see
+    lower_bound, as an int64 ndarray indexed as instance.order_ids. Orders with the same
+    locations are bounded once."""
+    bounds = np.zeros(len(instance.order_ids), dtype=np.int64)
+    known = dict()
+    for o, nodes_o in enumerate(instance.order_nodes):
+        key = tuple(nodes_o.tolist())
+        if key not in known:
+            known[key] = route_bound(instance.distances, key, instance.START, instance.END,
+                                     exact_limit=exact_limit, names=instance.nodes)
+        bounds[o] = known[key]
+    return bounds
+
+
+def route_bound(distances, nodes, start, end, exact_limit=6, names=None):
+    """Lower bound on the route from start through all nodes to end, plus the way back from end
+    to start, as heuristic.route_length counts it.
+
+    Args:
+        distances (:obj: `ndarray`): distances[i, j] between node i and node j, shortest paths.
+              nodes (:obj: `list`): node indices to visit, without start and end.
+                  start, end (int): start and end node.
+        exact_limit (int, optional): at most this many nodes are routed exactly, default is 6.
+        names (:obj: `list`, optional): node ids (str) as F-aisle-slot, to choose the nodes of the
+                                        exact route of larger sets by aisle.
+
+    Returns:
+        bound (int): the exact length for at most exact_limit nodes, else a lower bound.
+    """
+    nodes = [node for node in nodes if node != start and node != end]
+    if len(nodes) <= exact_limit:
+        return route_length(distances, held_karp(distances, nodes, start, end))
+
+    # skipping nodes never makes a route longer, so a route through some of the nodes is a bound
+    subset = _outermost(distances, nodes, start, end, exact_limit, names)
+    exact = route_length(distances, held_karp(distances, subset, start, end))
+    everything = [start, end] + nodes
+    tree = spanning_tree_length(distances[np.ix_(everything, everything)]) + int(distances[end, start])
+    return max(exact, tree)
+
+
+def _outermost(distances, nodes, start, end, limit, names):
+    """At most limit of nodes for an exact route: the lowest and highest slot of every aisle if
+    names are location codes, then those farthest from start and end first."""
+    candidates = nodes
+    aisles = _parse_locations([names[node] for node in nodes]) if names is not None else None
+    if aisles is not None:
+        candidates = list(dict.fromkeys(nodes[i] for slots in aisles.values() for i in (min(slots)[1], max(slots)[1])))
+    candidates = np.asarray(candidates, dtype=np.intp)
+    detour = distances[start, candidates] + distances[candidates, end]
+    return candidates[np.argsort(-detour, kind='stable')[:limit]].tolist()
+
+
+def grouped_bound(bounds, volume):
+    """Returns the smallest possible sum of the largest bound of every batch, when bounds are
+    grouped into batches of at most volume: the sum of every volume-th bound, largest first."""
+    return int(np.sort(np.asarray(bounds, dtype=np.int64))[::-1][::volume].sum())
+
+
+def spanning_tree_length(distances):
+    """Returns the length (int) of a minimum spanning tree of all nodes of the symmetric distances,
+    with Prim's algorithm on the dense matrix."""
+    n_nodes = len(distances)
+    if n_nodes <= 1:
+        return 0
+    distances = np.asarray(distances, dtype=np.int64)
+    in_tree = np.zeros(n_nodes, dtype=bool)
+    in_tree[0] = True
+    closest = distances[0].astype(float)
+    total = 0
+    for _ in range(n_nodes - 1):
+        closest[in_tree] = np.inf
+        node = int(np.argmin(closest))
+        total += int(closest[node])
+        in_tree[node] = True
+        np.minimum(closest, distances[node], out=closest)
+    return total
+
+
+def certified_gap(distance, bound):
+    """Returns the share (float) by which a plan of the given distance is at most longer than the
+    optimum, given a lower bound, eg. 0.05 for at most 5 percent."""
+    if distance <= 0:
+        return 0.0
+    return max(distance - bound, 0) / distance
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lower bounds on the walking distance of the orders, per "
+                                                 "sub-problem, and the certified gap of a heuristic plan.")
+    parser.add_argument('orders_file', help="orders csv, eg. ../data/example.csv")
+    parser.add_argument('dist_file', help="distances csv, eg. ../data/dist.csv")
+    parser.add_argument('--num-picks', type=int, help="only use the orders of the first picks")
+    parser.add_argument('--volume', type=int, default=6, help="maximum number of orders in a batch")
+    parser.add_argument('--key', default='date', choices=['created', 'date', 'wave'],
+                        help="sub-problems that are batched separately, see decomposition.split_orders")
+    parser.add_argument('--window', type=int, default=60, help="minutes per sub-problem with key created")
+    parser.add_argument('--exact-limit', type=int, default=6, help="orders with at most this many locations "
+                                                                   "are routed exactly")
+    parser.add_argument('--heuristic', action='store_true', help="also plan with heuristic.construct_batches "
+                                                                  "and report its certified gap")
+    args = parser.parse_args()
+
+    dist = Warehouse().read_distances(args.dist_file)
+    orders = read_orders(args.orders_file, num_picks=args.num_picks)
+    total = {'orders': 0, 'bound': 0, 'distance': 0, 'seconds': 0.0}
+    for core, extra in split_orders(orders, key=args.key, window=args.window):
+        window_orders = {order_id: orders[order_id] for order_id in core}
+        bound, parts = lower_bound(dist, window_orders, volume=args.volume, exact_limit=args.exact_limit)
+        report = {'orders': len(core), 'bound': bound}
+        report.update(parts)
+        total['orders'] += len(core)
+        total['bound'] += bound
+        total['seconds'] += parts['seconds']
+        if args.heuristic:
+            distance = sum(batch.distance for batch in construct_batches(dist, window_orders, volume=args.volume))
+            report['distance'] = distance
+            report['gap'] = certified_gap(distance, bound)
+            total['distance'] += distance
+        print(json.dumps(report))
+    if args.heuristic:
+        total['gap'] = certified_gap(total['distance'], total['bound'])
+    else:
+        del total['distance']
+    print(json.dumps(total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import alns
+from heuristic import construct_batches
+from infrastructure import DATETIME_FORMAT, Batch, Warehouse, read_orders
+from routing import RoutingOracle
+
+
+DATE_FORMAT = '%d.%m.%y'
+
+# distances of a worker process, a memory map of the binary cache of the distance csv
+_worker_dist = None
+
+
+def split_orders(orders, key='created', window=60, overlap=0, max_orders=None):
+    """Splits the orders into sub-problems that can be batched independently.
+
+    With key 'created', the orders are cut into consecutive windows of window minutes of their
+    creation time (Erstellt am/um). With key 'date' (Datum) or 'wave' (the historical Batch
+    column), every value is its own sub-problem and window and overlap are ignored. Orders
+    without Erstellt am/um are taken as created at the start of their Datum (see _created);
+    orders with neither form the last window, which gets no overlap.
+
+    Args:
+        orders (:obj: `dict`): Dict of all orders.
+                               key: order_id (str) and item: infrastructure.Order
+           key (str, optional): 'created', 'date' or 'wave', default is 'created'.
+        window (int, optional): length of a window in minutes, default is 60.
+        overlap (int, optional): minutes of the next window that are also given to a window, so
+                                 orders released close to a boundary can be batched with the
+                                 orders before it. Default is 0.
+        max_orders (int, optional): windows with more orders are cut into chunks of max_orders
+                                    orders, in order of creation.
+
+    Returns:
+        windows (:obj: `list`): list of (core, extra) tuples, both lists of order ids. Every order
+                                is in exactly one core; extra holds the overlap orders, which are
+                                also the core orders of a later window.
+
+    Example:
+    >>> windows = split_orders(read_orders("../data/example.csv"), window=60)
+    >>> windows
+    [(['000001'], []), (['000002'], [])]
+    """
+    created = {order_id: _created(order) for order_id, order in orders.items()}
+    # orders without a creation time come last
+    by_creation = sorted(orders, key=lambda order_id: (created[order_id] is None,
+                                                       created[order_id] or datetime.min))
+    unknown = [order_id for order_id in by_creation if created[order_id] is None]
+
+    if key == 'created':
+        groups = []
+        timed = by_creation[:(len(by_creation) - len(unknown))]
+        if len(timed) > 0:
+            window_start = created[timed[0]]
+            current = []
+            for order_id in timed:
+                while created[order_id] >= window_start + timedelta(minutes=window):
+                    groups.append((window_start, current))
+                    window_start += timedelta(minutes=window)
+                    current = []
+                current.append(order_id)
+            groups.append((window_start, current))
+            groups = [(window_start, group) for window_start, group in groups if len(group) > 0]
+        if len(unknown) > 0:
+            groups.append((None, unknown))
+    elif key in ('date', 'wave'):
+        values = dict()
+        for order_id in by_creation:
+            pick = orders[order_id].picks[0]
+            values.setdefault(pick._date if key == 'date' else pick._batch, []).append(order_id)
+        groups = [(None, group) for group in values.values()]
+        overlap = 0
+    else:
+        raise ValueError("key must be 'created', 'date' or 'wave', not " + repr(key))
+
+    if max_orders is not None:
+        groups = [(window_start, group[i:(i + max_orders)]) for window_start, group in groups
+                  for i in range(0, len(group), max_orders)]
+
+    windows = []
+    for g, (window_start, group) in enumerate(groups):
+        extra = []
+        if overlap > 0 and window_start is not None:
+            window_end = created[group[-1]] + timedelta(minutes=overlap)
+            for later_start, later in groups[(g + 1):]:
+                if later_start is None:
+                    break
+                extra.extend(order_id for order_id in later if created[order_id] < window_end)
+                if len(later) > 0 and created[later[-1]] >= window_end:
+                    break
+        windows.append((group, extra))
+    return windows
+
+
+def solve(dist_file, orders, volume=6, solver='alns', time_limit=5.0, key='created', window=60,
+          overlap=0, max_orders=None, repair=True, repair_time=1.0, repair_margin=10,
+          max_workers=None, seed=None):
+    """Batches the orders window by window, solving the windows in parallel processes.
+
+    Every worker memory-maps the binary cache of dist_file (see Warehouse.read_distances), so all
+    processes share one copy of the distance matrix. The batches of the windows are stitched in
+    time order: an overlap order that was already batched by an earlier window is removed from
+    the later batch, which is then routed again. With repair, the batches with room on both sides
+    of every window boundary that hold an order created within the boundary interval are batched
+    again together, also in the workers, and kept if that is shorter. The boundary interval runs
+    from the last creation time of the earlier window to the first of the later window, widened
+    by the larger of overlap and repair_margin minutes.
+
+    Args:
+                   dist_file (string): name of the distances csv.
+                 orders (:obj: `dict`): Dict of all orders.
+                                        key: order_id (str) and item: infrastructure.Order
+               volume (int, optional): Maximum number of orders in a batch, default is 6.
+               solver (str, optional): 'alns' (default), 'heuristic' or 'set_partitioning'.
+         time_limit (float, optional): seconds of alns search per window.
+     key, window, overlap, max_orders: how the orders are split, see split_orders.
+              repair (bool, optional): repair the plan across window boundaries, default is True.
+        repair_time (float, optional): seconds of alns search per boundary.
+        repair_margin (int, optional): minutes the boundary interval is widened by, default is 10.
+          max_workers (int, optional): number of processes, default is the number of cores.
+                 seed (int, optional): seed of the random number generators.
+
+    Returns:
+        batches (:obj: `list`): list of infrastructure.Batch, with orders, route and distance set.
+          stats (:obj: `dict`): 'windows', 'workers', 'solve_seconds', 'stitched' (batches routed
+                                again), 'repaired' (boundaries improved), 'repair_orders' (orders
+                                batched again at the boundaries) and 'seconds'.
+    """
+    start = time.perf_counter()
+    dist = Warehouse().read_distances(dist_file) # writes the binary cache the workers map
+    windows = split_orders(orders, key=key, window=window, overlap=overlap, max_orders=max_orders)
+    max_workers = max_workers or os.cpu_count()
+    stats = {'windows': len(windows), 'workers': max_workers, 'solve_seconds': 0.0,
+             'stitched': 0, 'repaired': 0, 'repair_orders': 0, 'seconds': 0.0}
+
+    # the largest windows first, so no worker is left with a large window at the end
+    jobs = sorted(range(len(windows)), key=lambda w: -(len(windows[w][0]) + len(windows[w][1])))
+    results = [None] * len(windows)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(dist_file,)) as executor:
+        futures = dict()
+        for w in jobs:
+            core, extra = windows[w]
+            window_orders = {order_id: orders[order_id] for order_id in core + extra}
+            window_seed = None if seed is None else seed + w
+            futures[w] = executor.submit(_solve_window, window_orders, volume, solver, time_limit, window_seed)
+        for w, future in futures.items():
+            results[w] = future.result()
+        stats['solve_seconds'] = time.perf_counter() - start
+
+        oracle = RoutingOracle(dist)
+        plans = [] # the stitched batches of every window
+        assigned = set()
+        for window_batches in results:
+            plan = []
+            for batch in window_batches:
+                kept = [order_id for order_id in batch.orders if order_id not in assigned]
+                if len(kept) == 0:
+                    continue
+                if len(kept) < len(batch.orders):
+                    batch = _route_batch(oracle, orders, kept)
+                    stats['stitched'] += 1
+                assigned.update(kept)
+                plan.append(batch)
+            plans.append(plan)
+
+        if repair:
+            created = {order_id: _created(order) for order_id, order in orders.items()}
+            margin = timedelta(minutes=max(overlap, repair_margin))
+            # boundaries (0, 1), (2, 3), ... share no window, so they are repaired in parallel,
+            # then the boundaries (1, 2), (3, 4), ...
+            for first in (0, 1):
+                futures = dict()
+                boundary = dict()
+                for w in range(first + 1, len(plans), 2):
+                    interval = _boundary_interval(created, windows[w-1][0], windows[w][0], margin)
+                    if interval is None:
+                        continue
+                    before = _boundary_batches(plans[w-1], created, interval, volume)
+                    after = _boundary_batches(plans[w], created, interval, volume)
+                    if len(before) > 0 and len(after) > 0:
+                        boundary[w] = before, after
+                        boundary_orders = {order_id: orders[order_id] for batch in before + after
+                                           for order_id in batch.orders}
+                        stats['repair_orders'] += len(boundary_orders)
+                        futures[w] = executor.submit(_solve_window, boundary_orders, volume, 'alns',
+                                                     repair_time, seed)
+                for w, future in futures.items():
+                    batches = future.result()
+                    before, after = boundary[w]
+                    if sum(batch.distance for batch in batches) < sum(batch.distance for batch in before + after):
+                        # the repaired batches are put in the later window
+                        replaced = {id(batch) for batch in before + after}
+                        plans[w-1] = [batch for batch in plans[w-1] if id(batch) not in replaced]
+                        plans[w] = [batch for batch in plans[w] if id(batch) not in replaced] + batches
+                        stats['repaired'] += 1
+
+    plan = [batch for window_plan in plans for batch in window_plan]
+    for batch in plan:
+        batch.picks = [pick for order_id in batch.orders for pick in orders[order_id].picks]
+    stats['seconds'] = time.perf_counter() - start
+    return plan, stats
+
+
+def _boundary_interval(created, before, after, margin):
+    """Returns the (first, last) creation times around the boundary between the core orders
+    before and after, widened by margin, or None if either side has no creation times."""
+    last_before = max((created[order_id] for order_id in before if created[order_id] is not None), default=None)
+    first_after = min((created[order_id] for order_id in after if created[order_id] is not None), default=None)
+    if last_before is None or first_after is None:
+        return None
+    return min(last_before, first_after) - margin, max(last_before, first_after) + margin
+
+
+def _boundary_batches(plan, created, interval, volume):
+    """Returns the batches of plan with room for another order and an order created in interval."""
+    first, last = interval
+    return [batch for batch in plan if len(batch.orders) < volume
+            and any(created[order_id] is not None and first <= created[order_id] <= last
+                    for order_id in batch.orders)]
+
+
+def _init_worker(dist_file):
+    """Initializer of the worker processes, maps the distance matrix once per process."""
+    global _worker_dist
+    _worker_dist = Warehouse().read_distances(dist_file)
+
+
+def _solve_window(orders, volume, solver, time_limit, seed):
+    """Batches the orders of one window in a worker process. The batches are returned
+    without their picks, which the parent already has."""
+    if solver == 'alns':
+        batches = alns.solve(_worker_dist, orders, volume=volume, time_limit=time_limit, seed=seed)
+    elif solver == 'heuristic':
+        batches = construct_batches(_worker_dist, orders, volume=volume)
+    elif solver == 'set_partitioning':
+        from set_partitioning import SetPartitioningModel # needs gurobipy
+        model = SetPartitioningModel(_worker_dist, orders, volume=volume)
+        model.Params.OutputFlag = 0
+        model.optimize(time_limit=time_limit)
+        batches = model.batches()
+    else:
+        raise ValueError("unknown solver " + repr(solver))
+    for batch in batches:
+        batch.picks = []
+    return batches
+
+
+def _route_batch(oracle, orders, order_ids):
+    """Returns the orders as one infrastructure.Batch, routed with the oracle."""
+    nodes = set()
+    for order_id in order_ids:
+        nodes.update(orders[order_id].locations())
+    distance, route = oracle.route(nodes)
+    return Batch(orders=order_ids, route=route, distance=distance)
+
+
+def _created(order):
+    """Returns the creation time (datetime) of an order, shared by all its picks.
+
+    Orders without Erstellt am/um (not read or empty) are created at the start of their Datum;
+    without a Datum either, None is returned.
+    """
+    pick = order.picks[0]
+    if pick._created_on and pick._created_at:
+        return datetime.strptime(pick._created_on + ' ' + pick._created_at, DATETIME_FORMAT)
+    if pick._date:
+        return datetime.strptime(pick._date, DATE_FORMAT)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch the orders window by window on all cores.")
+    parser.add_argument('orders_file', help="orders csv, eg. ../data/example.csv")
+    parser.add_argument('dist_file', help="distances csv, eg. ../data/dist.csv")
+    parser.add_argument('--volume', type=int, default=6, help="maximum number of orders in a batch")
+    parser.add_argument('--solver', default='alns', choices=['alns', 'heuristic', 'set_partitioning'])
+    parser.add_argument('--time-limit', type=float, default=5.0, help="seconds of search per window")
+    parser.add_argument('--key', default='created', choices=['created', 'date', 'wave'])
+    parser.add_argument('--window', type=int, default=60, help="minutes per window")
+    parser.add_argument('--overlap', type=int, default=0, help="minutes of overlap between windows")
+    parser.add_argument('--max-orders', type=int, help="maximum number of orders per window")
+    parser.add_argument('--no-repair', action='store_true', help="do not repair across windows")
+    parser.add_argument('--repair-margin', type=int, default=10,
+                        help="minutes around a window boundary whose batches are repaired")
+    parser.add_argument('--workers', type=int, help="number of processes, default is the number of cores")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    orders = read_orders(args.orders_file)
+    batches, stats = solve(args.dist_file, orders, volume=args.volume, solver=args.solver,
+                           time_limit=args.time_limit, key=args.key, window=args.window,
+                           overlap=args.overlap, max_orders=args.max_orders, repair=not args.no_repair,
+                           repair_margin=args.repair_margin, max_workers=args.workers, seed=args.seed)
+    print("Number of orders: " + str(len(orders)))
+    print("Number of batches: " + str(len(batches)))
+    print("Total distance: " + str(sum(batch.distance for batch in batches)))
+    print("Decomposition: " + str(stats))
+
+
+if __name__ == '__main__':
+    main()
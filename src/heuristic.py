@@ -0,0 +1,264 @@
+import numpy as np
+
+from infrastructure import NAME_START_NODE, NAME_END_NODE, Batch, distance_submatrix
+
+
+def construct_batches(dist, orders, volume=6):
+    """Constructive heuristic for the batching problem, which does not need gurobipy.
+
+    Orders are batched with seed_batches and every batch is routed with nearest neighbour
+    and 2-opt, from NAME_START_NODE to NAME_END_NODE.
+
+    Args:
+        dist (:obj: `DistanceMatrix` or `dict`): distances, eg dist['node_id_i']['node_id_j'].
+                       orders (:obj: `dict`): Dict of all orders.
+                                              key: order_id (str) and item: infrastructure.Order
+                     volume (int, optional): Maximum number of orders in a batch, default is 6.
+
+    Returns:
+        batches (:obj: `list`): list of infrastructure.Batch, with orders, route and distance set.
+
+    Example:
+    >>> batches = construct_batches(dist, orders, volume=6)
+    >>> sum(batch.distance for batch in batches) # total walking distance
+    189400
+    """
+    instance = BatchingInstance.from_orders(dist, orders)
+    return [instance.to_batch(batch, orders) for batch in instance.construct(volume)]
+
+
+def chunked_batches(dist, orders, volume=6, chunk_size=None):
+    """Constructive heuristic like construct_batches, in linear time in the number of orders.
+
+    The orders are sorted by their position in the warehouse, see BatchingInstance.order_positions,
+    and seed_batches batches consecutive chunks of them. The plan is usually somewhat longer than
+    the one of construct_batches, whose time grows quadratically with the number of orders.
+
+    Args:
+        dist, orders, volume: see construct_batches.
+          chunk_size (int, optional): number of orders per chunk, default is 20 * volume.
+
+    Returns:
+        batches (:obj: `list`): list of infrastructure.Batch, with orders, route and distance set.
+    """
+    instance = BatchingInstance.from_orders(dist, orders)
+    return [instance.to_batch(batch, orders) for batch in instance.construct_chunked(volume, chunk_size)]
+
+
+class BatchingInstance:
+    """Orders and distances of a batching problem, indexed by integers.
+
+    Attributes:
+               nodes (:obj: `list`): node ids (str), nodes[START] is NAME_START_NODE and
+                                     nodes[END] is NAME_END_NODE.
+        distances (:obj: `ndarray`): distances[i, j] between node i and node j.
+           order_ids (:obj: `list`): order ids (str), orders are indexed by their position.
+         order_nodes (:obj: `list`): order_nodes[o] is an ndarray of the distinct nodes of order o.
+    """
+
+    START = 0
+    END = 1
+
+    def __init__(self, nodes, distances, order_ids, order_nodes):
+        self.nodes = list(nodes)
+        self.distances = np.asarray(distances, dtype=np.int64)
+        self.order_ids = list(order_ids)
+        self.order_nodes = [np.asarray(nodes_o, dtype=np.intp) for nodes_o in order_nodes]
+
+    @classmethod
+    def from_orders(cls, dist, orders):
+        """Builds the instance from the dict of orders and the distances of the warehouse."""
+        nodes = [NAME_START_NODE, NAME_END_NODE]
+        node_index = {NAME_START_NODE: 0, NAME_END_NODE: 1}
+        order_nodes = []
+        for order in orders.values():
+            nodes_o = []
+            for pick in order.picks:
+                node = pick._warehouse_location
+                if node not in node_index:
+                    node_index[node] = len(nodes)
+                    nodes.append(node)
+                nodes_o.append(node_index[node])
+            order_nodes.append(sorted(set(nodes_o)))
+        return cls(nodes, distance_submatrix(dist, nodes), list(orders), order_nodes)
+
+    def construct(self, volume):
+        """Returns the batches of seed_batches, as lists of order indices."""
+        return seed_batches(self.distances, self.order_nodes, volume, self.START, self.END)
+
+    def construct_chunked(self, volume, chunk_size=None):
+        """Returns the batches of seed_batches on consecutive chunks of chunk_size orders, default
+        20 * volume, sorted by order_positions, as lists of order indices."""
+        chunk_size = chunk_size or 20 * volume
+        sorted_orders = np.argsort(self.order_positions(), kind='stable')
+        batches = []
+        for first in range(0, len(sorted_orders), chunk_size):
+            chunk = sorted_orders[first:(first+chunk_size)]
+            batches.extend([int(chunk[o]) for o in batch] for batch in
+                           seed_batches(self.distances, [self.order_nodes[o] for o in chunk], volume,
+                                        self.START, self.END))
+        return batches
+
+    def order_positions(self):
+        """Returns the mean position of the nodes of every order along one nearest neighbour tour
+        through all nodes, as an ndarray. Orders that are close along the tour are close in the
+        warehouse."""
+        tour = nearest_neighbour_route(self.distances, range(len(self.nodes)), self.START, self.END)
+        node_position = np.empty(len(self.nodes))
+        node_position[tour] = np.arange(len(tour))
+        return np.array([node_position[nodes_o].mean() for nodes_o in self.order_nodes])
+
+    def route(self, order_indices):
+        """Routes the nodes of the orders with nearest neighbour and 2-opt.
+
+        Returns:
+            path (:obj: `list`): node indices from START to END.
+                  distance (int): length of the path plus the way back from END to START.
+        """
+        nodes = set()
+        for order in order_indices:
+            nodes.update(self.order_nodes[order].tolist())
+        path = two_opt(self.distances, nearest_neighbour_route(self.distances, nodes, self.START, self.END))
+        return path, route_length(self.distances, path)
+
+    def to_batch(self, order_indices, orders=None):
+        """Routes the orders and returns them as an infrastructure.Batch.
+
+        Args:
+            order_indices (:obj: `list`): indices of the orders in the batch.
+             orders (:obj: `dict`, optional): the orders, to fill in the picks of the batch.
+        """
+        path, distance = self.route(order_indices)
+        batch = Batch(orders=[self.order_ids[order] for order in order_indices],
+                      route=[self.nodes[node] for node in path], distance=distance)
+        if orders is not None:
+            for order_id in batch.orders:
+                batch.picks.extend(orders[order_id].picks)
+        return batch
+
+
+def seed_batches(distances, order_nodes, volume, start, end):
+    """Seed-based order batching.
+
+    Every batch is seeded with the unassigned order that is furthest from the depot. Orders are
+    then added one at a time, choosing the order with the largest saving, ie the order whose
+    nodes are closest to the nodes already in the batch, until the batch holds volume orders.
+
+    Args:
+        distances (:obj: `ndarray`): distances[i, j] between node i and node j.
+        order_nodes (:obj: `list`): order_nodes[o] is an ndarray of the nodes of order o.
+                        volume (int): Maximum number of orders in a batch.
+                  start, end (int): start and end node.
+
+    Returns:
+        batches (:obj: `list`): list of batches, a batch is a list of order indices.
+    """
+    n_orders = len(order_nodes)
+    if n_orders == 0:
+        return []
+    # nodes of all orders in one flat array, order o owns flat[offsets[o]:offsets[o+1]]
+    flat = np.concatenate(order_nodes)
+    offsets = np.r_[0, np.cumsum([len(nodes_o) for nodes_o in order_nodes])][:-1]
+    depot_distance = np.minimum(distances[start], distances[end])
+
+    # the seed is the order whose furthest node is furthest from the depot
+    seed_cost = np.maximum.reduceat(depot_distance[flat], offsets).astype(float)
+    assigned = np.zeros(n_orders, dtype=bool)
+
+    batches = []
+    while not assigned.all():
+        seed = int(np.argmax(np.where(assigned, -np.inf, seed_cost)))
+        batch = [seed]
+        assigned[seed] = True
+        # closest[i] is the distance from node i to the closest node of the batch or the depot
+        closest = np.minimum(depot_distance, distances[:, order_nodes[seed]].min(axis=1))
+        while len(batch) < volume and not assigned.all():
+            added_cost = np.add.reduceat(closest[flat], offsets).astype(float)
+            added_cost[assigned] = np.inf
+            order = int(np.argmin(added_cost))
+            batch.append(order)
+            assigned[order] = True
+            closest = np.minimum(closest, distances[:, order_nodes[order]].min(axis=1))
+        batches.append(batch)
+    return batches
+
+
+def nearest_neighbour_route(distances, nodes, start, end):
+    """Returns a path from start through all nodes to end, always walking to the closest unvisited node.
+
+    Args:
+        distances (:obj: `ndarray`): distances[i, j] between node i and node j.
+            nodes (:obj: `iterable`): nodes to visit; start and end are skipped if included.
+                  start, end (int): start and end node.
+    """
+    unvisited = [node for node in set(nodes) if node != start and node != end]
+    path = [start]
+    while unvisited:
+        current = path[-1]
+        closest = int(np.argmin(distances[current, unvisited]))
+        path.append(unvisited.pop(closest))
+    path.append(end)
+    return path
+
+
+def cheapest_insertion(distances, route, nodes):
+    """Inserts the nodes that are not on the route, one at a time, where they add the least length.
+
+    Args:
+        distances (:obj: `ndarray`): distances[i, j] between node i and node j.
+               route (:obj: `list`): node indices from START to END.
+                nodes (:obj: `set`): nodes to visit.
+
+    Returns:
+               delta (int): added length.
+        route (:obj: `list`): the route with the nodes inserted.
+    """
+    route = list(route)
+    on_route = set(route)
+    delta = 0
+    for node in nodes:
+        if node in on_route:
+            continue
+        path = np.asarray(route, dtype=np.intp)
+        added = distances[path[:-1], node] + distances[node, path[1:]] - distances[path[:-1], path[1:]]
+        position = int(np.argmin(added))
+        delta += int(added[position])
+        route.insert(position + 1, node)
+        on_route.add(node)
+    return delta, route
+
+
+def two_opt(distances, path):
+    """Improves a path with 2-opt moves, keeping its first and last node fixed.
+
+    A move reverses path[i:j]; for every i the best j is found with one vectorised
+    delta computation. Moves are applied until no move shortens the path.
+
+    Args:
+        distances (:obj: `ndarray`): distances[i, j] between node i and node j, symmetric.
+             path (:obj: `list`): node indices.
+
+    Returns:
+        path (:obj: `list`): the improved path.
+    """
+    path = np.array(path, dtype=np.intp)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 2):
+            a, b = path[i-1], path[i]
+            # reversing path[i:j] replaces edges (a, b) and (path[j-1], path[j]) for j = i+1, ..., len-1
+            c, d = path[i:-1], path[(i+1):]
+            delta = distances[a, c] + distances[b, d] - distances[a, b] - distances[c, d]
+            best = int(np.argmin(delta))
+            if delta[best] < 0:
+                path[i:(i+best+1)] = path[i:(i+best+1)][::-1].copy()
+                improved = True
+    return path.tolist()
+
+
+def route_length(distances, path):
+    """Returns the length of path plus the way back from its last to its first node,
+    which is how the Model objective counts a batch."""
+    path = np.asarray(path, dtype=np.intp)
+    return int(distances[path[:-1], path[1:]].sum() + distances[path[-1], path[0]])
@@ -1,71 +1,178 @@
 import csv
+import json
+import os
+import sys
+from datetime import datetime
 
+import numpy as np
 
-def read_orders(data_file, num_picks=None):
+
+# start and end node of every trip through the warehouse
+NAME_START_NODE = "F-20-28"
+NAME_END_NODE = "F-20-27"
+
+# Pick attribute names, in the same order as the columns of the orders csv:
+# Auftrag;Datum;Lagerort;Begin Komm. am;Begin Komm. um;Ende Komm. am;Ende Komm. Auftrag um;
+# Ende Komm. Pos. um;Batch;Reihenfolge der Komm.;Wagen Nr;Artikel;Kistennummer;Erstellt am;Erstellt um
+PICK_COLUMNS = ('_order', '_date', '_warehouse_location', '_start_on', '_start_at', '_end_on',
+                '_end_order_at', '_end_pos_at', '_batch', '_row', '_vehicle_nr', '_id', '_box_nr',
+                '_created_on', '_created_at')
+
+# date and time format of the orders csv, eg. '30.06.17' and '11:53'
+DATETIME_FORMAT = '%d.%m.%y %H:%M'
+
+
+def read_orders(data_file, num_picks=None, columns=None, start=None, end=None):
     """Function which reads a csv with the orders (example is dataClient.csv)
-    and converts the data into an array of Orders (the order id is the same as the index of the array);
+    and converts the data into a dict of Orders (the order id is the key of the dict);
     each order contains Picks, which are populated with the data.
 
     Args:
                  data_file (string): name of the csv file.
         num_picks (float, optional): max overall total number of items, ie picks, that should be read 
                                      from the csv file.
+       columns (:obj: `list`, optional): see iter_orders.
+      start, end (datetime, optional): see iter_orders.
 
     Returns:
         orders: dict of order objects.
 
     Example:
-    >>> orders = read_data_global("dataClient.csv")
+    >>> orders = read_orders("dataClient.csv")
     >>> len(orders) #get the number of all orders
     44640
-    >>> orders["044639"].numPicks() #get the number of picks for order with id=44639
+    >>> orders["044639"].num_picks() #get the number of picks for order with id=44639
     3
     >>> orders["000001"].picks[6]._id # get the id of the 7th pick of order id=00001
-    >>> '000016'
+    '000016'
+    """
+    orders = {}
+    for order in iter_orders(data_file, num_picks=num_picks, columns=columns, start=start, end=end):
+        if order._order_id in orders:
+            # the same order id further down in the file, keep all picks in one order
+            orders[order._order_id].picks.extend(order.picks)
+        else:
+            orders[order._order_id] = order
+    return orders
+
+
+def iter_orders(data_file, num_picks=None, columns=None, start=None, end=None):
+    """Generator which reads a csv with the orders one row at a time and yields one
+    Order as soon as all its (consecutive) picks are read.
+
+    Args:
+                     data_file (string): name of the csv file.
+            num_picks (float, optional): max overall total number of picks that should be read.
+        columns (:obj: `list`, optional): Pick attributes to keep, eg. ['_warehouse_location'],
+                                          see PICK_COLUMNS. The other attributes are None.
+                                          '_order' is always kept. Default is all columns.
+              start (datetime, optional): only read orders created (Erstellt am/um) at or after start.
+                end (datetime, optional): only read orders created before end.
+
+    Yields:
+        order (:obj: `Order`): the next order in the file.
+
+    Example:
+    >>> for order in iter_orders("dataClient.csv", columns=['_warehouse_location']):
+    ...     print(order._order_id, [pick._warehouse_location for pick in order.picks])
+    000001 ['F-03-19', 'F-04-05', 'F-05-11']
+    """
+    current_order = None
+    for pick in _iter_picks(data_file, num_picks, columns, start, end):
+        if current_order is None or pick._order != current_order._order_id:
+            if current_order is not None:
+                yield current_order
+            current_order = Order(pick._order)
+        current_order.picks.append(pick)
+    if current_order is not None:
+        yield current_order
+
+
+def read_orders_columnar(data_file, num_picks=None, columns=None, start=None, end=None):
+    """Function which reads a csv with the orders into columns instead of objects.
+
+    Args:
+        See iter_orders.
+
+    Returns:
+        data (:obj: `dict`): key: Pick attribute name (see PICK_COLUMNS) and item: list with
+                             the value for every pick, in file order. Only the requested columns,
+                             and '_order', are returned.
+
+    Example:
+    >>> data = read_orders_columnar("dataClient.csv", columns=['_warehouse_location'])
+    >>> data['_order'][:2], data['_warehouse_location'][:2]
+    (['000001', '000001'], ['F-03-19', 'F-04-05'])
+    """
+    positions = _column_positions(columns)
+    names = [PICK_COLUMNS[position] for position in positions]
+    data = {name: [] for name in names}
+    appends = [(position, data[name].append) for position, name in zip(positions, names)]
+    for row in _iter_rows(data_file, num_picks, start, end):
+        for position, append in appends:
+            append(row[position])
+    return data
+
+
+def _column_positions(columns):
+    """Returns the csv positions of the requested Pick attributes, '_order' always included."""
+    if columns is None:
+        return list(range(len(PICK_COLUMNS)))
+    unknown = set(columns) - set(PICK_COLUMNS)
+    if unknown:
+        raise ValueError("unknown pick columns: " + str(sorted(unknown)))
+    wanted = set(columns) | {'_order'}
+    return [position for position, name in enumerate(PICK_COLUMNS) if name in wanted]
+
+
+def _iter_picks(data_file, num_picks, columns, start, end):
+    """Yields a Pick for every row of the orders csv."""
+    positions = _column_positions(columns)
+    if len(positions) == len(PICK_COLUMNS):
+        for row in _iter_rows(data_file, num_picks, start, end):
+            yield Pick(row)
+    else:
+        # columns that are not wanted are replaced by None, so their strings are freed
+        mask = [None] * len(PICK_COLUMNS)
+        for row in _iter_rows(data_file, num_picks, start, end):
+            data_row = mask[:]
+            for position in positions:
+                data_row[position] = row[position]
+            yield Pick(data_row)
+
+
+def _iter_rows(data_file, num_picks, start, end):
+    """Yields the rows of the orders csv, without the header, as lists of strings.
+
+    The order ids and locations are interned, so the many picks at the same location
+    share one string. Rows outside [start, end) of the creation time are skipped.
     """
-    
+    created_on = PICK_COLUMNS.index('_created_on')
+    created_at = PICK_COLUMNS.index('_created_at')
+    parsed_times = {} # creation times are shared by all picks of an order, parse once
+    n_picks = 0
     #open the file
     with open(data_file, 'r') as datafile:
         reader = csv.reader(datafile, delimiter=';')
-        column_names = []
-        orders = {}
-        current_order_id = "000001"
-        previous_order_id = 0
-        current_order = Order(current_order_id)
-        rownum = 0
-        #iterate through each element in the csv and avoid the headers
+        next(reader, None) # skip the header
         for row in reader:
-            colnum = 0
-            current_pick_data = []
-            for col in row:
-                if rownum == 0:
-                    #populating the header array
-                    column_names = column_names + [col]
-                else:
-                    if colnum == 0:
-                        #checking if the order id is the same; if not we create
-                        #a new object Order and append it to the orders array
-                        if col != current_order_id:
-                            orders[previous_order_id] = current_order
-                            current_order_id = col
-                            current_order = Order(col)
-                            current_pick_data = current_pick_data + [col]
-                        else:
-                            current_pick_data = current_pick_data + [col]
-                            previous_order_id = current_order_id
-                    else:
-                        current_pick_data = current_pick_data + [col]                        
-                colnum += 1
-            if (rownum > 0):
-                #populate the pick object with the obtained data
-                pick = Pick(current_pick_data)
-                current_order.picks = current_order.picks + [pick]
-            rownum += 1
-            if (num_picks != None and rownum > num_picks):
+            if num_picks is not None and n_picks >= num_picks:
                 break
-        #add the last order to the array
-        orders[current_order_id] = current_order
-    return orders
+            if len(row) == 0:
+                continue
+            if start is not None or end is not None:
+                key = row[created_on], row[created_at]
+                created = parsed_times.get(key)
+                if created is None:
+                    created = datetime.strptime(key[0] + ' ' + key[1], DATETIME_FORMAT)
+                    parsed_times[key] = created
+                if (start is not None and created < start) or (end is not None and created >= end):
+                    continue
+            row[0] = sys.intern(row[0])
+            row[2] = sys.intern(row[2])
+            n_picks += 1
+            yield row
+
 
 class Order:
     def __init__(self, order_id):
@@ -76,24 +183,156 @@ class Order:
     def num_picks(self):
         return len(self.picks)
 
+    def locations(self):
+        """Returns the distinct warehouse locations of the picks, in pick order."""
+        return list(dict.fromkeys(pick._warehouse_location for pick in self.picks))
+
 
 class Batch:
-    def __init__(self):
+    """One trip through the warehouse.
+
+    Attributes:
+          picks (:obj: `list`): Pick objects of all the orders in the batch.
+         orders (:obj: `list`): order ids (str) in the batch.
+          route (:obj: `list`): node ids (str) in walking order, from NAME_START_NODE to NAME_END_NODE.
+                distance (int): length of the route, including walking back from
+                                NAME_END_NODE to NAME_START_NODE, as in the Model objective.
+    """
+
+    def __init__(self, orders=None, route=None, distance=None):
         self.picks = []
+        self.orders = list(orders) if orders is not None else []
+        self.route = list(route) if route is not None else []
+        self.distance = distance
+
+    def to_dict(self):
+        """Returns the batch as a json object with 'orders', 'route' and 'distance'."""
+        return {'orders': list(self.orders), 'route': list(self.route),
+                'distance': int(self.distance) if self.distance is not None else None}
+
+    def stops(self):
+        """Returns the route as (node, order ids picked at the node) pairs, from the picks."""
+        picked = dict()
+        for pick in self.picks:
+            picked.setdefault(pick._warehouse_location, dict())[pick._order] = None
+        return [(node, list(picked.get(node, []))) for node in self.route]
+
+
+class Plan:
+    """The batches of a solution, with their totals.
+
+    Attributes:
+        batches (:obj: `list`): infrastructure.Batch objects with orders, route and distance set.
+
+    Example:
+    >>> plan = model.solution(orders)
+    >>> plan.totals()
+    {'n_batches': 1, 'n_orders': 2, 'n_picks': 5, 'distance': 189400}
+    >>> plan.write_csv("results/plan.csv")
+    """
+
+    def __init__(self, batches, orders=None):
+        """
+        Args:
+            batches (:obj: `iterable`): infrastructure.Batch objects.
+            orders (:obj: `dict`, optional): the orders, to fill in the picks of batches without picks.
+        """
+        self.batches = list(batches)
+        if orders is not None:
+            for batch in self.batches:
+                if len(batch.picks) == 0:
+                    batch.picks = [pick for order_id in batch.orders for pick in orders[order_id].picks]
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def totals(self):
+        """Returns 'n_batches', 'n_orders', 'n_picks' and 'distance' (int) of the plan."""
+        return _plan_totals(self.batches)
+
+    def write_csv(self, csv_file):
+        """Writes the plan as csv, see write_plan_csv."""
+        return write_plan_csv(self.batches, csv_file)
+
+    def write_json(self, json_file):
+        """Writes the plan as json, see write_plan_json."""
+        return write_plan_json(self.batches, json_file)
+
+
+def write_plan_csv(batches, csv_file):
+    """Writes batches, one row per stop of a route, as they come.
+
+    The columns are Batch;Stop;Lagerort;Auftraege;Distanz: the batch number, the position of the
+    stop on the route, the node, the orders picked there (separated by commas, empty without
+    picks) and the distance of the batch. batches can be any iterable, eg. a generator, it is
+    never held in memory.
+
+    Returns:
+        totals (:obj: `dict`): see Plan.totals.
+    """
+    totals = _plan_totals([])
+    with open(csv_file, 'w', newline='') as the_file:
+        writer = csv.writer(the_file, delimiter=';')
+        writer.writerow(['Batch', 'Stop', 'Lagerort', 'Auftraege', 'Distanz'])
+        for batch_k, batch in enumerate(batches):
+            for stop, (node, order_ids) in enumerate(batch.stops()):
+                writer.writerow([batch_k, stop, node, ','.join(order_ids), batch.distance])
+            _add_to_totals(totals, batch)
+    return totals
+
+
+def write_plan_json(batches, json_file):
+    """Writes batches as the json object {"batches": [batch, ...], "totals": totals}, see
+    Batch.to_dict and Plan.totals. Batches are written one at a time as they come, so batches
+    can be any iterable, eg. a generator.
+
+    Returns:
+        totals (:obj: `dict`): see Plan.totals.
+    """
+    totals = _plan_totals([])
+    with open(json_file, 'w') as the_file:
+        the_file.write('{"batches": [')
+        for batch_k, batch in enumerate(batches):
+            the_file.write((',\n' if batch_k > 0 else '\n') + json.dumps(batch.to_dict()))
+            _add_to_totals(totals, batch)
+        the_file.write('\n], "totals": ' + json.dumps(totals) + '}\n')
+    return totals
+
+
+def _plan_totals(batches):
+    totals = {'n_batches': 0, 'n_orders': 0, 'n_picks': 0, 'distance': 0}
+    for batch in batches:
+        _add_to_totals(totals, batch)
+    return totals
+
+
+def _add_to_totals(totals, batch):
+    totals['n_batches'] += 1
+    totals['n_orders'] += len(batch.orders)
+    totals['n_picks'] += len(batch.picks)
+    totals['distance'] += int(batch.distance or 0)
 
 
 class Warehouse:
     #initialize the matrix which will be populated with the distances from csv
     def __init__(self):
-        self.dist = {}
-    
-    def read_distances(self, data_file):
+        self.dist = None
+
+    def read_distances(self, data_file, cache=True):
         """Function which reads the csv of the distances between the nodes and
-           returns a dictionary of dictionaries with keys of the node id
+           returns a DistanceMatrix which can be indexed with the node ids.
+
+           The first time a csv is read, the parsed matrix is written next to it as a binary
+           cache (data_file + '.npy' and data_file + '.nodes'). Later reads memory-map the
+           cache instead of parsing the csv, as long as the cache is newer than the csv.
 
            Args:
                data_file (string): name of the csv file.
-           
+               cache (bool, optional): use and write the binary cache, default is True.
+
            Returns:
                self.dist: distances between the nodes.
 
@@ -102,36 +341,188 @@ class Warehouse:
            >>> warehouse = Warehouse() #initialize warehouse object
            >>> warehouse.read_distances("test.csv") #read the distances
            >>> warehouse.dist["a"] #print all the distances from node "a"
-           {'b': '23', 'c': '4', 'a': '5'}
+           {'a': 5, 'b': 23, 'c': 4}
            >>> warehouse.dist["a"]["b"] #get the distance between node "a" and "b"
-           '23'
+           23
 
         """
+        array_file = data_file + '.npy'
+        nodes_file = data_file + '.nodes'
+
+        if cache and _is_fresh(array_file, data_file) and _is_fresh(nodes_file, data_file):
+            self.dist = DistanceMatrix.load(array_file, nodes_file)
+            return self.dist
+
         #open the file
         with open(data_file, 'r') as datafile:
             reader = csv.reader(datafile, delimiter=';')
-            array_nodes = []
-            rownum = 0
-            #iterate through each element in the csv and avoid the headers
+            #the first column of the header is empty, the rest are the column nodes
+            column_nodes = next(reader)[1:]
+            n_nodes = len(column_nodes)
+            row_nodes = []
+            rows = []
             for row in reader:
-                colnum = 0
-                current_dictionary = {}
-                current_node = ""
-                for col in row:
-                    if rownum == 0:
-                        array_nodes = array_nodes + [col]
-                    else:
-                        if colnum == 0:
-                            current_node = col
-                        else:
-                            current_dictionary[array_nodes[colnum]] = int(col)
-                    colnum += 1
-                self.dist[current_node] = current_dictionary
-                rownum += 1
+                if len(row) == 0:
+                    continue
+                row_nodes.append(row[0])
+                rows.append([int(col) for col in row[1:(n_nodes+1)]])
+
+        array = np.array(rows, dtype=DistanceMatrix.DTYPE)
+        #rows are stored in the same order as the columns, so that array[i, j] is symmetric in use
+        if row_nodes != column_nodes:
+            row_index = {node: i for i, node in enumerate(row_nodes)}
+            array = array[[row_index[node] for node in column_nodes]]
+
+        self.dist = DistanceMatrix(column_nodes, array)
+        if cache:
+            try:
+                self.dist.save(array_file, nodes_file)
+            except OSError:
+                pass # read-only data directory, the csv is simply parsed again next time
         return self.dist
 
+    def read_layout(self, layout_file):
+        """Function which computes the distances between the nodes from a warehouse layout
+           instead of reading them from a csv, see layout.Layout.
+
+           Args:
+               layout_file (string): name of the layout json, eg. ../data/layout.json.
+
+           Returns:
+               self.dist: a layout.LayoutDistances, a DistanceMatrix whose rows are computed
+                          when they are first used.
+        """
+        from layout import Layout
+        self.dist = Layout.read(layout_file).distances()
+        return self.dist
+
+
+class DistanceMatrix:
+    """Distances between the warehouse nodes, stored as an integer numpy array
+    together with a map from node id to row/column index.
+
+    Lookups by node id work as with a dict of dicts, ie dist['node_id_i']['node_id_j'],
+    so code written for the csv dict keeps working. Vectorised code should use
+    indices() and submatrix() and work on the array directly.
+
+    Attributes:
+         nodes (:obj: `list`): node ids (str), nodes[i] is the node of row and column i.
+         index (:obj: `dict`): key: node id (str) and item: row/column index (int).
+        array (:obj: `ndarray`): array[i, j] is the distance between node i and node j,
+                                 may be a read-only memory map of the binary cache.
+    """
+
+    DTYPE = np.int32
+
+    def __init__(self, nodes, array):
+        self.nodes = list(nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.array = array
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __contains__(self, node):
+        return node in self.index
+
+    def __getitem__(self, node):
+        return _DistanceRow(self.index, self.array[self.index[node]])
+
+    def distance(self, node_i, node_j):
+        """Returns the distance (int) between node_i and node_j."""
+        return int(self.array[self.index[node_i], self.index[node_j]])
+
+    def indices(self, nodes):
+        """Returns the row/column indices of nodes as an integer ndarray."""
+        return np.fromiter((self.index[node] for node in nodes), dtype=np.intp, count=len(nodes))
+
+    def submatrix(self, nodes):
+        """Returns the distances between nodes as a len(nodes) x len(nodes) ndarray,
+        ordered as nodes."""
+        idx = self.indices(nodes)
+        return self.array[np.ix_(idx, idx)]
+
+    def save(self, array_file, nodes_file):
+        """Writes the matrix as a binary cache, which can be memory-mapped by load().
+
+        Files are written to a temporary name first and then renamed, so other
+        processes never see a half written cache.
+        """
+        _atomic_write(array_file, lambda f: np.save(f, np.ascontiguousarray(self.array)))
+        _atomic_write(nodes_file, lambda f: f.write('\n'.join(self.nodes).encode('utf-8')))
+
+    @classmethod
+    def load(cls, array_file, nodes_file, mmap=True):
+        """Loads a matrix written by save(). With mmap, the array is a read-only memory map
+        that is shared between all processes reading the same file."""
+        array = np.load(array_file, mmap_mode='r' if mmap else None)
+        with open(nodes_file, 'r', encoding='utf-8') as the_file:
+            nodes = the_file.read().split('\n')
+        return cls(nodes, array)
+
+
+class _DistanceRow:
+    """Distances from one node, indexed by the id of the other node."""
+
+    __slots__ = ('_index', '_row')
+
+    def __init__(self, index, row):
+        self._index = index
+        self._row = row
+
+    def __getitem__(self, node):
+        return int(self._row[self._index[node]])
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __contains__(self, node):
+        return node in self._index
+
+    def __repr__(self):
+        return repr({node: int(self._row[i]) for node, i in self._index.items()})
+
+
+def distance_submatrix(dist, nodes):
+    """Returns the distances between nodes as a len(nodes) x len(nodes) ndarray, ordered as nodes.
+
+    Args:
+        dist (:obj: `DistanceMatrix` or `dict`): distances, eg dist['node_id_i']['node_id_j'].
+                       nodes (:obj: `list`): node ids (str).
+    """
+    if hasattr(dist, 'submatrix'):
+        return dist.submatrix(nodes)
+    return np.array([[dist[node_i][node_j] for node_j in nodes] for node_i in nodes], dtype=np.int64)
+
+
+def _is_fresh(cache_file, data_file):
+    """Returns True if cache_file exists and is not older than data_file."""
+    try:
+        return os.path.getmtime(cache_file) >= os.path.getmtime(data_file)
+    except OSError:
+        return False
+
+
+def _atomic_write(file_name, write):
+    """Calls write(f) on a temporary binary file and renames it to file_name."""
+    tmp_name = file_name + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_name, 'wb') as the_file:
+        write(the_file)
+    os.replace(tmp_name, file_name)
+
 
 class Pick:
+    """One row of the orders csv. Attributes are named as in PICK_COLUMNS;
+    columns that were not read (see iter_orders) are None."""
+
+    __slots__ = PICK_COLUMNS
+
     def __init__(self, data_row):
         self._order = data_row[0]
         self._date = data_row[1]
@@ -0,0 +1,202 @@
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+
+# comma separated phase names, eg. PROFILE_PHASES=solve python3 main.py
+PROFILE_ENV = 'PROFILE_PHASES'
+TRACEMALLOC_ENV = 'TRACEMALLOC_PHASES'
+
+
+class Instrumentation:
+    """Timers, counters and memory snapshots for the phases of a run.
+
+    A phase is timed with a with statement. After every phase, the current and the peak resident
+    memory are recorded. Phases named in profile are run under cProfile, the stats are written
+    to profile_dir/<phase>.prof; phases named in trace_memory are run under tracemalloc, and the
+    largest allocations are kept in the report. Both default to the comma separated phase names
+    in the environment variables PROFILE_PHASES and TRACEMALLOC_PHASES, so a phase can be
+    profiled without touching the code.
+
+    Model.optimize records the progress of the incumbent and the bound, and the statistics of
+    the subtour separation, if it is given an Instrumentation.
+
+    Every phase, progress record and event is also written as one json line to log_file.
+
+    Example:
+    >>> instrumentation = Instrumentation(log_file="results/run.jsonl")
+    >>> with instrumentation.phase('read_orders'):
+    ...     orders = read_orders("../data/example.csv")
+    >>> instrumentation.count('orders', len(orders))
+    >>> instrumentation.report()['counters']
+    {'orders': 2}
+    """
+
+    def __init__(self, log_file=None, profile=None, trace_memory=None, profile_dir='.', progress_interval=1.0):
+        """
+        Args:
+                 log_file (string, optional): json lines event log, appended to.
+            profile (:obj: `iterable`, optional): names of the phases to run under cProfile.
+            trace_memory (:obj: `iterable`, optional): names of the phases to run under tracemalloc.
+              profile_dir (string, optional): directory of the cProfile stats, default is '.'.
+        progress_interval (float, optional): minimum seconds between two progress records of the
+                                             solver that only change the bound, default is 1.
+        """
+        self.log_file = log_file
+        self.profile = set(profile) if profile is not None else _phases_from_env(PROFILE_ENV)
+        self.trace_memory = set(trace_memory) if trace_memory is not None else _phases_from_env(TRACEMALLOC_ENV)
+        self.profile_dir = profile_dir
+        self.progress_interval = progress_interval
+        self._start = time.perf_counter()
+        self._phases = []
+        self._counters = dict()
+        self._sections = dict()
+        self._progress = []
+        self._events = []
+
+    @contextmanager
+    def phase(self, name):
+        """Times the code in the with statement as phase name."""
+        profiler = cProfile.Profile() if name in self.profile else None
+        started_tracing = name in self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if name in self.trace_memory:
+            tracemalloc.reset_peak()
+        record = {'phase': name, 'start': self.elapsed()}
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['seconds'] = time.perf_counter() - start
+            record['rss_mb'] = current_rss_mb()
+            record['peak_rss_mb'] = peak_rss_mb()
+            if profiler is not None:
+                record['profile'] = os.path.join(self.profile_dir, name + '.prof')
+                profiler.dump_stats(record['profile'])
+            if name in self.trace_memory:
+                record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                statistics = tracemalloc.take_snapshot().statistics('lineno')[:10]
+                record['top_allocations'] = [{'line': str(stat.traceback), 'size_mb': stat.size / (1024 * 1024),
+                                              'count': stat.count} for stat in statistics]
+                if started_tracing:
+                    tracemalloc.stop()
+            self._phases.append(record)
+            self._log('phase', record)
+
+    def count(self, name, n=1):
+        """Adds n to the counter name."""
+        self._counters[name] = self._counters.get(name, 0) + n
+
+    def record(self, name, values):
+        """Stores a dict of values, eg. the separation_stats of a Model, as section name of the report."""
+        self._sections[name] = dict(values)
+        self._log('section', {'section': name, 'values': self._sections[name]})
+
+    def progress(self, runtime, incumbent, bound, force=False):
+        """Records the incumbent and the bound of the solver after runtime seconds.
+
+        A record is only kept if the incumbent changed, force is set, or progress_interval seconds
+        passed since the last record.
+        """
+        if not force and len(self._progress) > 0:
+            last = self._progress[-1]
+            if last['incumbent'] == incumbent and runtime - last['runtime'] < self.progress_interval:
+                return
+        record = {'runtime': runtime, 'incumbent': incumbent, 'bound': bound}
+        self._progress.append(record)
+        self._log('progress', record)
+
+    def event(self, kind, **fields):
+        """Records a free form event, eg. event('warm_start', n_batches=3)."""
+        record = dict(fields)
+        self._events.append(dict(record, kind=kind))
+        self._log(kind, record)
+
+    def elapsed(self):
+        """Returns the seconds since the Instrumentation was created."""
+        return time.perf_counter() - self._start
+
+    def report(self):
+        """Returns everything that was recorded.
+
+        Returns:
+            report (:obj: `dict`): 'phases' (list of dicts with 'phase', 'start', 'seconds', 'rss_mb',
+                                   'peak_rss_mb' and, if captured, 'profile', 'traced_peak_mb' and
+                                   'top_allocations'), 'counters' (dict), 'sections' (dict of dicts),
+                                   'progress' (list of dicts with 'runtime', 'incumbent' and 'bound'),
+                                   'events' (list of dicts) and 'seconds' (float) in total.
+        """
+        return {'phases': [dict(record) for record in self._phases], 'counters': dict(self._counters),
+                'sections': {name: dict(values) for name, values in self._sections.items()},
+                'progress': [dict(record) for record in self._progress],
+                'events': [dict(record) for record in self._events], 'seconds': self.elapsed()}
+
+    def summary(self):
+        """Returns one line per phase with its seconds and memory, and the counters."""
+        lines = []
+        for record in self._phases:
+            lines.append(record['phase'] + ': ' + format(record['seconds'], '.3f') + ' s, rss '
+                         + str(record['rss_mb']) + ' MB, peak ' + str(record['peak_rss_mb']) + ' MB')
+        for name, value in self._counters.items():
+            lines.append(name + ': ' + str(value))
+        return '\n'.join(lines) + '\n'
+
+    def _log(self, kind, record):
+        """Appends the record as one json line to the log file."""
+        if self.log_file is None:
+            return
+        with open(self.log_file, 'a') as the_file:
+            the_file.write(json.dumps(dict(record, kind=kind, time=self.elapsed()), default=str) + '\n')
+
+
+def peak_rss_mb():
+    """Returns the peak resident memory of the process in MB, or None where it is unknown.
+
+    Where /proc is available, it is read from the same source as current_rss_mb, so the peak is
+    never below the current value.
+    """
+    peak = _proc_status_mb('VmHWM')
+    if peak is not None:
+        return max(peak, _proc_status_mb('VmRSS') or 0.0)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    """Returns the current resident memory of the process in MB, or None where it is unknown."""
+    return _proc_status_mb('VmRSS')
+
+
+def _proc_status_mb(field):
+    """Returns a memory field of /proc/self/status, eg. VmRSS or VmHWM, in MB, or None where it is
+    unknown."""
+    try:
+        with open('/proc/self/status', 'r') as the_file:
+            for line in the_file:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024 # in kB
+    except (OSError, ValueError, IndexError): # no /proc, eg. on macOS and Windows
+        return None
+    return None
+
+
+def _phases_from_env(variable):
+    """Returns the set of comma separated phase names in the environment variable."""
+    return {name.strip() for name in os.environ.get(variable, '').split(',') if name.strip()}
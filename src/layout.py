@@ -0,0 +1,204 @@
+import argparse
+import heapq
+import json
+
+import numpy as np
+
+from infrastructure import NAME_START_NODE, NAME_END_NODE, DistanceMatrix, Warehouse, _DistanceRow
+
+
+class Layout:
+    """The walkable graph of a warehouse with parallel aisles and straight cross aisles.
+
+    Locations are named prefix-aisle-slot, eg. F-03-19. Within an aisle, neighbouring slots are
+    connected, and at every cross aisle slot the same slot of neighbouring aisles are connected.
+    Links connect any two nodes, eg. a depot that is not a slot, and are added as given.
+
+    Attributes:
+        nodes (:obj: `list`): node ids (str), the slots aisle by aisle and then the other nodes of the links.
+        index (:obj: `dict`): key: node id (str) and item: index (int) in nodes.
+        depot (:obj: `list`): node ids (str) of the depot, eg. [NAME_START_NODE, NAME_END_NODE].
+
+    Example:
+    >>> layout = Layout.read("../data/layout.json")
+    >>> dist = layout.distances()
+    >>> dist['F-20-28']['F-03-19']
+    49950
+    """
+
+    def __init__(self, aisles, slots, slot_length, aisle_width, cross_aisles, first_aisle=1, slot_gaps=None,
+                 prefix='F', depot=(NAME_START_NODE, NAME_END_NODE), links=()):
+        """
+        Args:
+                       aisles (int): number of aisles.
+                        slots (int): number of slots per aisle, numbered 0, ..., slots-1.
+                  slot_length (int): distance between neighbouring slots in mm.
+                  aisle_width (int): distance between neighbouring aisles in mm, along a cross aisle.
+             cross_aisles (:obj: `list`): slots (int) that are in a cross aisle.
+            first_aisle (int, optional): number of the first aisle, default is 1.
+            slot_gaps (:obj: `dict`, optional): key: slot (int) and item: distance in mm to the next slot,
+                                                 where it is not slot_length.
+              prefix (str, optional): prefix of the location names, default is 'F'.
+            depot (:obj: `list`, optional): node ids (str) of the depot, default is the start and end node.
+            links (:obj: `list`, optional): (node_i, node_j, distance) tuples of extra connections.
+        """
+        slot_gaps = {int(slot): gap for slot, gap in (slot_gaps or {}).items()}
+        aisle_numbers = range(first_aisle, first_aisle + aisles)
+        self.nodes = [self.node_name(prefix, aisle, slot) for aisle in aisle_numbers for slot in range(slots)]
+        for node_i, node_j, _ in links:
+            self.nodes.extend(node for node in (node_i, node_j) if node not in self.nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.depot = list(depot)
+        missing = [node for node in self.depot if node not in self.index]
+        if len(missing) > 0:
+            raise ValueError("depot nodes not in the layout: " + str(missing))
+
+        edges = []
+        for a, aisle in enumerate(aisle_numbers):
+            first = a * slots
+            edges.extend((first + slot, first + slot + 1, slot_gaps.get(slot, slot_length))
+                         for slot in range(slots - 1))
+            if a < aisles - 1:
+                edges.extend((first + slot, first + slots + slot, aisle_width) for slot in cross_aisles)
+        edges.extend((self.index[node_i], self.index[node_j], length) for node_i, node_j, length in links)
+
+        self._adjacency = [[] for _ in self.nodes]
+        for i, j, length in edges:
+            self._adjacency[i].append((j, int(length)))
+            self._adjacency[j].append((i, int(length)))
+        self._edges = np.array(edges, dtype=np.int64).reshape(-1, 3)
+
+    @staticmethod
+    def node_name(prefix, aisle, slot):
+        """Returns the location name, eg. F-03-19 for prefix 'F', aisle 3 and slot 19."""
+        return '{}-{:02d}-{:02d}'.format(prefix, aisle, slot)
+
+    @classmethod
+    def read(cls, layout_file):
+        """Reads a layout from a json file with the arguments of Layout, see ../data/layout.json."""
+        with open(layout_file, 'r') as the_file:
+            spec = json.load(the_file)
+        return cls(**spec)
+
+    def shortest_paths(self, sources):
+        """Returns the distances from the sources to all nodes, with Dijkstra from every source.
+
+        Args:
+            sources (:obj: `list`): node indices (int).
+
+        Returns:
+            distances (:obj: `ndarray`): distances[s, j] is the distance from sources[s] to node j.
+        """
+        distances = np.empty((len(sources), len(self.nodes)), dtype=DistanceMatrix.DTYPE)
+        for s, source in enumerate(sources):
+            row = [np.inf] * len(self.nodes)
+            row[source] = 0
+            heap = [(0, source)]
+            while len(heap) > 0:
+                length, i = heapq.heappop(heap)
+                if length > row[i]:
+                    continue
+                for j, edge_length in self._adjacency[i]:
+                    if length + edge_length < row[j]:
+                        row[j] = length + edge_length
+                        heapq.heappush(heap, (row[j], j))
+            if np.inf in row:
+                raise ValueError("layout is not connected, " + self.nodes[row.index(np.inf)] + " can not be reached "
+                                 "from " + self.nodes[source])
+            distances[s] = row
+        return distances
+
+    def all_pairs(self):
+        """Returns the distances between all nodes as a len(nodes) x len(nodes) ndarray,
+        with a vectorised Floyd-Warshall."""
+        n_nodes = len(self.nodes)
+        array = np.full((n_nodes, n_nodes), np.iinfo(np.int64).max // 4, dtype=np.int64)
+        np.fill_diagonal(array, 0)
+        i, j, length = self._edges.T
+        np.minimum.at(array, (i, j), length)
+        np.minimum.at(array, (j, i), length)
+        for k in range(n_nodes):
+            np.minimum(array, array[:, k, None] + array[None, k, :], out=array)
+        return array.astype(DistanceMatrix.DTYPE)
+
+    def distances(self):
+        """Returns the distances between the nodes as a LayoutDistances, whose rows are computed
+        when they are first used."""
+        return LayoutDistances(self)
+
+
+class LayoutDistances(DistanceMatrix):
+    """A DistanceMatrix of a Layout whose rows are computed on first use.
+
+    Looking up distances from a node, or the submatrix of some nodes, computes the rows of only
+    those nodes with Dijkstra, so a solve over 50 locations never computes the full matrix. The
+    array attribute is the full matrix and computes all missing rows at once, with Floyd-Warshall.
+    """
+
+    def __init__(self, layout):
+        self.nodes = list(layout.nodes)
+        self.index = dict(layout.index)
+        self._layout = layout
+        self._rows = dict()
+        self._array = None
+
+    @property
+    def array(self):
+        if self._array is None:
+            self._array = self._layout.all_pairs()
+            self._rows = {i: self._array[i] for i in range(len(self.nodes))}
+        return self._array
+
+    def computed_rows(self):
+        """Returns the number of rows (int) computed so far."""
+        return len(self._rows)
+
+    def rows(self, indices):
+        """Returns the distances from the nodes of indices to all nodes as a len(indices) x len(nodes)
+        ndarray, computing the missing rows."""
+        missing = list(dict.fromkeys(i for i in indices if i not in self._rows))
+        if len(missing) > 0:
+            for i, row in zip(missing, self._layout.shortest_paths(missing)):
+                self._rows[i] = row
+        if len(indices) == 0:
+            return np.empty((0, len(self.nodes)), dtype=DistanceMatrix.DTYPE)
+        return np.stack([self._rows[i] for i in indices])
+
+    def __getitem__(self, node):
+        i = self.index[node]
+        return _DistanceRow(self.index, self.rows([i])[0])
+
+    def distance(self, node_i, node_j):
+        return int(self.rows([self.index[node_i]])[0, self.index[node_j]])
+
+    def submatrix(self, nodes):
+        idx = self.indices(nodes)
+        return self.rows(idx.tolist())[:, idx]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the distances of a warehouse layout.")
+    parser.add_argument('layout_file', help="layout json, eg. ../data/layout.json")
+    parser.add_argument('--csv', help="write all distances to this csv, in the format of ../data/dist.csv")
+    parser.add_argument('--compare', help="distances csv to compare with, eg. ../data/dist.csv")
+    args = parser.parse_args()
+
+    layout = Layout.read(args.layout_file)
+    dist = layout.distances()
+    print("nodes: " + str(len(dist)))
+    if args.csv:
+        from benchmark import write_distances
+        write_distances(dist, args.csv)
+    if args.compare:
+        other = Warehouse().read_distances(args.compare, cache=False)
+        missing = [node for node in other.nodes if node not in dist]
+        if len(missing) > 0:
+            print("nodes not in the layout: " + str(missing))
+        nodes = [node for node in other.nodes if node in dist]
+        difference = np.abs(dist.submatrix(nodes).astype(np.int64) - other.submatrix(nodes))
+        print("compared pairs: " + str(difference.size) + ", differing pairs: " + str(int((difference > 0).sum()))
+              + ", max difference: " + str(int(difference.max(initial=0))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import json
+import time
+
+from infrastructure import read_orders
+from service import Client, latency_percentiles, order_to_json
+
+
+async def run_load(orders, connect, clients=4, submit_size=5, plan_every=4, time_limit=0.2, solver=None,
+                   backoff=0.05):
+    """Replays orders against a running BatchingService from concurrent clients.
+
+    The orders are dealt round-robin to the clients. Every client submits its orders submit_size at
+    a time and, after every plan_every submissions and at the end, requests a plan of the orders it
+    submitted since its last plan. A plan that is rejected as busy is retried after backoff seconds,
+    doubling up to 1 second.
+
+    Args:
+          orders (:obj: `dict`): Dict of all orders.
+                                 key: order_id (str) and item: infrastructure.Order
+             connect (callable): coroutine function that returns a connected service.Client.
+          clients (int, optional): number of concurrent connections, default is 4.
+      submit_size (int, optional): orders per submission, default is 5.
+       plan_every (int, optional): submissions per plan, default is 4.
+   time_limit (float, optional): seconds of search per plan, default is 0.2.
+         solver (str, optional): solver of the plans, default is the one of the service.
+      backoff (float, optional): first wait after a busy answer, default is 0.05 seconds.
+
+    Returns:
+        report (:obj: `dict`): 'seconds', 'orders' planned, 'orders_per_second', 'requests_per_second',
+                               'busy' (plans rejected), 'fallbacks', 'distance' (int) in total,
+                               'latency' (client side percentiles per op, see service.latency_percentiles)
+                               and 'service' (the stats of the service after the run).
+    """
+    order_ids = list(orders)
+    shares = [order_ids[c::clients] for c in range(clients)]
+    latencies = {'submit': [], 'plan': []}
+    totals = {'orders': 0, 'requests': 0, 'busy': 0, 'fallbacks': 0, 'distance': 0}
+
+    async def timed(client, op, **fields):
+        start = time.perf_counter()
+        response = await client.request(op, **fields)
+        latencies[op].append(time.perf_counter() - start)
+        totals['requests'] += 1
+        return response
+
+    async def plan(client, planned):
+        wait = backoff
+        while True:
+            options = {'orders': planned, 'time_limit': time_limit}
+            if solver is not None:
+                options['solver'] = solver
+            response = await timed(client, 'plan', **options)
+            if response['ok']:
+                break
+            if response.get('error') != 'busy':
+                raise RuntimeError("plan failed: " + response.get('error', ''))
+            totals['busy'] += 1
+            await asyncio.sleep(wait)
+            wait = min(2 * wait, 1.0)
+        totals['orders'] += len(planned)
+        totals['fallbacks'] += int(response['fallback'])
+        totals['distance'] += response['distance']
+
+    async def replay(share):
+        client = await connect()
+        try:
+            planned = []
+            chunks = [share[i:(i + submit_size)] for i in range(0, len(share), submit_size)]
+            for n, chunk in enumerate(chunks, start=1):
+                json_orders = [order_to_json(orders[order_id]) for order_id in chunk]
+                response = await timed(client, 'submit', orders=json_orders)
+                if not response['ok']:
+                    raise RuntimeError("submit failed: " + response['error'])
+                planned.extend(chunk)
+                if n % plan_every == 0 or n == len(chunks):
+                    await plan(client, planned)
+                    planned = []
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[replay(share) for share in shares if len(share) > 0])
+    seconds = time.perf_counter() - start
+
+    client = await connect()
+    try:
+        service_stats = await client.stats()
+    finally:
+        await client.close()
+    return {'seconds': seconds, 'orders': totals['orders'], 'orders_per_second': totals['orders'] / seconds,
+            'requests_per_second': totals['requests'] / seconds, 'busy': totals['busy'],
+            'fallbacks': totals['fallbacks'], 'distance': totals['distance'],
+            'latency': {op: latency_percentiles(values) for op, values in latencies.items()},
+            'service': service_stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput of a running batching service.")
+    parser.add_argument('orders_file', help="orders csv to replay, eg. ../data/example.csv")
+    parser.add_argument('--socket', help="Unix socket path of the service, eg. /tmp/batching.sock")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--num-picks', type=int, help="only replay the orders of the first picks")
+    parser.add_argument('--clients', type=int, default=4, help="number of concurrent connections")
+    parser.add_argument('--submit-size', type=int, default=5, help="orders per submission")
+    parser.add_argument('--plan-every', type=int, default=4, help="submissions per plan")
+    parser.add_argument('--time-limit', type=float, default=0.2, help="seconds of search per plan")
+    parser.add_argument('--solver', choices=['alns', 'heuristic', 'set_partitioning'])
+    args = parser.parse_args()
+
+    async def connect():
+        if args.socket:
+            return await Client.connect_unix(args.socket)
+        return await Client.connect_tcp(args.host, args.port)
+
+    orders = read_orders(args.orders_file, num_picks=args.num_picks)
+    report = asyncio.run(run_load(orders, connect, clients=args.clients, submit_size=args.submit_size,
+                                  plan_every=args.plan_every, time_limit=args.time_limit, solver=args.solver))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,29 +1,112 @@
-from infrastructure import read_orders, Batch, Order, Pick, Warehouse
+from heuristic import construct_batches
+from infrastructure import read_orders, Batch, Order, Pick, Plan, Warehouse
+from instrumentation import Instrumentation
 from model import Model
+from model_cache import ModelCache, instance_key
+from preprocessing import Reduction
+from set_partitioning import SetPartitioningModel
 
 from datetime import datetime
 
+import gurobipy as gp
+
 
 ORDERS_FILE = "../data/example.csv"
 DIST_FILE = "../data/dist.csv"
+LAYOUT_FILE = None	# eg. "../data/layout.json", computes the distances from the layout instead of DIST_FILE
 
 NUM_PICKS = [40]	# first 100 orders is 438 picks
 VOL = 6         	# max number of orders on tray
 
 MIPGAP = 1000   	# 1000 means, 1000 mm (1 meter) away from optimial solution
+TIME_LIMIT = None	# seconds of solving, None for no limit
+STALL_TIME = None	# stop when the best solution did not improve for this many seconds, None for never
+
+MODEL = "edges" 	# "edges" for Model, "set_partitioning" for SetPartitioningModel
+PREPROCESS = False	# merge co-located locations and neighbouring slots before Model is built
+
+EVENT_LOG = "results/events.jsonl"	# json lines log of the phases, set to None to turn off
+PLAN_FILE = "results/plan_{}_picks"	# the batches with routes are written to .csv and .json, None to turn off
+
+CACHE_DIR = "results/cache"	# solutions of earlier runs are reused, and are MIP starts of similar runs, None to turn off
+CACHE_MB = 500          	# the least recently used entries are deleted above this size
+CACHE_MODELS = False    	# also keep the built Model as MPS with its variable map
 
 
 def main():
-    dist = Warehouse().read_distances(DIST_FILE)
+    # PROFILE_PHASES=solve or TRACEMALLOC_PHASES=model_build python3 main.py profiles a phase
+    instrumentation = Instrumentation(log_file=EVENT_LOG, profile_dir="results")
+    with instrumentation.phase('read_distances'):
+        if LAYOUT_FILE is not None:
+            dist = Warehouse().read_layout(LAYOUT_FILE)
+        else:
+            dist = Warehouse().read_distances(DIST_FILE)
+
+    cache = ModelCache(CACHE_DIR, max_mb=CACHE_MB) if CACHE_DIR is not None else None
 
     file_string = str()
 
     for n_picks in NUM_PICKS:
-        orders = read_orders(ORDERS_FILE, num_picks=n_picks)
+        with instrumentation.phase('read_orders'):
+            orders = read_orders(ORDERS_FILE, num_picks=n_picks)
+
+        cached = None
+        if cache is not None:
+            key = instance_key(dist, orders, VOL, model=MODEL, preprocess=PREPROCESS, abs_gap=MIPGAP,
+                               time_limit=TIME_LIMIT, stall_time=STALL_TIME)
+            cached = cache.get(key)
+        if cached is not None:
+            plan = Plan(cached['batches'], orders)
+            model_string = str()
+            model_string = "Cached Model" + '\n'
+            model_string += "Number of items: " + str(n_picks) + '\n'
+            model_string += "Number of orders: " + str(len(orders)) + '\n'
+            model_string += "Objective: " + str(cached['objective']) + '\n'
+            model_string += "Optimal: " + str(cached['optimal']) + '\n'
+            model_string += "Cache: " + str(cache.stats) + '\n'
+            model_string += "Model batches: \n"
+            for batch_k, batch in enumerate(plan):
+                model_string += 'batch: ' + str(batch_k) + '\t'
+                model_string += 'orders: ' + str(batch.orders) + '\t'
+                model_string += 'route: ' + str(batch.route) + '\t'
+                model_string += 'distance: ' + str(batch.distance)
+                model_string += '\n'
+            model_string += '\n'
+            model_string += write_plan(plan, n_picks, instrumentation)
+            file_string += model_string
+            print(model_string)
+            continue
 
         start = datetime.now()
-        model = Model(dist, orders, volume=VOL)
-        model.optimize()
+        reduction = None
+        if PREPROCESS and MODEL != "set_partitioning":
+            with instrumentation.phase('preprocess'):
+                reduction = Reduction(dist, orders)
+        with instrumentation.phase('model_build'):
+            if MODEL == "set_partitioning":
+                model = SetPartitioningModel(dist, orders, volume=VOL)
+            elif reduction is not None:
+                model = Model(reduction.dist, reduction.orders, volume=VOL)
+            else:
+                model = Model(dist, orders, volume=VOL)
+        if cache is not None and MODEL != "set_partitioning" and reduction is None:
+            similar = cache.similar_start(orders, VOL)
+            if similar is not None:
+                # the batches of the most similar cached solution are a second MIP start, next to the heuristic
+                batches, covered = similar
+                batches += construct_batches(dist, {order_id: orders[order_id] for order_id in orders
+                                                    if order_id not in covered}, volume=VOL)
+                if len(batches) <= model._constants['max_n_batches']:
+                    model.NumStart = 2
+                    model.Params.StartNumber = 1
+                    model.set_start(batches)
+                    model.Params.StartNumber = 0
+        with instrumentation.phase('solve'):
+            if MODEL == "set_partitioning":
+                model.optimize()
+            else:
+                model.optimize(abs_gap=MIPGAP, time_limit=TIME_LIMIT, stall_time=STALL_TIME,
+                               instrumentation=instrumentation)
         end = datetime.now()
         duration = end - start
 
@@ -34,11 +117,33 @@ def main():
         model_string += "Number of nodes: " + str(len(model._nodes)) + '\n'
         model_string += "Number of variables: " + str(model.numVars) + '\n'
         model_string += "Number of constraints: " + str(model.numConstrs) + '\n'
-        model_string += "Model duration: " + str(duration) + '\n'
-        model_string += "Model duration seconds: " + str(duration.seconds) + '\n'
+        if MODEL == "set_partitioning":
+            model_string += "Model duration: " + str(duration) + '\n'
+            model_string += "Model duration seconds: " + str(duration.seconds) + '\n'
+            model_string += "Column generation: " + str(model.column_generation_stats()) + '\n'
+        else:
+            model_string += "Model build seconds: " + str(model.build_stats()['seconds']) + '\n'
+            model_string += "Model build peak memory MB: " + str(model.build_stats()['peak_rss_mb']) + '\n'
+            model_string += "Model duration: " + str(duration) + '\n'
+            model_string += "Model duration seconds: " + str(duration.seconds) + '\n'
+            model_string += "Subtour separation: " + str(model.separation_stats()) + '\n'
+        if reduction is not None:
+            model_string += "Preprocessing: " + str(reduction.stats) + '\n'
+        model_string += "Phases: \n" + instrumentation.summary()
         model_string += "Model batches: \n"
         model_string += model.solution_batches()
         model_string += '\n'
+        if reduction is not None:
+            plan = Plan([reduction.expand_batch(batch, orders) for batch in model.solution().batches])
+        else:
+            plan = model.solution(orders)
+        if cache is not None:
+            with instrumentation.phase('cache'):
+                cache.put(key, orders, VOL, plan.batches, objective=model.ObjVal, bound=model.ObjBound,
+                          optimal=model.Status == gp.GRB.OPTIMAL, seconds=duration.total_seconds(),
+                          model=model if CACHE_MODELS and MODEL != "set_partitioning" else None)
+            model_string += "Cache: " + str(cache.stats) + '\n'
+        model_string += write_plan(plan, n_picks, instrumentation)
         file_string += model_string
         print(model_string)
 
@@ -46,5 +151,15 @@ def main():
     with open(f_name, 'w') as the_file:
         the_file.write(file_string)
 
+
+def write_plan(plan, n_picks, instrumentation):
+    """Writes the plan to PLAN_FILE as .csv and .json and returns a line with its totals."""
+    if PLAN_FILE is None:
+        return str()
+    with instrumentation.phase('export'):
+        plan.write_csv(PLAN_FILE.format(n_picks) + '.csv')
+        plan.write_json(PLAN_FILE.format(n_picks) + '.json')
+    return "Plan: " + str(plan.totals()) + '\n'
+
 if __name__ == '__main__':
     main()
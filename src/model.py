@@ -1,10 +1,16 @@
+import contextlib
 import gurobipy as gp
 import itertools
 import math
+import queue
+import threading
+import time
 
+import numpy as np
 
-NAME_START_NODE = "F-20-28"
-NAME_END_NODE = "F-20-27"
+from heuristic import BatchingInstance
+from infrastructure import NAME_START_NODE, NAME_END_NODE, Batch, Plan, distance_submatrix
+from instrumentation import peak_rss_mb
 
 
 def _max_order_size(orders):
@@ -16,149 +22,221 @@ def _max_order_size(orders):
     return max_order_size
 
 def _subtourelim(model, where):
-    """This function adds a subtour constraint to model if one exists."""
+    """This function adds subtour constraints to model for every subtour that exists.
+
+    At MIPSOL, every connected component of the used edges of a batch which does not hold the
+    start and end node is a subtour, and is cut off in every batch (constraints 4 in the
+    Technical Documentation.pdf). A solution without subtours that improves the incumbent is
+    passed to the on_incumbent function and the channel of optimize, as batches. At MIPNODE, a
+    better plan of another solve is taken from the channel and, if the model is optimized with
+    fractional_cuts, the fractional solution of every batch is separated with minimum cuts as well. If the model
+    is optimized with an Instrumentation, the incumbent and the bound are recorded at MIPSOL and MIP.
+    At MIP, the channel gets the incumbent and the bound, and the optimization is stopped if the
+    incumbent did not improve for stall_time seconds.
+    """
     if where == gp.GRB.callback.MIPSOL:
-        # for every batch, make a list of used edges
-        used_edges = [[] for i in range(model._constants['max_n_batches'])]
-        for batch_k in range(model._constants['max_n_batches']):
-            batch_k_vars = list()
-            for i in range(len(model._nodes)-1):
-                for j in range(i+1, len(model._nodes)):                
-                    var = model._vars['x', batch_k, model._nodes[i], model._nodes[j]]
-                    batch_k_vars.append(var)
-            sol_batch_k = model.cbGetSolution(batch_k_vars)
-            sol_batch_k_index = 0
-            for i in range(len(model._nodes)-1):
-                for j in range(i+1, len(model._nodes)):
-                    if sol_batch_k[sol_batch_k_index] > 0.5:
-                        used_edges[batch_k].append((model._nodes[i], model._nodes[j]))
-                    sol_batch_k_index += 1
-
-        # for every batch, make a list of used nodes
-        used_nodes = [[] for i in range(model._constants['max_n_batches'])]
-        for batch_k in range(model._constants['max_n_batches']):
-            for node in model._nodes:
-                var = model._vars['B', batch_k, node]
-                if model.cbGetSolution(var) > 0.5: # then node is used
-                    used_nodes[batch_k].append(node)
-
-            # only nodes where items are picked have been added to used_nodes[batch_k]
-            if len(used_nodes[batch_k]) > 0: # if picks in batch_k, then start and end nodes as well
-                used_nodes[batch_k].append(NAME_START_NODE)
-                used_nodes[batch_k].append(NAME_END_NODE)
-
-        # all necessary info is now attained in order to find subtours
-        # time to add constraints to prohibit the subtours
-        # this the necessary constraints of constraints 4 in the Technical Documentation.pdf
-        for batch_k in range(model._constants['max_n_batches']):
-            if len(used_nodes[batch_k]) > 0: # then check/correct the check the cycle
-                # function subtour finds the shortest cycle per batch
-                tour = _subtour(used_edges[batch_k])
-                if tour != None and len(tour) < len(used_nodes[batch_k]): # then a subtour exists
-                    # TODO: Should we keep this print. Might be nice to have to see that 
-                    # the model is still running.
-                    
-                    # adding this subtour constraint for every batch
-                    # so that the same subtour isn't just created in another batch
-                    for batch in range(model._constants['max_n_batches']):
-                        expr = 0
-                        for node_i, node_j in tour:
-                            expr += model._vars['x', batch, node_i, node_j]
-                        model.cbLazy(expr <= len(tour)-1)
-
-def _subtour(edges):
-    """Given a list of edges, finds the shortest subtour
+        separation_start = time.perf_counter()
+        # all edge values in one call, row k holds the edges of batch k
+        values = np.array(model.cbGetSolution(model._x_list)).reshape(-1, len(model._edges))
+
+        # components are the same for all batches that use them, only cut each of them once
+        subtours = set()
+        for batch_k in range(values.shape[0]):
+            used = np.flatnonzero(values[batch_k] > 0.5)
+            if len(used) > 0:
+                subtours.update(_subtour_components(len(model._nodes), model._edge_i[used], model._edge_j[used],
+                                                    model._depot))
+
+        # adding the subtour constraint for every batch
+        # so that the same subtour isn't just created in another batch
+        for subtour in subtours:
+            for batch in range(values.shape[0]):
+                model.cbLazy(model._inner_edges_expr(batch, subtour) <= len(subtour)-1)
+
+        model._separation_stats['mipsol_callbacks'] += 1
+        model._separation_stats['lazy_cuts'] += len(subtours) * values.shape[0]
+        model._separation_stats['seconds'] += time.perf_counter() - separation_start
+
+        # a solution without subtours that is better than the incumbent becomes the new incumbent
+        objective = model.cbGet(gp.GRB.callback.MIPSOL_OBJ)
+        if len(subtours) == 0 and objective < model.cbGet(gp.GRB.callback.MIPSOL_OBJBST) - 1e-6:
+            model._last_improvement = model.cbGet(gp.GRB.callback.RUNTIME)
+            if model._on_incumbent is not None or model._channel is not None:
+                y_values = np.array(model.cbGetSolution(model._y_list)).reshape(-1, len(model._orders))
+                batches = model._decode_batches(dict(enumerate(values)), dict(enumerate(y_values)))
+                incumbent = {'runtime': model._last_improvement, 'objective': objective,
+                             'bound': model.cbGet(gp.GRB.callback.MIPSOL_OBJBND),
+                             'batches': list(batches.values())}
+                if model._on_incumbent is not None:
+                    model._on_incumbent(incumbent)
+                if model._channel is not None:
+                    model._channel.publish(incumbent)
+        if model._instrumentation is not None:
+            model._instrumentation.progress(model.cbGet(gp.GRB.callback.RUNTIME),
+                                            model.cbGet(gp.GRB.callback.MIPSOL_OBJBST),
+                                            model.cbGet(gp.GRB.callback.MIPSOL_OBJBND))
+
+    elif where == gp.GRB.callback.MIPNODE:
+        if model._channel is not None:
+            # a better plan of another solve, gurobi checks it against the lazy constraints
+            batches = model._channel.fetch()
+            if batches is not None and len(batches) <= model._constants['max_n_batches']:
+                solution = model._solution_values(model._indexed_batches(batches))
+                model.cbSetSolution(list(solution), list(solution.values()))
+                model.cbUseSolution()
+        if not model._fractional_cuts or model.cbGet(gp.GRB.callback.MIPNODE_STATUS) != gp.GRB.OPTIMAL:
+            return
+        separation_start = time.perf_counter()
+        n_batches = model._constants['max_n_batches']
+        x_values = np.array(model.cbGetNodeRel(model._x_list)).reshape(n_batches, len(model._edges))
+        B_values = np.array(model.cbGetNodeRel(model._B_list)).reshape(n_batches, len(model._nodes))
+
+        n_cuts = 0
+        for batch in range(n_batches):
+            for subtour, node_m in _fractional_subtours(model, x_values[batch], B_values[batch]):
+                # generalized subtour constraint, x(E(S)) <= sum of B_i in S - B_m
+                expr = model._inner_edges_expr(batch, subtour)
+                expr.add(gp.LinExpr([1.0] * len(subtour), [model._B[batch, i] for i in subtour]), -1.0)
+                model.cbCut(expr + model._B[batch, node_m] <= 0)
+                n_cuts += 1
+
+        model._separation_stats['mipnode_callbacks'] += 1
+        model._separation_stats['user_cuts'] += n_cuts
+        model._separation_stats['seconds'] += time.perf_counter() - separation_start
+
+    elif where == gp.GRB.callback.MIP:
+        runtime = model.cbGet(gp.GRB.callback.RUNTIME)
+        if model._instrumentation is not None:
+            model._instrumentation.progress(runtime, model.cbGet(gp.GRB.callback.MIP_OBJBST),
+                                            model.cbGet(gp.GRB.callback.MIP_OBJBND))
+        if model._channel is not None:
+            model._channel.progress(runtime, model.cbGet(gp.GRB.callback.MIP_OBJBST),
+                                    model.cbGet(gp.GRB.callback.MIP_OBJBND))
+        # stop when the incumbent has not improved for stall_time seconds
+        if (model._stall_time is not None and model.cbGet(gp.GRB.callback.MIP_SOLCNT) > 0
+                and runtime - model._last_improvement > model._stall_time):
+            model._stalled = True
+            model.terminate()
+
+
+def _subtour_components(n_nodes, edge_i, edge_j, depot):
+    """Finds the connected components of a graph that do not contain a depot node.
 
     Args:
-        edges (:obj: `list`): list of edges. Each edge is written as a tuple (node_i, node_j)
-                              where node_i and node_j are strings, eg. ('F-20-28', 'F-20-27')
+                   n_nodes (int): number of nodes, nodes are 0, ..., n_nodes-1.
+        edge_i, edge_j (:obj: `ndarray`): the edges (edge_i[e], edge_j[e]) of the graph.
+               depot (:obj: `tuple`): depot nodes, ie the start and the end node.
 
     Returns:
-        shortest_cycle (:obj: `list`): list of all the egdes in the shortest cycle, 
-                                       or None if no cycle exists.
-    
-    Note: algorithm assumes the edges are tuples with int nodes, eg (node_i, node_j) is (1, 3)  
-        where node_i and node_j are in range(0,n_nodes). As a consequence, the edges are converted
-        using a look up dicts node_to_num and num_to_node 
+        subtours (:obj: `list`): one tuple of sorted nodes for every component with edges that
+                                 does not contain a depot node.
     """
-    nodes = set()
-    for node_i, node_j in edges:
-        nodes.add(node_i)
-        nodes.add(node_j)
-
-
-    n_nodes = len(nodes)
-
-    # Convert node names to ints, because of alg
-    num_to_node = dict()
-    node_to_num = dict()
-    for i, node in enumerate(nodes):
-        num_to_node[i] = node
-        node_to_num[node] = i
-
-    edges_nums = list()
-    for node_i, node_j in edges:
-        edge_nums = node_to_num[node_i], node_to_num[node_j]
-        edges_nums.append(edge_nums)
-
-    # algorithm; detecting cycles
-    visited = [False]*n_nodes
-    cycles = []
-    lengths = []
-    selected = [[] for i in range(n_nodes)]
-    for x,y in edges_nums:
-        selected[x].append(y)
-    while True:
-        current = visited.index(False)
-        thiscycle = [current]
-        while True:
-            visited[current] = True
-            neighbors = [x for x in selected[current] if not visited[x]]
-            if len(neighbors) == 0:
-                break
-            current = neighbors[0]
-            thiscycle.append(current)
-        cycles.append(thiscycle)
-        lengths.append(len(thiscycle))
-        if sum(lengths) == n_nodes:
-            break
-        break
-
-    # Delete to short cycles
-    indices_to_short_cycles = list()
-    for i in range(len(cycles)):
-        if len(cycles[i]) < 2:
-            indices_to_short_cycles.append(i)
-    for i in indices_to_short_cycles:
-        cycles.pop(i)
-        lengths.pop(i)
-
-    # return None if no cycles
-    if len(cycles) is 0:
-        return None
-    
-    # Convert back to original node names
-    shortest_cycle_nums = cycles[lengths.index(min(lengths))]
-    shortest_cycle_nodes = list()
+    # union-find with path halving
+    parent = list(range(n_nodes))
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for i, j in zip(edge_i.tolist(), edge_j.tolist()):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[root_i] = root_j
 
-    for node_num_i in shortest_cycle_nums:
-        node = num_to_node[node_num_i]
-        shortest_cycle_nodes.append(node)
+    components = dict()
+    for node in set(edge_i.tolist()) | set(edge_j.tolist()):
+        components.setdefault(find(node), []).append(node)
 
-    # Repeat first node again, to make it start and finish
-    shortest_cycle_nodes.append(shortest_cycle_nodes[0])
+    depot_roots = {find(node) for node in depot}
+    return [tuple(sorted(nodes)) for root, nodes in components.items() if root not in depot_roots]
 
-    # Convert back to list of edges
-    shortest_cycle_edges = list()
-    for i in range(len(shortest_cycle_nodes)-1):
-        if (shortest_cycle_nodes[i], shortest_cycle_nodes[i+1]) in edges:
-            egde = shortest_cycle_nodes[i], shortest_cycle_nodes[i+1]
-            shortest_cycle_edges.append(egde)
-        else:
-            edge = shortest_cycle_nodes[i+1], shortest_cycle_nodes[i]
-            shortest_cycle_edges.append(egde)
 
-    return shortest_cycle_edges
+def _fractional_subtours(model, x_values, B_values, tolerance=1e-4):
+    """Separates generalized subtour constraints from a fractional solution of one batch.
+
+    For every node m with B_m > 0, the minimum cut between the depot and m in the graph with
+    capacities x is computed. If the cut is less than 2 B_m, the side S of m violates
+    x(delta(S)) >= 2 B_m.
+
+    Args:
+        x_values (:obj: `ndarray`): value of x for every edge in model._edges.
+        B_values (:obj: `ndarray`): value of B for every node.
+
+    Returns:
+        subtours (:obj: `list`): (S, m) for every violated constraint, S a tuple of nodes.
+    """
+    support = np.flatnonzero(x_values > tolerance)
+    if len(support) == 0:
+        return []
+
+    # capacity graph, the depot nodes are contracted into one source node
+    source = model._depot[0]
+    contract = {node: source for node in model._depot}
+    capacity = dict()
+    for e in support.tolist():
+        i, j = model._edges[e]
+        i, j = contract.get(i, i), contract.get(j, j)
+        if i == j:
+            continue
+        capacity.setdefault(i, {})
+        capacity.setdefault(j, {})
+        capacity[i][j] = capacity[i].get(j, 0.0) + x_values[e]
+        capacity[j][i] = capacity[j].get(i, 0.0) + x_values[e]
+    if source not in capacity:
+        capacity[source] = {}
+
+    subtours = []
+    separated = set()
+    candidates = [node for node in capacity if node != source and B_values[node] > tolerance]
+    for node_m in sorted(candidates, key=lambda node: -B_values[node]):
+        if node_m in separated:
+            continue
+        cut_value, sink_side = _min_cut(capacity, source, node_m)
+        if cut_value < 2 * B_values[node_m] - tolerance:
+            subtour = tuple(sorted(sink_side))
+            subtours.append((subtour, node_m))
+            separated.update(subtour)
+    return subtours
+
+
+def _min_cut(capacity, source, sink):
+    """Minimum source-sink cut of an undirected graph (Edmonds-Karp).
+
+    Args:
+        capacity (:obj: `dict`): capacity[i][j] is the capacity of edge (i, j), symmetric.
+
+    Returns:
+        cut_value (float): capacity of the minimum cut.
+        sink_side (:obj: `set`): nodes on the sink side of the cut.
+    """
+    flow = {node: dict.fromkeys(neighbours, 0.0) for node, neighbours in capacity.items()}
+    cut_value = 0.0
+    while True:
+        # breadth first search for an augmenting path in the residual graph
+        previous = {source: None}
+        queue = [source]
+        for node in queue:
+            for neighbour, cap in capacity[node].items():
+                if neighbour not in previous and cap - flow[node][neighbour] > 1e-9:
+                    previous[neighbour] = node
+                    queue.append(neighbour)
+            if sink in previous:
+                break
+        if sink not in previous:
+            return cut_value, set(capacity) - set(previous)
+
+        path = []
+        node = sink
+        while previous[node] is not None:
+            path.append((previous[node], node))
+            node = previous[node]
+        augment = min(capacity[i][j] - flow[i][j] for i, j in path)
+        for i, j in path:
+            flow[i][j] += augment
+            flow[j][i] -= augment
+        cut_value += augment
 
 
 class Model(gp.Model):
@@ -167,39 +245,82 @@ class Model(gp.Model):
     Attributes:
         gurobi_model (:obj: `gurobipy.Model`): This attribute holds all the information about variables
                                                and solution the optimization problem.
-                          _vars (:obj: `dict`): Dictionary with all gurobi.Model variabels.
-                                               key: name and item: gurobi.Model var.
-                                               eg. __vars['x', 'superscript1', 'subscript1', 'subscript2'] 
+                      _nodes (:obj: `list`): node names (str), the variables are indexed by the position
+                                             of a node in this list. _nodes[0] is NAME_START_NODE and
+                                             _nodes[1] is NAME_END_NODE.
+                     _orders (:obj: `list`): order ids, the variables are indexed by the position
+                                             of an order in this list.
+                _order_nodes (:obj: `list`): _order_nodes[o] is the sorted list of node indices where order o
+                                             has picks, ie the non-zero entries of the constant S.
+                      _edges (:obj: `list`): all undirected edges (i, j), i < j, as node indices.
+               _distances (:obj: `ndarray`): _distances[i, j] between node i and node j.
+            _x, _y, _b, _B (:obj: `tupledict`): gurobi variables, _x[k, i, j], _y[k, o], _b[k] and _B[k, i]
+                                             where k is a batch, o an order and i, j are nodes.
+                      _depot (:obj: `tuple`): node indices of NAME_START_NODE and NAME_END_NODE.
+                          _vars (:obj: `dict`): Dictionary with all the tupledicts above.
+                                               key: variable name and item: tupledict.
+                                               eg. _vars['x'][superscript1, subscript1, subscript2]
                                                    is gurobi_model variable
-                     constants (:obj: `dict`): Dictionary with all the constants, ie S.
+                     constants (:obj: `dict`): Dictionary with all the constants, ie VOL and max_n_batches.
                                                key: name and item: value (int)
-                                               eg. constants['S', 'superscript1', 'subscript1', 'subscript2'] 
-                                                   is binary
     
     Note:
         Objective function coefficients are set when variable are set.
         Superscripts are used before subscripts when indexing in dicts.
     """
 
-    def __init__(self, dist, orders, volume=6, max_n_batches=None):
+    def __init__(self, dist, orders, volume=6, max_n_batches=None, names=False, excluded_edges=None,
+                 symmetry_breaking=True):
         """
         Args:
             orders (:obj:`dict` of :obj:`infrastructure.Order`): Dict with all orders.
                                                                  key: order_id, item: list of infrastructure.Order.
                                             dist (:obj: `dict`): dict of shortest distances, 
-                                                                 between node i and node j, dist['i']['j'].
+                                                                 between node i and node j, dist['i']['j'],
+                                                                 or a infrastructure.DistanceMatrix.
                                        volume (float, optional): Maximum number of items, ie max volume, that can 
                                                                  fit on a workers tray. If volume is not given (None), 
                                                                  then it will be set to 6 (default).
                                   max_n_batches (int, optional): Maximum number of batches (tours in the warehouse) 
-                                                                 that is allowed. If not given (default), ie None, 
-                                                                 then it will be set to the ceil of the total number 
-                                                                 of orders divided by volume, ie ceil of 
-                                                                 num_orders/volume.
+                                                                 that is allowed. If not given (default), ie None,
+                                                                 then it is set to an upper bound on the number of
+                                                                 batches of an optimal solution, see
+                                                                 _batch_upper_bound.
+                                          names (bool, optional): Give the variables and constraints readable names,
+                                                                 eg. x[0,2,5] and c7[0,2,5], for writing and debugging
+                                                                 the model. Default is False, which builds faster.
+                             excluded_edges (:obj: `set`, optional): edges (node_i, node_j) of node names that
+                                                                 get no x variables, eg. edges that are known not
+                                                                 to be on an optimal route.
+                            symmetry_breaking (bool, optional): Add constraints that remove interchangeable batch
+                                                                 indices, see _set_constraints. Default is True.
         """
+        build_start = time.perf_counter()
+
         # set none gurobi types
         self._nodes, self._n_picks = self._used_nodes(orders)
+        self._node_index = {node: i for i, node in enumerate(self._nodes)}
+        self._orders = list(orders)
+        self._order_nodes = [sorted({self._node_index[pick._warehouse_location] for pick in orders[order_id].picks})
+                             for order_id in self._orders]
+        self._edges = list(itertools.combinations(range(len(self._nodes)), 2))
+        if excluded_edges:
+            excluded = {(self._node_index[i], self._node_index[j]) for i, j in excluded_edges
+                        if i in self._node_index and j in self._node_index}
+            excluded |= {(j, i) for i, j in excluded}
+            self._edges = [edge for edge in self._edges if edge not in excluded]
+        self._edge_i = np.array([i for i, j in self._edges], dtype=np.intp)
+        self._edge_j = np.array([j for i, j in self._edges], dtype=np.intp)
+        self._depot = (self._node_index[NAME_START_NODE], self._node_index[NAME_END_NODE])
+        self._dist = dist
+        self._distances = distance_submatrix(dist, self._nodes)
+        self._heuristic = None
+        self._frozen = dict() # key: batch index fixed by release and item: infrastructure.Batch
         self._constants = self._set_constants(orders, volume, max_n_batches=max_n_batches)
+        self._bound_batches = max_n_batches is None # the batch bound grows with add_orders
+        self._names = names
+        self._symmetry_breaking = symmetry_breaking
+        self._sorted_batches = symmetry_breaking # batch indices are sorted by their lowest order
 
         # set gurobi types
         super().__init__()
@@ -207,6 +328,38 @@ class Model(gp.Model):
         self._set_constraints(orders)
         self.params.LazyConstraints = 1 # lazy constraints are used
 
+        # flat variable lists for reading all values in one callback call, batch-major
+        self._x_list = list(self._x.values())
+        self._y_list = list(self._y.values())
+        self._B_list = list(self._B.values())
+        self._fractional_cuts = False
+        self._separation_stats = _new_separation_stats()
+        self._instrumentation = None
+        self._on_incumbent = None
+        self._channel = None
+        self._stall_time = None
+        self._last_improvement = 0.0
+        self._stalled = False
+        self._fixed_y = [] # y variables fixed by fix_assignments
+        self._start_batches = None # MIP start of the next optimize, set by add_orders
+
+        self._build_stats = {
+            'seconds': time.perf_counter() - build_start,
+            'peak_rss_mb': peak_rss_mb(),
+            'num_vars': self.NumVars,
+            'num_constrs': self.NumConstrs,
+        }
+
+    def build_stats(self):
+        """Returns how long the model took to build and how big it is.
+
+        Returns:
+            stats (:obj: `dict`): 'seconds' (float) spent in __init__, 'peak_rss_mb' (float) peak resident
+                                  memory of the process after the build (None if unknown), 'num_vars' and
+                                  'num_constrs' (int).
+        """
+        return dict(self._build_stats)
+
     def _used_nodes(self, orders):
         """Finds the used nodes and number of picks in the orders input.
         
@@ -218,65 +371,83 @@ class Model(gp.Model):
              nodes (:obj: `list`): list of all node names (str)
                     n_picks (int): total number of picks
         """
-        nodes = list()
-
-        nodes.append(NAME_START_NODE)
-        nodes.append(NAME_END_NODE)
+        nodes = dict.fromkeys([NAME_START_NODE, NAME_END_NODE])
 
         n_picks = 0
 
         for order_id, order in orders.items():
             for pick in order.picks:
-                if pick._warehouse_location not in nodes:
-                    nodes.append(pick._warehouse_location)
-                    n_picks += 1
+                nodes[pick._warehouse_location] = None
+            n_picks += order.num_picks()
 
-        return nodes, n_picks
+        return list(nodes), n_picks
 
     def _set_constants(self, orders, volume, max_n_batches=None):
         """Sets all constant numbers for Model.
         
         Note:
             Convention: superscripts are used before subscripts when indexing in dicts.
+            The constant S, ie S['order_id', 'node'] is 1 if the order has a pick at node, is
+            not stored densely; its non-zero entries are in self._order_nodes.
         
         Args:
                     orders (:obj: `dict`): Dict of all orders.
                                            key: order_id (str) and item: (list of infrastructure.Order)
                            volume (float): Maximum number of orders, ie max volume, that can fit on a workers tray.
             max_n_batches (int, optional): Maximum number of batches (tours in the warehouse) that is allowed. 
-                                           If not given (default), ie None, then it will be set to the ceil of
-                                           the total number of orders divided by volume, 
-                                           ie ceil of num_orders/volume.
+                                           If not given (default), ie None, then it will be set to
+                                           _batch_upper_bound(volume).
         
         Returns:
              nodes (:obj: `dict`): dict with all Model constants
                                    key: constant name and item: value (float)
-                                   ie. constant['S', 'order_id', 'node'] is binary
+                                   min_n_batches is the capacity bound, ie ceil of num_orders/volume.
         """
         constants = dict()
 
         # constant VOL
         constants['VOL'] = volume
 
-        # constant max_n_batches
+        # constant min_n_batches, every batch holds at most volume orders
         num_orders = len(orders)
+        constants['min_n_batches'] = math.ceil(num_orders / volume)
+
+        # constant max_n_batches
         if max_n_batches is None:
-            constants['max_n_batches'] =  num_orders
+            constants['max_n_batches'] = max(self._batch_upper_bound(volume), constants['min_n_batches'])
         else: 
             constants['max_n_batches'] = max_n_batches
 
+        return constants
 
-        # constant S
-        for order_id in orders:
-            for node in self._nodes:
-                constants['S', order_id, node] = 0
-        for order_id, order in orders.items():
-            for pick in order.picks:
-                for node in self._nodes:
-                    if pick._warehouse_location == node:
-                        constants['S', order_id, node] = 1
+    def _batch_upper_bound(self, volume):
+        """Upper bound on the number of batches of an optimal solution.
 
-        return constants
+        Two bounds are combined, both need distances that satisfy the triangle inequality:
+        - Two batches whose orders fit on one tray can be merged into one batch that is not longer.
+          So some optimal solution has at most one batch with volume/2 orders or less, and hence
+          at most num_orders // (volume//2 + 1) + 1 batches.
+        - A batch is at least as long as the walk to the furthest node of any of its orders and
+          back. The shortest such walks of m distinct orders can't be longer in total than the
+          heuristic solution, which bounds m.
+
+        Args:
+            volume (float): Maximum number of orders in a batch.
+
+        Returns:
+            max_n_batches (int): the smaller of the two bounds, at most the number of orders.
+        """
+        num_orders = len(self._orders)
+        merge_bound = int(num_orders // (volume // 2 + 1)) + 1
+
+        start, end = self._depot
+        through_node = self._distances[start] + self._distances[:, end]
+        order_bounds = np.sort([through_node[nodes].max() + self._distances[end, start]
+                                for nodes in self._order_nodes if len(nodes) > 0])
+        upper = sum(batch.distance for batch in self._construct(volume))
+        cost_bound = int(np.searchsorted(np.cumsum(order_bounds), upper, side='right'))
+
+        return min(num_orders, merge_bound, cost_bound)
 
     def _set_variables(self, dist, orders):
         """Initialise all the gurobi variables, and their objective function coefficients.
@@ -286,6 +457,7 @@ class Model(gp.Model):
             Default objective value is zero, and will remain so if not other is specified.
             Assuming an undirected graph, is i.e. x_i_j^k equals x_j_i^k (walking direction
             does not matter). Hence we only use x_i_j^k and not x_j_i^k.
+            Variables are added in bulk with addVars, and indexed by integers, see Model.
         
         Args:
               dist (:obj: `dict`): Dict with distances between nodes, eg dist['node_id_i']['node_id_j']
@@ -294,44 +466,41 @@ class Model(gp.Model):
         
         Returns:
             _vars (:obj: `dict`): Dictionary of variables.
-                                 key: id for variable, item: gurobi_model variable
-                                 eg. _vars['x', 'superscript1', 'subscript1', 'subscript2'] is gurobipy variable
+                                 key: variable name and item: tupledict of gurobi_model variables
+                                 eg. _vars['x'][superscript1, subscript1, subscript2] is gurobipy variable
         """
-        _vars = dict()
+        batches = range(self._constants['max_n_batches'])
+        edge_costs = self._distances[self._edge_i, self._edge_j].astype(float).tolist()
 
         # variable: x
-        for batch_k in range(self._constants['max_n_batches']):
-            for i, node_i in enumerate(self._nodes):
-                for node_j in self._nodes[(i+1):]:
-                    name = 'x' + '^' + str(batch_k) + '_' + node_i + '_' + node_j
-                    _vars['x', batch_k, node_i, node_j] = super().addVar(obj=dist[node_i][node_j],
-                                                                         vtype=gp.GRB.BINARY,
-                                                                         name=name) 
+        x_keys = [(batch_k, i, j) for batch_k in batches for i, j in self._edges]
+        self._x = super().addVars(x_keys, obj=edge_costs * len(batches), vtype=gp.GRB.BINARY,
+                                  name=self._name('x'))
 
         # variable: y
-        for order in orders:
-            for batch in range(self._constants['max_n_batches']):
-                name = 'y' + '^' + str(batch) + '_' + str(order)
-                _vars['y', batch, order] = super().addVar(vtype=gp.GRB.BINARY, name=name)
+        self._y = super().addVars(batches, range(len(self._orders)), vtype=gp.GRB.BINARY, name=self._name('y'))
 
         # variable: b
-        for batch in range(self._constants['max_n_batches']):
-            name = 'b' + '_' + str(batch)
-            _vars['b', batch] = super().addVar(vtype=gp.GRB.BINARY, name=name)
+        self._b = super().addVars(batches, vtype=gp.GRB.BINARY, name=self._name('b'))
 
         # variable: B
-        for batch in range(self._constants['max_n_batches']):
-            for node in self._nodes:
-                name = 'B' + '^' + str(batch) + '_' + node
-                _vars['B', batch, node] = super().addVar(vtype=gp.GRB.BINARY, name=name)
+        self._B = super().addVars(batches, range(len(self._nodes)), vtype=gp.GRB.BINARY, name=self._name('B'))
 
         super().update() # update gurobi model with all vars
 
-        return _vars
+        return {'x': self._x, 'y': self._y, 'b': self._b, 'B': self._B}
 
     def _set_constraints(self, orders, v_a=1):
         """Initialise all the gurobi constraints apart from the subtour constraint
 
+        Note:
+            Constraint 7 is only added where S is 1; where S is 0 it reads B >= 0, which
+            always holds for binary B.
+            With symmetry breaking, batches are opened in order (b_k >= b_k+1), an open batch holds
+            an order, and batches are sorted by their lowest order index: order o can only be in
+            batch k if batch k-1 holds an order before o, so y_k_o = 0 for k > o. At least
+            min_n_batches batches are used.
+
         Args:
             orders (:obj: `dict`): Dict of all orders.
                                    key: order_id (str) and item: (list of infrastructure.Order)
@@ -340,52 +509,78 @@ class Model(gp.Model):
         Returns:
             None: it serves as a void function where all the constraint are being set in the Gurobi model
         """
-        for batch in range(self._constants['max_n_batches']):
-            # Constraint 5 in the Technical Documentation.pdf, "Volume Constraint"
-            name = "constraint:" + '5' + ", batch: " + str(batch)
-            constraint = \
-                sum(v_a * self._vars['y', batch, order] for order in orders) \
-                <= self._vars['b', batch] * self._constants['VOL']
-            super().addConstr(constraint, name)
-            
-            # Constraint 3 in the Technical Documentation.pdf, "End to start constraint"
-            name = "constraint:" + '3' + ", batch: " + str(batch)
-            constraint = self._vars['x', batch, NAME_START_NODE, NAME_END_NODE] == self._vars['b', batch]
-            super().addConstr(constraint, name)
-
-            # Constraint 2 in the Technical Documentation.pdf, "Enter and leave constraint"
-            node_i = 1
-            number_nodes = len(self._nodes)
-            for node in self._nodes:
-                name = "constraint:" + '2' + ", batch: " + str(batch) + ", node: " + str(node)
-                constraint = \
-                    sum(self._vars['x', batch, node_l, self._nodes[node_i]] for node_l in self._nodes[:(node_i)]) \
-                    + sum(self._vars['x', batch, self._nodes[node_i], node_j] for node_j in self._nodes[(node_i+1):]) \
-                    == 2 * self._vars['B', batch, self._nodes[node_i]]
-                super().addConstr(constraint, name)
-                
-                node_i += 1
-                if (node_i >= number_nodes):
-                    node_i = node_i - 1
-
-        for order in orders:
-            # Constraint 6 in the Technical Documentation.pdf, "Pick all orders"
-            name = "constraint:" + '6' + ", order: " + str(order)
-            constraint = sum(self._vars['y', batch_k, order] for batch_k in range(self._constants['max_n_batches'])) == 1
-            super().addConstr(constraint, name)
-            #super().update()
-
-            # Constraint 7 in the Technical Documentation.pdf, "Visit node in batch"
-            for batch in range(self._constants['max_n_batches']):
-                for node in self._nodes:
-                    name = "constraint:" + '7' + ", order: " + str(order) + ", batch: " + str(batch) + ", node: " + str(node)
-                    constraint = \
-                        self._vars['B', batch, node] >= self._vars['y', batch, order] * self._constants['S', order, node]
-                    super().addConstr(constraint, name)
+        batches = range(self._constants['max_n_batches'])
+        order_range = range(len(self._orders))
+        n_nodes = len(self._nodes)
+        start, end = self._node_index[NAME_START_NODE], self._node_index[NAME_END_NODE]
+        self._v_a = v_a
+
+        # edges at every node, so that the degree expressions are built in one pass over the edges
+        node_edges = [[] for i in range(n_nodes)]
+        for i, j in self._edges:
+            node_edges[i].append((i, j))
+            node_edges[j].append((i, j))
+
+        # Constraint 5 in the Technical Documentation.pdf, "Volume Constraint"
+        self._c5 = super().addConstrs(
+            (gp.LinExpr([v_a] * len(self._orders), [self._y[batch, order] for order in order_range])
+             <= self._constants['VOL'] * self._b[batch] for batch in batches),
+            name=self._name('c5'))
+
+        # Constraint 3 in the Technical Documentation.pdf, "End to start constraint"
+        super().addConstrs((self._x[batch, start, end] == self._b[batch] for batch in batches),
+                           name=self._name('c3'))
+
+        # Constraint 2 in the Technical Documentation.pdf, "Enter and leave constraint"
+        # every node apart from the start node, which is connected by constraint 3
+        self._c2 = super().addConstrs(
+            (gp.LinExpr([1.0] * len(node_edges[node]), [self._x[batch, i, j] for i, j in node_edges[node]])
+             == 2 * self._B[batch, node] for batch in batches for node in range(1, n_nodes)),
+            name=self._name('c2'))
+
+        # Constraint 6 in the Technical Documentation.pdf, "Pick all orders"
+        self._c6 = super().addConstrs((self._y.sum('*', order) == 1 for order in order_range), name=self._name('c6'))
+
+        # Constraint 7 in the Technical Documentation.pdf, "Visit node in batch"
+        super().addConstrs((self._B[batch, node] >= self._y[batch, order]
+                            for order in order_range for batch in batches for node in self._order_nodes[order]),
+                           name=self._name('c7'))
+
+        if self._symmetry_breaking:
+            self._set_symmetry_constraints()
 
         super().update() # update gurobi model with all constraints
 
-    def optimize(self, MIPGap=None):
+    def _set_symmetry_constraints(self):
+        """Adds the batch count bound and the symmetry breaking constraints, see _set_constraints."""
+        n_batches = self._constants['max_n_batches']
+        order_range = range(len(self._orders))
+
+        self._min_batches = super().addConstr(self._b.sum() >= self._constants['min_n_batches'],
+                                              name=self._name('min_batches'))
+        self._open_in_order = super().addConstrs(
+            (self._b[batch] >= self._b[batch + 1] for batch in range(n_batches - 1)),
+            name=self._name('open_in_order'))
+        self._open_not_empty = super().addConstrs(
+            (self._b[batch] <= self._y.sum(batch, '*') for batch in range(n_batches)),
+            name=self._name('open_not_empty'))
+
+        # batch k holds orders k, k+1, ... only
+        fixed = [self._y[batch, order] for batch in range(n_batches) for order in order_range if order < batch]
+        super().setAttr('UB', fixed, [0.0] * len(fixed))
+
+        # the lowest order of batch k comes after the lowest order of batch k-1
+        self._lowest_order = super().addConstrs(
+            (self._y[batch, order] <= gp.LinExpr([1.0] * order, [self._y[batch - 1, p] for p in range(order)])
+             for batch in range(1, n_batches) for order in order_range if order >= batch),
+            name=self._name('lowest_order'))
+
+    def _name(self, name):
+        """Returns name if the model is built with names, else an empty name."""
+        return name if self._names else ''
+
+    def optimize(self, MIPGap=None, fractional_cuts=False, warm_start=True, instrumentation=None, fix_share=0.0,
+                 time_limit=None, abs_gap=None, stall_time=None, on_incumbent=None, channel=None, lower_bound=None):
         """Overwrite optimize function, so that subtour constraints is used.
 
         Args:
@@ -395,27 +590,543 @@ class Model(gp.Model):
                                       The MIP solver will terminate (with an optimal result) when 
                                       the gap between the lower and upper objective bound is less than 
                                       MIPGap times the absolute value of the upper bound.
+            fractional_cuts (bool, optional): Also separate subtours of fractional solutions at MIPNODE,
+                                      with minimum cuts. Default is False, ie only integer solutions
+                                      are separated.
+            warm_start (bool, optional): Give gurobi the batches of heuristic_batches() as MIP start,
+                                      or, after add_orders or release, the last incumbent completed
+                                      with the new orders. With fix_share, always the heuristic batches
+                                      and the frozen batches, which agree with the fixed orders.
+                                      Default is True.
+            instrumentation (:obj: `Instrumentation`, optional): records the warm start as phase
+                                      'warm_start', the incumbent and bound over time, and the
+                                      separation_stats() as section 'separation'.
+            fix_share (float, optional): Share of the heuristic batches, those with the shortest route per
+                                      order first, whose orders are fixed to their batch. This solves a
+                                      smaller problem, which may not be optimal. Default is 0, nothing fixed.
+                                      Batches frozen by release are never fixed or freed.
+            time_limit (float, optional): Wall-clock seconds of the solve, gurobi's TimeLimit for this solve
+                                      only. Default is the TimeLimit of the model, no limit unless set.
+            abs_gap (float, optional): Stop when the incumbent is at most this many millimetres longer than the
+                                      bound, gurobi's MIPGapAbs for this solve only. Default is the MIPGapAbs
+                                      of the model, gurobi's default unless set.
+            stall_time (float, optional): Stop when the incumbent has not improved for this many seconds.
+                                      Default is None, never.
+            on_incumbent (callable, optional): Called with every new incumbent, a dict with 'runtime',
+                                      'objective', 'bound' and 'batches' (list of infrastructure.Batch
+                                      with orders, route and distance set), from within the solve.
+                                      See also iter_incumbents.
+            channel (optional): Shares incumbents with solves in other processes, eg. a racing.WorkerChannel:
+                                      channel.publish(incumbent) gets every new incumbent as on_incumbent,
+                                      channel.progress(runtime, objective, bound) the progress at MIP, and
+                                      channel.fetch() returns a better plan of another solve (list of
+                                      infrastructure.Batch) or None, which is passed to gurobi at MIPNODE.
+            lower_bound (int, optional): A valid lower bound on the objective, eg. from bounding.lower_bound.
+                                      Stop as soon as the incumbent is at most abs_gap longer than it, gurobi's
+                                      BestObjStop for this solve only, even if gurobi's own bound is weaker.
+                                      Default is None.
         """
         if MIPGap is not None:
             self.Params.MIPGap = MIPGap
-        super().optimize(_subtourelim)
+        # the parameters of the arguments hold for this solve only, the old values are restored after it
+        solve_params = {'TimeLimit': time_limit, 'MIPGapAbs': abs_gap,
+                        'PreCrush': 1 if fractional_cuts else None} # user cuts must be valid for the presolved model
+        solve_params = {name: value for name, value in solve_params.items() if value is not None}
+        old_params = {name: self.getParamInfo(name)[2] for name in solve_params}
+        for name, value in solve_params.items():
+            self.setParam(name, value)
+        if lower_bound is not None:
+            old_params['BestObjStop'] = self.getParamInfo('BestObjStop')[2]
+            self.Params.BestObjStop = lower_bound + self.Params.MIPGapAbs
+        self._fractional_cuts = fractional_cuts
+        self._separation_stats = _new_separation_stats()
+        self._instrumentation = instrumentation
+        self._on_incumbent = on_incumbent
+        self._channel = channel
+        self._stall_time = stall_time
+        self._last_improvement = 0.0
+        self._stalled = False
+        if fix_share > 0 or len(self._fixed_y) > 0:
+            self.fix_assignments(self.heuristic_batches(), share=fix_share)
+        if warm_start:
+            with instrumentation.phase('warm_start') if instrumentation is not None else contextlib.nullcontext():
+                if self._start_batches is not None and fix_share == 0:
+                    self._set_indexed_start(self._start_batches)
+                else:
+                    batches = self.heuristic_batches()
+                    if len(batches) <= self._constants['max_n_batches'] - len(self._frozen):
+                        self.set_start(batches)
+        self._start_batches = None
+        try:
+            super().optimize(_subtourelim)
+        finally:
+            for name, value in old_params.items():
+                self.setParam(name, value)
+        if instrumentation is not None:
+            if self.SolCount > 0:
+                instrumentation.progress(self.Runtime, self.ObjVal, self.ObjBound, force=True)
+            instrumentation.record('separation', self.separation_stats())
+            if self._stalled:
+                instrumentation.event('stalled', runtime=self.Runtime, stall_time=stall_time)
+            self._instrumentation = None
+        self._on_incumbent = None
+        self._channel = None
 
-    def solution_batches(self):
-        """Temporary function until nice print function is made."""
-        solution = super().getAttr('x', self._vars)
-        used_nodes = [[] for i in range(self._constants['max_n_batches'])]
+    def iter_incumbents(self, **options):
+        """Solves the model in a background thread and yields every new incumbent as it is found.
 
-        results_string = str()
+        Args:
+            options: arguments of optimize, eg. time_limit, abs_gap or stall_time.
 
-        for batch in range(self._constants['max_n_batches']):
-            for node in self._nodes:
-                if solution['B', batch, node] > 0.5:
-                    used_nodes[batch].append(node)
+        Yields:
+            incumbent (:obj: `dict`): 'runtime', 'objective', 'bound' and 'batches', see optimize.
 
-            results_string += 'batch: ' + str(batch) + '\t'
-            results_string += 'items: ' + str(used_nodes[batch])
-            results_string += '\n'
+        Example:
+        >>> for incumbent in model.iter_incumbents(time_limit=60, stall_time=10):
+        ...     release(incumbent['batches'])
+        """
+        incumbents = queue.Queue()
+        done = object()
+        errors = []
+
+        def solve():
+            try:
+                self.optimize(on_incumbent=incumbents.put, **options)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                incumbents.put(done)
 
+        thread = threading.Thread(target=solve, daemon=True)
+        thread.start()
+        try:
+            while True:
+                incumbent = incumbents.get()
+                if incumbent is done:
+                    break
+                yield incumbent
+        finally:
+            # the caller stopped early, eg. with break
+            if thread.is_alive():
+                self.terminate()
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+
+    def heuristic_batches(self):
+        """Batches of the constructive heuristic (heuristic.construct_batches) for the orders of the model
+        that are not in a batch frozen by release.
+
+        Returns:
+            batches (:obj: `list`): list of infrastructure.Batch, with orders, route and distance set.
+        """
+        return list(self._construct(self._constants['VOL']))
+
+    def _construct(self, volume):
+        """Returns the batches of the constructive heuristic, computed once until release freezes batches."""
+        if self._heuristic is None:
+            frozen = {order_id for batch in self._frozen.values() for order_id in batch.orders}
+            free = [o for o, order_id in enumerate(self._orders) if order_id not in frozen]
+            instance = BatchingInstance(self._nodes, self._distances, [self._orders[o] for o in free],
+                                        [self._order_nodes[o] for o in free])
+            self._heuristic = [instance.to_batch(batch) for batch in instance.construct(volume)]
+        return self._heuristic
+
+    def set_start(self, batches):
+        """Sets a complete MIP start, ie a start value for every variable, from batches.
+
+        The batches are sorted by their lowest order index, which the symmetry breaking
+        constraints require, and the k-th batch is used for batch index k of the model; the
+        remaining batch indices are unused. After release, batches are the batches of the orders
+        that are not frozen, and take the batch indices that are not frozen, in the same way.
+        If a route uses an excluded edge, the x values of its batch are left undefined, so
+        gurobi completes them.
+
+        Args:
+            batches (:obj: `list`): list of infrastructure.Batch with orders and route set, where
+                                    the route starts in NAME_START_NODE and ends in NAME_END_NODE.
+        """
+        free = self._constants['max_n_batches'] - len(self._frozen)
+        if len(batches) > free:
+            raise ValueError("MIP start has " + str(len(batches)) + " batches, the model allows "
+                             + str(free))
+        self._set_indexed_start(self._indexed_batches(batches))
+
+    def _indexed_batches(self, batches):
+        """Returns the frozen batches and batches, sorted by their lowest order index on the batch
+        indices that are not frozen, as a dict with key: batch index."""
+        order_index = {order_id: o for o, order_id in enumerate(self._orders)}
+        batches = sorted(batches, key=lambda batch: min(order_index[order_id] for order_id in batch.orders))
+        free = [batch_k for batch_k in range(self._constants['max_n_batches']) if batch_k not in self._frozen]
+        indexed = dict(self._frozen)
+        indexed.update(zip(free, batches))
+        return indexed
+
+    def _set_indexed_start(self, batches):
+        """Sets a complete MIP start from batches, a dict with key: batch index (int) and item:
+        infrastructure.Batch, see set_start. All other batch indices are unused."""
+        start = self._solution_values(batches)
+        super().setAttr('Start', list(start), list(start.values()))
+
+    def _solution_values(self, batches):
+        """Returns the value of every variable in the solution of batches, a dict with key: batch
+        index (int) and item: infrastructure.Batch, as a dict with key: variable."""
+        order_index = {order_id: o for o, order_id in enumerate(self._orders)}
+        start = dict.fromkeys(itertools.chain(self._x_list, self._y.values(), self._b.values(), self._B_list), 0.0)
+        for batch_k, batch in batches.items():
+            start[self._b[batch_k]] = 1.0
+            for order_id in batch.orders:
+                start[self._y[batch_k, order_index[order_id]]] = 1.0
+            route = [self._node_index[node] for node in batch.route]
+            for node in route:
+                start[self._B[batch_k, node]] = 1.0
+            # the route and the edge from the end back to the start node
+            keys = [(batch_k, min(i, j), max(i, j)) for i, j in itertools.chain(zip(route[:-1], route[1:]), [self._depot])]
+            if all(key in self._x for key in keys):
+                for key in keys:
+                    start[self._x[key]] = 1.0
+            else:
+                for i, j in self._edges:
+                    start[self._x[batch_k, i, j]] = gp.GRB.UNDEFINED
+        return start
+
+    def fix_assignments(self, batches, share=1.0):
+        """Fixes the orders of some batches to their batch index, and frees all other orders.
+
+        Batch indices are as in set_start, so the fixed batches and a MIP start from the same
+        batches agree. Batches frozen by release are left as they are, so after release batches
+        are the batches of the orders that are not frozen, eg. heuristic_batches().
+
+        Args:
+            batches (:obj: `list`): list of infrastructure.Batch with orders and distance set.
+            share (float, optional): share of the batches to fix, those with the shortest distance per
+                                     order first. Default is 1, all batches.
+        """
+        order_index = {order_id: o for o, order_id in enumerate(self._orders)}
+        batches = {batch_k: batch for batch_k, batch in self._indexed_batches(batches).items()
+                   if batch_k not in self._frozen}
+        by_distance = sorted(batches, key=lambda k: batches[k].distance / len(batches[k].orders))
+        lower = {self._y[key]: 0.0 for key in self._fixed_y if key[0] not in self._frozen}
+        self._fixed_y = []
+        for batch_k in by_distance[:int(round(share * len(batches)))]:
+            for order_id in batches[batch_k].orders:
+                self._fixed_y.append((batch_k, order_index[order_id]))
+                lower[self._y[batch_k, order_index[order_id]]] = 1.0
+        super().setAttr('LB', list(lower), list(lower.values()))
+
+    def incumbent_batches(self):
+        """Reads the batches of the incumbent, the solution of the last optimize().
+
+        Only the values of b, and of y and x of the used batches, are read from gurobi, not the
+        x values of all batch indices.
+
+        Returns:
+            batches (:obj: `dict`): key: batch index (int) and item: infrastructure.Batch, with orders,
+                                    route and distance set, for every used batch index.
+        """
+        n_orders, n_edges = len(self._orders), len(self._edges)
+        b_values = super().getAttr('X', [self._b[batch_k] for batch_k in range(self._constants['max_n_batches'])])
+        used = [batch_k for batch_k, value in enumerate(b_values) if value > 0.5]
+        y_values = np.array(super().getAttr('X', [var for batch_k in used for var in
+                                                  self._y_list[(batch_k * n_orders):((batch_k + 1) * n_orders)]]))
+        x_values = np.array(super().getAttr('X', [var for batch_k in used for var in
+                                                  self._x_list[(batch_k * n_edges):((batch_k + 1) * n_edges)]]))
+        return self._decode_batches(dict(zip(used, x_values.reshape(len(used), n_edges))),
+                                    dict(zip(used, y_values.reshape(len(used), n_orders))))
+
+    def solution(self, orders=None):
+        """Returns the incumbent as an infrastructure.Plan, see incumbent_batches.
+
+        Args:
+            orders (:obj: `dict`, optional): the orders, to fill in the picks of the batches.
+        """
+        return Plan(self.incumbent_batches().values(), orders=orders)
+
+    def _decode_batches(self, x_values, y_values):
+        """Returns the batches of a solution without subtours, see incumbent_batches.
+
+        Args:
+            x_values (:obj: `dict`): key: batch index and item: ndarray with the value of x of every edge
+                                     in self._edges.
+            y_values (:obj: `dict`): key: batch index and item: ndarray with the value of y of every order.
+        """
+        start, end = self._depot
+        batches = dict()
+        for batch_k in y_values:
+            order_ids = [self._orders[o] for o in np.flatnonzero(y_values[batch_k] > 0.5).tolist()]
+            if len(order_ids) == 0:
+                continue
+            used = np.flatnonzero(x_values[batch_k] > 0.5)
+            neighbours = dict()
+            for i, j in zip(self._edge_i[used].tolist(), self._edge_j[used].tolist()):
+                if (i, j) != (min(start, end), max(start, end)):
+                    neighbours.setdefault(i, []).append(j)
+                    neighbours.setdefault(j, []).append(i)
+            # the start node has no degree constraint and may be passed more than once, so the
+            # route is an Euler path from the start to the end node (Hierholzer)
+            stack, route = [start], []
+            while len(stack) > 0:
+                node = stack[-1]
+                if len(neighbours.get(node, [])) > 0:
+                    neighbour = neighbours[node].pop()
+                    neighbours[neighbour].remove(node)
+                    stack.append(neighbour)
+                else:
+                    route.append(stack.pop())
+            route.reverse()
+            distance = int(self._distances[self._edge_i[used], self._edge_j[used]].sum())
+            batches[batch_k] = Batch(orders=order_ids, route=[self._nodes[node] for node in route], distance=distance)
+        return batches
+
+    def release(self, batch_indices):
+        """Freezes batches of the incumbent, eg. when they are handed to the pickers.
+
+        All variables of the batches are fixed to their incumbent value, also after add_orders, so
+        later re-solves only reassign the other orders. The incumbent is the MIP start of the next
+        optimize(). The frozen batches keep their batch index, so the symmetry breaking constraints
+        that sort the batch indices by their lowest order are removed.
+
+        Args:
+            batch_indices (:obj: `iterable`): batch indices (int) of incumbent_batches().
+
+        Returns:
+            batches (:obj: `list`): the released infrastructure.Batch objects.
+        """
+        incumbent = self.incumbent_batches()
+        batch_indices = [batch_k for batch_k in batch_indices if batch_k not in self._frozen]
+        for batch_k in batch_indices:
+            if batch_k not in incumbent:
+                raise ValueError("batch " + str(batch_k) + " is not used by the incumbent")
+        frozen = [var for batch_k in batch_indices for var in self._batch_vars(batch_k)]
+        values = [float(round(value)) for value in super().getAttr('X', frozen)]
+        super().setAttr('LB', frozen, values)
+        super().setAttr('UB', frozen, values)
+        self._frozen.update((batch_k, incumbent[batch_k]) for batch_k in batch_indices)
+        if self._sorted_batches and len(batch_indices) > 0:
+            self._unsort_batches()
+        self._heuristic = None # heuristic_batches leaves out the frozen orders
+        self._start_batches = incumbent
+        return [incumbent[batch_k] for batch_k in batch_indices]
+
+    def _unsort_batches(self):
+        """Removes the constraints of _set_symmetry_constraints that sort the batch indices by their
+        lowest order, the other batches can not be sorted around the frozen batch indices."""
+        super().remove(list(self._open_in_order.values()) + list(self._lowest_order.values()))
+        n_orders = len(self._orders)
+        free = [self._y[batch_k, o] for batch_k in range(self._constants['max_n_batches'])
+                if batch_k not in self._frozen for o in range(min(batch_k, n_orders))]
+        super().setAttr('UB', free, [1.0] * len(free))
+        self._sorted_batches = False
+        super().update()
+
+    def add_orders(self, orders):
+        """Adds new orders to the model without building it again.
+
+        Only the variables and constraints of the new orders, of their nodes and edges, and of new
+        batch indices are added; coefficients of existing constraints are changed in place. Batches
+        frozen by release stay as they are. If the model has an incumbent, the next optimize() starts
+        from it, with the new orders in the batches of the constructive heuristic.
+
+        If max_n_batches was not given, the batch bound grows by the merge bound of
+        _batch_upper_bound, which holds for any number of orders; the cost bound is not updated.
+
+        Args:
+            orders (:obj: `dict`): Dict of the new orders.
+                                   key: order_id (str) and item: infrastructure.Order
+
+        Returns:
+            stats (:obj: `dict`): 'seconds' (float) spent, 'new_vars', 'new_constrs' (int) and
+                                  'changed_coeffs' (int), the coefficients set in existing constraints.
+        """
+        update_start = time.perf_counter()
+        known = set(self._orders)
+        duplicates = [order_id for order_id in orders if order_id in known]
+        if len(duplicates) > 0:
+            raise ValueError("orders already in the model: " + ", ".join(duplicates))
+        num_vars, num_constrs = self.NumVars, self.NumConstrs
+        incumbent = self.incumbent_batches() if self.SolCount > 0 else self._start_batches
+
+        # new orders, nodes and edges come after the old ones, so the old indices stay valid
+        n_orders, n_nodes, n_edges = len(self._orders), len(self._nodes), len(self._edges)
+        n_batches = self._constants['max_n_batches']
+        for order in orders.values():
+            for pick in order.picks:
+                if pick._warehouse_location not in self._node_index:
+                    self._node_index[pick._warehouse_location] = len(self._nodes)
+                    self._nodes.append(pick._warehouse_location)
+            self._n_picks += order.num_picks()
+        self._orders.extend(orders)
+        self._order_nodes.extend(sorted({self._node_index[pick._warehouse_location] for pick in order.picks})
+                                 for order in orders.values())
+        new_edges = [(i, j) for j in range(n_nodes, len(self._nodes)) for i in range(j)]
+        self._edges.extend(new_edges)
+        self._edge_i = np.array([i for i, j in self._edges], dtype=np.intp)
+        self._edge_j = np.array([j for i, j in self._edges], dtype=np.intp)
+        self._distances = distance_submatrix(self._dist, self._nodes)
+        self._heuristic = None
+
+        volume = self._constants['VOL']
+        self._constants['min_n_batches'] = math.ceil(len(self._orders) / volume)
+        if self._bound_batches:
+            merge_bound = int(len(self._orders) // (volume // 2 + 1)) + 1
+            self._constants['max_n_batches'] = max(n_batches, min(len(self._orders), merge_bound),
+                                                   self._constants['min_n_batches'])
+        changed = self._extend(n_batches, n_orders, n_nodes, n_edges)
+
+        # flat variable lists of the callback, batch-major as in __init__
+        batches = range(self._constants['max_n_batches'])
+        self._x_list = [self._x[batch_k, i, j] for batch_k in batches for i, j in self._edges]
+        self._y_list = [self._y[batch_k, o] for batch_k in batches for o in range(len(self._orders))]
+        self._B_list = [self._B[batch_k, node] for batch_k in batches for node in range(len(self._nodes))]
+
+        self._start_batches = None
+        if incumbent is not None:
+            # the new orders get the batch indices after the last used one, as set_start would sort them
+            instance = BatchingInstance(self._nodes, self._distances, list(orders), self._order_nodes[n_orders:])
+            new_batches = [instance.to_batch(sorted(batch)) for batch in sorted(instance.construct(volume), key=min)]
+            first = max(incumbent, default=-1) + 1
+            if first + len(new_batches) <= self._constants['max_n_batches']:
+                self._start_batches = dict(incumbent)
+                self._start_batches.update(enumerate(new_batches, start=first))
+
+        return {'seconds': time.perf_counter() - update_start, 'new_vars': self.NumVars - num_vars,
+                'new_constrs': self.NumConstrs - num_constrs, 'changed_coeffs': changed}
+
+    def _extend(self, n_batches, n_orders, n_nodes, n_edges):
+        """Adds the variables and constraints of add_orders, for the orders, nodes and edges from
+        n_orders, n_nodes and n_edges on and the batches from n_batches on.
+
+        Returns:
+            changed (int): number of coefficients set in existing constraints.
+        """
+        batches = range(self._constants['max_n_batches'])
+        old_batches, new_batches = range(n_batches), range(n_batches, len(batches))
+        old_orders, new_orders = range(n_orders), range(n_orders, len(self._orders))
+        new_nodes = range(n_nodes, len(self._nodes))
+        start, end = self._depot
+        v_a = self._v_a
+
+        x_keys = [(batch_k, i, j) for batch_k in old_batches for i, j in self._edges[n_edges:]]
+        x_keys += [(batch_k, i, j) for batch_k in new_batches for i, j in self._edges]
+        costs = [float(self._distances[i, j]) for batch_k, i, j in x_keys]
+        self._x.update(super().addVars(x_keys, obj=costs, vtype=gp.GRB.BINARY, name=self._name('x')))
+        y_keys = [(batch_k, o) for batch_k in old_batches for o in new_orders]
+        y_keys += [(batch_k, o) for batch_k in new_batches for o in range(len(self._orders))]
+        self._y.update(super().addVars(y_keys, vtype=gp.GRB.BINARY, name=self._name('y')))
+        self._b.update(super().addVars(new_batches, vtype=gp.GRB.BINARY, name=self._name('b')))
+        B_keys = [(batch_k, node) for batch_k in old_batches for node in new_nodes]
+        B_keys += [(batch_k, node) for batch_k in new_batches for node in range(len(self._nodes))]
+        self._B.update(super().addVars(B_keys, vtype=gp.GRB.BINARY, name=self._name('B')))
+        super().update()
+
+        # new variables in the constraints of the old batches and orders
+        coefficients = [] # (constraint, variable, coefficient)
+        for batch_k in old_batches:
+            for i, j in self._edges[n_edges:]:
+                if i >= 1 and i < n_nodes:
+                    coefficients.append((self._c2[batch_k, i], self._x[batch_k, i, j], 1.0))
+            for o in new_orders:
+                coefficients.append((self._c5[batch_k], self._y[batch_k, o], v_a))
+                if self._symmetry_breaking:
+                    coefficients.append((self._open_not_empty[batch_k], self._y[batch_k, o], -1.0))
+        for o in old_orders:
+            for batch_k in new_batches:
+                coefficients.append((self._c6[o], self._y[batch_k, o], 1.0))
+        if self._symmetry_breaking:
+            coefficients.extend((self._min_batches, self._b[batch_k], 1.0) for batch_k in new_batches)
+        for constraint, var, coefficient in coefficients:
+            super().chgCoeff(constraint, var, coefficient)
+
+        node_edges = dict()
+        for i, j in self._edges:
+            node_edges.setdefault(i, []).append((i, j))
+            node_edges.setdefault(j, []).append((i, j))
+
+        # constraints of the new batches, nodes and orders, see _set_constraints
+        self._c5.update(super().addConstrs(
+            (gp.LinExpr([v_a] * len(self._orders), [self._y[batch, order] for order in range(len(self._orders))])
+             <= self._constants['VOL'] * self._b[batch] for batch in new_batches),
+            name=self._name('c5')))
+        super().addConstrs((self._x[batch, start, end] == self._b[batch] for batch in new_batches),
+                           name=self._name('c3'))
+        c2_keys = [(batch, node) for batch in old_batches for node in new_nodes]
+        c2_keys += [(batch, node) for batch in new_batches for node in range(1, len(self._nodes))]
+        self._c2.update(super().addConstrs(
+            (gp.LinExpr([1.0] * len(node_edges[node]), [self._x[batch, i, j] for i, j in node_edges[node]])
+             == 2 * self._B[batch, node] for batch, node in c2_keys),
+            name=self._name('c2')))
+        self._c6.update(super().addConstrs((self._y.sum('*', order) == 1 for order in new_orders),
+                                           name=self._name('c6')))
+        c7_keys = [(batch, order) for batch in old_batches for order in new_orders]
+        c7_keys += [(batch, order) for batch in new_batches for order in range(len(self._orders))]
+        super().addConstrs((self._B[batch, node] >= self._y[batch, order]
+                            for batch, order in c7_keys for node in self._order_nodes[order]),
+                           name=self._name('c7'))
+
+        if self._symmetry_breaking:
+            self._min_batches.RHS = self._constants['min_n_batches']
+            self._open_not_empty.update(super().addConstrs(
+                (self._b[batch] <= self._y.sum(batch, '*') for batch in new_batches),
+                name=self._name('open_not_empty')))
+        if self._sorted_batches:
+            self._open_in_order.update(super().addConstrs(
+                (self._b[batch - 1] >= self._b[batch] for batch in new_batches),
+                name=self._name('open_in_order')))
+            fixed = [self._y[key] for key in y_keys if key[1] < key[0]]
+            super().setAttr('UB', fixed, [0.0] * len(fixed))
+            self._lowest_order.update(super().addConstrs(
+                (self._y[batch, order] <= gp.LinExpr([1.0] * order, [self._y[batch - 1, p] for p in range(order)])
+                 for batch, order in y_keys if batch >= 1 and order >= batch),
+                name=self._name('lowest_order')))
+
+        # frozen batches get none of the new orders, nodes and edges
+        frozen = [var for batch_k in sorted(self._frozen) for var in
+                  itertools.chain((self._x[batch_k, i, j] for i, j in self._edges[n_edges:]),
+                                  (self._y[batch_k, o] for o in new_orders),
+                                  (self._B[batch_k, node] for node in new_nodes))]
+        super().setAttr('UB', frozen, [0.0] * len(frozen))
+
+        super().update()
+        return len(coefficients)
+
+    def _batch_vars(self, batch_k):
+        """Returns all variables of batch index batch_k."""
+        return ([self._x[batch_k, i, j] for i, j in self._edges] + [self._y[batch_k, o] for o in range(len(self._orders))]
+                + [self._b[batch_k]] + [self._B[batch_k, node] for node in range(len(self._nodes))])
+
+    def separation_stats(self):
+        """Returns the statistics of the subtour separation of the last optimize().
+
+        Returns:
+            stats (:obj: `dict`): 'mipsol_callbacks' and 'mipnode_callbacks' (int) number of callbacks
+                                  that separated, 'lazy_cuts' and 'user_cuts' (int) number of cuts added,
+                                  and 'seconds' (float) spent separating.
+        """
+        return dict(self._separation_stats)
+
+    def _inner_edges_expr(self, batch, nodes):
+        """Returns the sum of x over the edges between nodes in batch, ie x(E(S)) for S = nodes.
+
+        Args:
+                       batch (int): batch index.
+            nodes (:obj: `tuple`): sorted node indices.
+        """
+        inner_vars = [self._x[batch, i, j] for i, j in itertools.combinations(nodes, 2) if (batch, i, j) in self._x]
+        return gp.LinExpr([1.0] * len(inner_vars), inner_vars)
+
+    def solution_batches(self):
+        """Lists the orders, the route and the distance of every used batch, see solution()."""
+        results_string = str()
+        for batch_k, batch in self.incumbent_batches().items():
+            results_string += 'batch: ' + str(batch_k) + '\t'
+            results_string += 'orders: ' + str(batch.orders) + '\t'
+            results_string += 'route: ' + str(batch.route) + '\t'
+            results_string += 'distance: ' + str(batch.distance)
+            results_string += '\n'
         return results_string
 
 
+def _new_separation_stats():
+    """Returns the zeroed statistics of Model.separation_stats."""
+    return {'mipsol_callbacks': 0, 'mipnode_callbacks': 0, 'lazy_cuts': 0, 'user_cuts': 0, 'seconds': 0.0}
+
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from infrastructure import NAME_START_NODE, NAME_END_NODE, Batch, _atomic_write, distance_submatrix
+
+
+CACHE_FORMAT = 1	# part of every key, increase when the files or the models change
+
+
+class ModelCache:
+    """Content-addressed cache of built models and their solutions, in one directory on disk.
+
+    An entry is keyed by instance_key, a hash of the orders, the distances between their
+    locations, the volume and the model parameters, so a rerun of the same instance finds the
+    solution of the last run. Every entry is a json file with the batches and the objective, and
+    optionally the built model as an MPS file with a json map from variable index to variable.
+    When the files are larger than max_mb in total, the least recently used entries are deleted.
+
+    Entries of other instances are used as MIP starts for similar instances: the batches of the
+    entry with most orders in common, restricted to the common orders.
+
+    Attributes:
+        stats (:obj: `dict`): 'hits', 'misses', 'puts', 'starts' (MIP starts from similar instances)
+                              and 'evictions'.
+
+    Example:
+    >>> cache = ModelCache("results/cache")
+    >>> key = instance_key(dist, orders, 6, model="edges")
+    >>> cache.get(key) is None
+    True
+    >>> cache.put(key, orders, 6, model.solution().batches, objective=model.ObjVal, model=model)
+    >>> cache.get(key)['objective']
+    189400.0
+    """
+
+    def __init__(self, directory, max_mb=500):
+        """
+        Args:
+            directory (str): directory of the cache, created if it does not exist.
+            max_mb (float, optional): maximum size of all files of the cache in MB, default is 500.
+        """
+        self.directory = directory
+        self.max_mb = max_mb
+        self.stats = {'hits': 0, 'misses': 0, 'puts': 0, 'starts': 0, 'evictions': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        """Returns the entry of key, or None.
+
+        Returns:
+            entry (:obj: `dict`): 'key', 'volume', 'orders' (key: order id and item: fingerprint of its
+                                  locations), 'batches' (list of infrastructure.Batch with orders, route
+                                  and distance set), 'objective', 'bound', 'optimal', 'seconds' spent
+                                  solving, 'created' (unix time) and 'model_file' (the MPS file or None).
+        """
+        entry = self._read_entry(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        os.utime(self._file(key, '.json')) # most recently used
+        entry['batches'] = [Batch(orders=batch['orders'], route=batch['route'], distance=batch['distance'])
+                            for batch in entry['batches']]
+        model_file = self._file(key, '.mps')
+        entry['model_file'] = model_file if os.path.exists(model_file) else None
+        return entry
+
+    def put(self, key, orders, volume, batches, objective=None, bound=None, optimal=False, seconds=None,
+            model=None):
+        """Writes the entry of key, replacing an older one, and evicts entries if the cache is too big.
+
+        Args:
+                               key (str): see instance_key.
+                 orders (:obj: `dict`): the orders of the instance, key: order_id and item: infrastructure.Order.
+                           volume (int): Maximum number of orders in a batch.
+                batches (:obj: `list`): infrastructure.Batch with orders, route and distance set.
+            objective, bound (float, optional): objective and bound of the solve.
+                  optimal (bool, optional): True if the solve was optimal within its gap.
+                seconds (float, optional): seconds spent building and solving.
+            model (:obj: `Model`, optional): the built model.Model, written as MPS with its variable map.
+        """
+        entry = {'key': key, 'volume': volume, 'orders': order_fingerprints(orders),
+                 'batches': [batch.to_dict() for batch in batches], 'objective': objective, 'bound': bound,
+                 'optimal': bool(optimal), 'seconds': seconds, 'created': time.time()}
+        if model is not None:
+            model.write(self._file(key, '.mps'))
+            _atomic_write(self._file(key, '.map.json'), lambda f: f.write(json.dumps(variable_map(model)).encode('utf-8')))
+        _atomic_write(self._file(key, '.json'), lambda f: f.write(json.dumps(entry).encode('utf-8')))
+        self.stats['puts'] += 1
+        self.evict()
+
+    def load_model(self, key):
+        """Reads the built model of key, eg. to solve it with other parameters.
+
+        Returns:
+            model (:obj: `gurobipy.Model`): the model read from the MPS file, a plain gurobipy model
+                                           without the subtour callback, or None.
+             variables (:obj: `dict`): see variable_map, or None.
+        """
+        import gurobipy as gp # needs gurobipy
+
+        model_file, map_file = self._file(key, '.mps'), self._file(key, '.map.json')
+        if not (os.path.exists(model_file) and os.path.exists(map_file)):
+            return None, None
+        with open(map_file, 'r', encoding='utf-8') as the_file:
+            variables = json.load(the_file)
+        return gp.read(model_file), variables
+
+    def similar_start(self, orders, volume):
+        """Returns a start for the orders from the most similar other entry, or None.
+
+        The entry of at most volume orders per batch with the most orders in common, with the same
+        locations, is chosen. Its batches are restricted to the common orders, and their routes skip
+        the locations that are no longer needed. Orders that are not in the entry are not in the start.
+
+        Returns:
+             batches (:obj: `list`): infrastructure.Batch with orders and route set, distance is None.
+            order_ids (:obj: `set`): the order ids (str) that are in batches.
+        """
+        fingerprints = order_fingerprints(orders)
+        best, best_common = None, 0
+        for key in self._keys():
+            entry = self._read_entry(key)
+            if entry is None or entry['volume'] > volume:
+                continue
+            common = sum(1 for order_id, fingerprint in entry['orders'].items()
+                         if fingerprints.get(order_id) == fingerprint)
+            if common > best_common:
+                best, best_common = entry, common
+        if best is None:
+            return None
+
+        batches, covered = [], set()
+        for batch in best['batches']:
+            kept = [order_id for order_id in batch['orders'] if fingerprints.get(order_id) == best['orders'][order_id]]
+            if len(kept) == 0:
+                continue
+            needed = {node for order_id in kept for node in orders[order_id].locations()}
+            route = [node for node in batch['route'] if node in needed or node in (NAME_START_NODE, NAME_END_NODE)]
+            batches.append(Batch(orders=kept, route=route))
+            covered.update(kept)
+        self.stats['starts'] += 1
+        return batches, covered
+
+    def size_mb(self):
+        """Returns the size of all files of the cache in MB."""
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory)) / 1e6
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache is at most max_mb."""
+        sizes = dict()
+        for name in os.listdir(self.directory):
+            key = name.split('.')[0]
+            sizes[key] = sizes.get(key, 0) + os.path.getsize(os.path.join(self.directory, name))
+        total = sum(sizes.values())
+        used = {key: os.path.getmtime(self._file(key, '.json')) if os.path.exists(self._file(key, '.json')) else 0.0
+                for key in sizes}
+        for key in sorted(sizes, key=lambda key: used[key]):
+            if total <= self.max_mb * 1e6:
+                break
+            for extension in ('.json', '.mps', '.map.json'):
+                if os.path.exists(self._file(key, extension)):
+                    os.remove(self._file(key, extension))
+            total -= sizes[key]
+            self.stats['evictions'] += 1
+
+    def _keys(self):
+        return [name[:-len('.json')] for name in os.listdir(self.directory)
+                if name.endswith('.json') and not name.endswith('.map.json')]
+
+    def _file(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def _read_entry(self, key):
+        try:
+            with open(self._file(key, '.json'), 'r', encoding='utf-8') as the_file:
+                return json.load(the_file)
+        except (OSError, ValueError):
+            return None
+
+
+def instance_key(dist, orders, volume, **parameters):
+    """Returns the key (str) of an instance: the sha256 of the orders with their locations, the
+    distances between those locations and the depot, the volume and the model parameters.
+
+    Args:
+        dist (:obj: `DistanceMatrix` or `dict`): distances, eg dist['node_id_i']['node_id_j'].
+                       orders (:obj: `dict`): key: order_id (str) and item: infrastructure.Order
+                                volume (int): Maximum number of orders in a batch.
+                   parameters (optional): anything else that changes the model or the solve, eg.
+                                          model="edges" or abs_gap=1000, as json values.
+    """
+    nodes = sorted({node for order in orders.values() for node in order.locations()}
+                   | {NAME_START_NODE, NAME_END_NODE})
+    content = {'format': CACHE_FORMAT, 'volume': volume, 'parameters': parameters, 'nodes': nodes,
+               'orders': sorted([order_id, sorted(set(order.locations()))] for order_id, order in orders.items())}
+    digest = hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8'))
+    digest.update(np.ascontiguousarray(distance_submatrix(dist, nodes), dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def order_fingerprints(orders):
+    """Returns a short hash (str) of the locations of every order, as a dict with key: order id."""
+    return {order_id: hashlib.sha1(','.join(sorted(set(order.locations()))).encode('utf-8')).hexdigest()[:16]
+            for order_id, order in orders.items()}
+
+
+def variable_map(model):
+    """Returns the variables of a model.Model by their index in the MPS file, as json values.
+
+    Returns:
+        variables (:obj: `dict`): 'orders' and 'nodes' (lists of ids, indexed as in the model),
+                                  'max_n_batches', and 'x' ([index, batch, node i, node j]), 'y' ([index,
+                                  batch, order]), 'b' ([index, batch]) and 'B' ([index, batch, node])
+                                  lists.
+    """
+    return {'orders': list(model._orders), 'nodes': list(model._nodes),
+            'max_n_batches': model._constants['max_n_batches'],
+            'x': [[var.index, k, i, j] for (k, i, j), var in model._x.items()],
+            'y': [[var.index, k, o] for (k, o), var in model._y.items()],
+            'b': [[var.index, k] for k, var in model._b.items()],
+            'B': [[var.index, k, i] for (k, i), var in model._B.items()]}
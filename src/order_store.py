@@ -0,0 +1,343 @@
+import argparse
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from infrastructure import (PICK_COLUMNS, DATETIME_FORMAT, Order, Pick, Warehouse,
+                            read_orders_columnar, _atomic_write)
+
+
+STORE_VERSION = 2
+META_FILE = 'meta.json'
+
+DATE_FORMAT = '%d.%m.%y'
+TIME_FORMAT = '%H:%M'
+
+# id columns of the orders csv, stored as int64 (-1 if empty) if every value is a number that
+# converts back to the same string, else as codes of the distinct strings, see OrderStore.strings
+INT_COLUMNS = ('_order', '_batch', '_row', '_vehicle_nr', '_id', '_box_nr')
+
+# timestamp columns, stored as datetime64[m]; key: store column and item: (date column, time column)
+TIME_COLUMNS = {
+    'start': ('_start_on', '_start_at'),
+    'end_order': ('_end_on', '_end_order_at'),
+    'end_pos': ('_end_on', '_end_pos_at'),
+    'created': ('_created_on', '_created_at'),
+}
+
+
+def convert_orders(data_file, store_dir, dist=None):
+    """Converts a csv with the orders into a columnar binary store, which can be opened
+    with OrderStore. Every column is written as its own .npy file, so it can be memory-mapped.
+
+    Picks are stored in file order. Consecutive picks with the same order id make up one
+    order; order i owns the picks order_offsets[i]:order_offsets[i+1].
+
+    Args:
+                                data_file (string): name of the orders csv file.
+                                store_dir (string): directory of the store, created if needed.
+        dist (:obj: `DistanceMatrix`, optional): if given, the location ids are the row/column
+                                                 indices of dist, so they can index dist.array
+                                                 directly. Locations that are not in dist get
+                                                 the ids after len(dist).
+
+    Returns:
+        store (:obj: `OrderStore`): the written store, opened.
+
+    Example:
+    >>> dist = Warehouse().read_distances("../data/dist.csv")
+    >>> store = convert_orders("../data/example.csv", "../data/example.store", dist=dist)
+    >>> store.location_ids[:2], store.locations[store.location_ids[0]]
+    (memmap([579,   2], dtype=int32), 'F-03-19')
+    """
+    data = read_orders_columnar(data_file)
+    os.makedirs(store_dir, exist_ok=True)
+
+    # location ids, shared with the warehouse node index
+    locations = list(dist.nodes) if dist is not None else []
+    location_index = {location: i for i, location in enumerate(locations)}
+    location_ids = np.empty(len(data['_warehouse_location']), dtype=np.int32)
+    for i, location in enumerate(data['_warehouse_location']):
+        location_id = location_index.get(location)
+        if location_id is None:
+            location_id = len(locations)
+            location_index[location] = location_id
+            locations.append(location)
+        location_ids[i] = location_id
+
+    columns = {'location': location_ids}
+    widths = {}
+    strings = {}
+    for name in INT_COLUMNS:
+        columns[name.lstrip('_')], widths[name] = _int_column(data[name])
+        if columns[name.lstrip('_')] is None:
+            columns[name.lstrip('_')], strings[name] = _string_column(data[name])
+    columns['date'] = _time_column(data['_date'], None, 'D')
+    for name, (date_column, time_column) in TIME_COLUMNS.items():
+        columns[name] = _time_column(data[date_column], data[time_column], 'm')
+
+    # consecutive runs of the same order id make up one order
+    order = columns['order']
+    starts = np.flatnonzero(np.r_[True, order[1:] != order[:-1]]) if len(order) else np.empty(0, np.intp)
+    columns['order_ids'] = order[starts]
+    columns['order_offsets'] = np.r_[starts, len(order)].astype(np.int64)
+
+    for name, array in columns.items():
+        _atomic_write(os.path.join(store_dir, name + '.npy'), lambda f, a=array: np.save(f, a))
+
+    order_dates = columns['date'][starts]
+    meta = {
+        'version': STORE_VERSION,
+        'source': os.path.abspath(data_file),
+        'n_picks': int(len(order)),
+        'n_orders': int(len(starts)),
+        'n_warehouse_nodes': len(dist) if dist is not None else 0,
+        'locations': locations,
+        'widths': widths,
+        'strings': strings,
+        'sorted_by_date': bool(np.all(order_dates[1:] >= order_dates[:-1])),
+    }
+    _atomic_write(os.path.join(store_dir, META_FILE), lambda f: f.write(json.dumps(meta).encode('utf-8')))
+    return OrderStore(store_dir)
+
+
+class OrderStore:
+    """Columnar, memory-mapped store of the orders, written by convert_orders.
+
+    All arrays are read-only views of the files on disk; nothing is copied until
+    orders() builds Order objects.
+
+    Attributes:
+          locations (:obj: `list`): location names, locations[id] is the name of location id.
+                                    Ids below n_warehouse_nodes are the DistanceMatrix indices.
+          columns (:obj: `dict`): key: column name and item: ndarray with one entry per pick.
+                                  Columns: 'order', 'location', 'batch', 'row', 'vehicle_nr',
+                                  'id', 'box_nr' (int, -1 if empty), 'date' (datetime64[D]) and
+                                  'start', 'end_order', 'end_pos', 'created' (datetime64[m]).
+          strings (:obj: `dict`): key: column of INT_COLUMNS, eg. '_id', whose values are not all
+                                  numbers, and item: list of its distinct values. The column holds
+                                  the index of the value in the list instead of the number.
+        order_ids (:obj: `ndarray`): order id (int) of every order, in file order.
+    order_offsets (:obj: `ndarray`): picks of order i are order_offsets[i]:order_offsets[i+1].
+    """
+
+    def __init__(self, store_dir, mmap=True):
+        with open(os.path.join(store_dir, META_FILE), 'r', encoding='utf-8') as the_file:
+            self._meta = json.load(the_file)
+        if self._meta['version'] != STORE_VERSION:
+            raise ValueError("order store " + store_dir + " has version " + str(self._meta['version'])
+                             + ", expected " + str(STORE_VERSION) + "; convert the csv again")
+        mmap_mode = 'r' if mmap else None
+        self.locations = self._meta['locations']
+        self.n_warehouse_nodes = self._meta['n_warehouse_nodes']
+        self.strings = self._meta['strings']
+        self.columns = dict()
+        for name in ['location', 'date'] + [name.lstrip('_') for name in INT_COLUMNS] + list(TIME_COLUMNS):
+            self.columns[name] = np.load(os.path.join(store_dir, name + '.npy'), mmap_mode=mmap_mode)
+        self.order_ids = np.load(os.path.join(store_dir, 'order_ids.npy'), mmap_mode=mmap_mode)
+        self.order_offsets = np.load(os.path.join(store_dir, 'order_offsets.npy'), mmap_mode=mmap_mode)
+
+    def __len__(self):
+        return len(self.order_ids)
+
+    @property
+    def location_ids(self):
+        return self.columns['location']
+
+    def num_picks(self):
+        return self._meta['n_picks']
+
+    def order_range(self, start=None, end=None):
+        """Returns (first, last) so that orders first:last have a date (Datum) in [start, end).
+
+        Args:
+            start, end (date or datetime, optional): window of the dates, default is unbounded.
+
+        Note:
+            If the store is not sorted by date, only stores with start and end both None are
+            supported, use order_mask() instead.
+        """
+        if start is None and end is None:
+            return 0, len(self)
+        if not self._meta['sorted_by_date']:
+            raise ValueError("order store is not sorted by date, use order_mask()")
+        order_dates = self.columns['date'][self.order_offsets[:-1]]
+        first = 0 if start is None else int(np.searchsorted(order_dates, _datetime64(start, 'D'), 'left'))
+        last = len(self) if end is None else int(np.searchsorted(order_dates, _datetime64(end, 'D'), 'left'))
+        return first, max(first, last)
+
+    def order_mask(self, start=None, end=None, column='created'):
+        """Returns a boolean array over the orders, True where the first pick of the order
+        has column (eg. 'created', the release time) in [start, end)."""
+        values = self.columns[column][self.order_offsets[:-1]]
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= values >= _datetime64(start, np.datetime_data(values.dtype)[0])
+        if end is not None:
+            mask &= values < _datetime64(end, np.datetime_data(values.dtype)[0])
+        return mask
+
+    def arrays(self, start=None, end=None):
+        """Returns the columns of the orders with a date in [start, end) as views, without copying.
+
+        Returns:
+            arrays (:obj: `dict`): the pick columns (see columns) plus 'order_ids' and
+                                   'order_offsets', offsets relative to the first returned pick.
+        """
+        first, last = self.order_range(start, end)
+        pick_first, pick_last = int(self.order_offsets[first]), int(self.order_offsets[last])
+        arrays = {name: column[pick_first:pick_last] for name, column in self.columns.items()}
+        arrays['order_ids'] = self.order_ids[first:last]
+        arrays['order_offsets'] = self.order_offsets[first:(last+1)] - pick_first
+        return arrays
+
+    def orders(self, start=None, end=None, num_picks=None):
+        """Builds the same dict of Order objects as infrastructure.read_orders.
+
+        Args:
+            start, end (date or datetime, optional): see order_range.
+                   num_picks (float, optional): max overall total number of picks.
+
+        Returns:
+            orders: dict of order objects, key: order id (str) as in the csv.
+        """
+        first, last = self.order_range(start, end)
+        pick_first, pick_last = int(self.order_offsets[first]), int(self.order_offsets[last])
+        if num_picks is not None:
+            pick_last = min(pick_last, pick_first + int(num_picks))
+
+        string_columns = self._string_columns(pick_first, pick_last)
+        orders = {}
+        current_order = None
+        for data_row in zip(*string_columns):
+            if current_order is None or data_row[0] != current_order._order_id:
+                current_order = orders.get(data_row[0])
+                if current_order is None:
+                    current_order = Order(data_row[0])
+                    orders[data_row[0]] = current_order
+            current_order.picks.append(Pick(data_row))
+        return orders
+
+    def format_ids(self, name, values):
+        """Returns the csv strings of values of an id column, eg. of columns['order'], as an ndarray of str.
+
+        Args:
+                         name (str): column of INT_COLUMNS, eg. '_order'.
+            values (:obj: `ndarray`): values of the column, eg. a slice of it.
+        """
+        values = np.asarray(values)
+        if name in self.strings:
+            # -1, an empty value, picks the last entry
+            return np.array(self.strings[name] + [''], dtype=str)[values]
+        strings = np.char.zfill(values.astype(str), self._meta['widths'][name])
+        return np.where(values < 0, '', strings)
+
+    def _id_format(self, name):
+        """Returns the function that formats a value of the id column name as in the csv."""
+        if name in self.strings:
+            return lambda value, values=self.strings[name]: '' if value < 0 else values[value]
+        return lambda value, width=self._meta['widths'][name]: '' if value < 0 else str(value).zfill(width)
+
+    def _string_columns(self, pick_first, pick_last):
+        """Converts the picks pick_first:pick_last back to csv strings, one list per PICK_COLUMNS."""
+        strings = {}
+        for name in INT_COLUMNS:
+            strings[name] = _format_values(self.columns[name.lstrip('_')][pick_first:pick_last], self._id_format(name))
+        strings['_warehouse_location'] = _format_values(self.columns['location'][pick_first:pick_last],
+                                                        lambda value: self.locations[value])
+        strings['_date'] = _format_values(self.columns['date'][pick_first:pick_last],
+                                          lambda value: _strftime(value, DATE_FORMAT))
+        for name, (date_column, time_column) in TIME_COLUMNS.items():
+            values = self.columns[name][pick_first:pick_last]
+            dates = _format_values(values, lambda value: _strftime(value, DATE_FORMAT))
+            if date_column in strings:
+                # end_order and end_pos share Ende Komm. am, the first non-empty one is kept
+                dates = [first or date for first, date in zip(strings[date_column], dates)]
+            strings[date_column] = dates
+            strings[time_column] = _format_values(values, lambda value: _strftime(value, TIME_FORMAT))
+        return [strings[name] for name in PICK_COLUMNS]
+
+
+def _int_column(values):
+    """Returns values (list of str) as an int64 array, -1 for empty values, and the
+    zero-padded width of the strings (0 if the strings are not zero padded). Returns None, None
+    if the values do not convert back to the same strings: a value that is not a number, or zero
+    padded values of different widths."""
+    numbers = [value for value in values if value]
+    if not all(value.isascii() and value.isdigit() for value in numbers):
+        return None, None
+    lengths = {len(value) for value in numbers}
+    if len(lengths) > 1 and any(len(value) > 1 and value[0] == '0' for value in numbers):
+        return None, None
+    array = np.fromiter((int(value) if value else -1 for value in values), dtype=np.int64, count=len(values))
+    width = lengths.pop() if len(lengths) == 1 else 0
+    return array, width
+
+
+def _string_column(values):
+    """Returns values (list of str) as an int64 array of codes, -1 for empty values, and the
+    distinct values (list of str), values[i] is distinct[codes[i]]."""
+    distinct = {}
+    codes = np.fromiter((distinct.setdefault(value, len(distinct)) if value else -1 for value in values),
+                        dtype=np.int64, count=len(values))
+    return codes, list(distinct)
+
+
+def _time_column(dates, times, unit):
+    """Parses the csv dates (and times) into a datetime64 array, NaT for empty values."""
+    parsed = {}
+    array = np.empty(len(dates), dtype='datetime64[' + unit + ']')
+    for i in range(len(dates)):
+        key = dates[i] if times is None else (dates[i], times[i])
+        value = parsed.get(key)
+        if value is None:
+            if times is None:
+                value = np.datetime64(datetime.strptime(key, DATE_FORMAT), unit) if key else np.datetime64('NaT')
+            elif key[0] and key[1]:
+                value = np.datetime64(datetime.strptime(key[0] + ' ' + key[1], DATETIME_FORMAT), unit)
+            else:
+                value = np.datetime64('NaT')
+            parsed[key] = value
+        array[i] = value
+    return array
+
+
+def _format_values(values, format_value):
+    """Formats every value of the array with format_value, formatting each distinct value once."""
+    formatted = {}
+    strings = []
+    for value in values.tolist():
+        string = formatted.get(value)
+        if string is None:
+            string = format_value(value)
+            formatted[value] = string
+        strings.append(string)
+    return strings
+
+
+def _strftime(value, date_format):
+    """Formats a datetime64.tolist() value (date, datetime or None for NaT)."""
+    return '' if value is None else value.strftime(date_format)
+
+
+def _datetime64(value, unit):
+    """Converts a date, datetime or datetime64 to a datetime64 of unit, eg. 'D' or 'm'."""
+    return np.datetime64(value).astype('datetime64[' + unit + ']')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert an orders csv into a binary order store.")
+    parser.add_argument('orders_file', help="orders csv, eg. ../data/example.csv")
+    parser.add_argument('store_dir', help="directory of the order store")
+    parser.add_argument('--dist', help="distances csv, to share location ids with the warehouse nodes")
+    args = parser.parse_args()
+
+    dist = Warehouse().read_distances(args.dist) if args.dist else None
+    store = convert_orders(args.orders_file, args.store_dir, dist=dist)
+    print("Converted " + str(store.num_picks()) + " picks of " + str(len(store)) + " orders into " + args.store_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import numpy as np
+
+from infrastructure import NAME_START_NODE, NAME_END_NODE, Batch, DistanceMatrix, Order, Pick, distance_submatrix
+from routing import _parse_location
+
+
+# separator of the member locations in the name of a super-node, eg. F-15-17+F-15-18
+MEMBER_SEPARATOR = '+'
+
+
+class Reduction:
+    """A smaller batching instance, built from the orders before model.Model is built.
+
+    Locations that are picked together at no or little extra walking are merged into super-nodes:
+    co-located locations (distance 0) and neighbouring slots of one aisle, eg. F-15-17 and F-15-18,
+    up to merge_distance apart. A super-node with members S is walked through from end to end, a
+    length L_S, so the distance between super-nodes S and T is
+
+        d(S, T) = min d(s, t) over s in S, t in T, plus (L_S + L_T) / 2,
+
+    which charges L_S once per visit, as every visited node has two edges on a route.
+    NAME_START_NODE and NAME_END_NODE are never merged.
+
+    Every order keeps one pick per super-node. With merge_distance 0, only co-located locations
+    are merged and the optimum of the reduced instance is the optimum of the orders.
+
+    Attributes:
+        dist (:obj: `DistanceMatrix`): distances between the super-nodes, NAME_START_NODE and NAME_END_NODE.
+             orders (:obj: `dict`): the orders with one pick per super-node; key: order_id (str)
+                                    and item: infrastructure.Order.
+            members (:obj: `dict`): key: super-node (str) and item: list of its locations (str).
+           node_of (:obj: `dict`): key: location (str) and item: its super-node (str).
+               stats (:obj: `dict`): 'locations', 'nodes', 'picks', 'reduced_picks' and 'edges' (int).
+
+    Example:
+    >>> reduction = Reduction(dist, read_orders("../data/example.csv"))
+    >>> model = Model(reduction.dist, reduction.orders)
+    >>> model.optimize()
+    >>> reduction.expand_route(['F-20-28', 'F-03-19', 'F-05-11', 'F-04-05', 'F-01-05', 'F-01-23', 'F-20-27'])
+    (['F-20-28', 'F-03-19', 'F-05-11', 'F-04-05', 'F-01-05', 'F-01-23', 'F-20-27'], 189400)
+    """
+
+    def __init__(self, dist, orders, merge_distance=1300, max_members=2):
+        """
+        Args:
+            dist (:obj: `DistanceMatrix` or `dict`): distances, eg dist['node_id_i']['node_id_j'].
+                           orders (:obj: `dict`): Dict of all orders.
+                                                  key: order_id (str) and item: infrastructure.Order
+                merge_distance (int, optional): locations of one aisle at most this far apart are merged,
+                                                 default is 1300 (neighbouring slots). 0 only merges
+                                                 co-located locations.
+                   max_members (int, optional): maximum number of locations in a super-node that are
+                                                 not co-located, default is 2.
+        """
+        self._dist = dist
+        locations = list(dict.fromkeys(location for order in orders.values() for location in order.locations()))
+        locations = [location for location in locations if location not in (NAME_START_NODE, NAME_END_NODE)]
+        groups = _merge_locations(distance_submatrix(dist, locations), locations, merge_distance, max_members)
+
+        self.members = {NAME_START_NODE: [NAME_START_NODE], NAME_END_NODE: [NAME_END_NODE]}
+        for group in groups:
+            names = [locations[i] for i in group]
+            self.members[MEMBER_SEPARATOR.join(names)] = names
+        self.node_of = {location: node for node, names in self.members.items() for location in names}
+        self.dist = self._super_distances()
+
+        self.orders = dict()
+        for order_id, order in orders.items():
+            reduced = Order(order_id)
+            seen = set()
+            for pick in order.picks:
+                node = self.node_of[pick._warehouse_location]
+                if node not in seen:
+                    seen.add(node)
+                    reduced.picks.append(_copy_pick(pick, node))
+            self.orders[order_id] = reduced
+
+        n_nodes = len(self.dist)
+        self.stats = {'locations': len(locations) + 2, 'nodes': n_nodes,
+                      'picks': sum(order.num_picks() for order in orders.values()),
+                      'reduced_picks': sum(order.num_picks() for order in self.orders.values()),
+                      'edges': n_nodes * (n_nodes - 1) // 2}
+
+    def _super_distances(self):
+        """Returns the DistanceMatrix of the super-nodes, see Reduction."""
+        nodes = list(self.members)
+        locations = [location for node in nodes for location in self.members[node]]
+        full = distance_submatrix(self._dist, locations).astype(np.int64)
+        owner = np.repeat(np.arange(len(nodes)), [len(self.members[node]) for node in nodes])
+        starts = np.r_[0, np.cumsum(np.bincount(owner))[:-1]]
+
+        # closest members of every pair of super-nodes, a min over blocks of rows and then columns
+        closest = np.minimum.reduceat(np.minimum.reduceat(full, starts, axis=0), starts, axis=1)
+        # members of a super-node are on one line, walking through them is their largest distance
+        through = np.maximum.reduceat(np.maximum.reduceat(full, starts, axis=0), starts, axis=1).diagonal()
+        array = closest + (through[:, None] + through[None, :]) // 2
+        np.fill_diagonal(array, 0)
+        return DistanceMatrix(nodes, array.astype(DistanceMatrix.DTYPE))
+
+    def expand(self, nodes):
+        """Returns the locations of the super-nodes in nodes, eg. the nodes of a batch."""
+        return [location for node in nodes for location in self.members[node]]
+
+    def expand_route(self, route):
+        """Walks a route of super-nodes through their locations.
+
+        The locations of a super-node are walked from the one closest to the previous location.
+
+        Args:
+            route (:obj: `list`): super-nodes (str) in walking order.
+
+        Returns:
+            locations (:obj: `list`): locations (str) in walking order.
+                       length (int): length of the walk with the original distances, including
+                                     the way back from the last to the first location.
+        """
+        locations = []
+        for node in route:
+            names = self.members[node]
+            if len(names) > 1 and len(locations) > 0:
+                # members are on one line: from the one closest to the previous location to the other end
+                first = min(names, key=lambda name: self._distance(locations[-1], name))
+                names = sorted(names, key=lambda name: self._distance(first, name))
+            locations.extend(names)
+        path = distance_submatrix(self._dist, locations)
+        steps = np.arange(len(locations) - 1)
+        length = int(path[steps, steps + 1].sum() + path[-1, 0]) if len(locations) > 0 else 0
+        return locations, length
+
+    def expand_batch(self, batch, orders=None):
+        """Returns the batch, routed over super-nodes, as an infrastructure.Batch over the original
+        locations, with the distance of the expanded route.
+
+        Args:
+            batch (:obj: `Batch`): batch with orders and a route of super-nodes.
+            orders (:obj: `dict`, optional): the original orders, to fill in the picks of the batch.
+        """
+        route, distance = self.expand_route(batch.route)
+        expanded = Batch(orders=batch.orders, route=route, distance=distance)
+        if orders is not None:
+            for order_id in expanded.orders:
+                expanded.picks.extend(orders[order_id].picks)
+        return expanded
+
+    def _distance(self, node_i, node_j):
+        """Original distance between two locations."""
+        return int(distance_submatrix(self._dist, [node_i, node_j])[0, 1])
+
+
+def _merge_locations(distances, locations, merge_distance, max_members):
+    """Groups the locations into super-nodes, see Reduction.
+
+    Pairs of locations are taken from the closest on. Two groups are merged if all their
+    locations are co-located, or if they are in one aisle, at most merge_distance apart,
+    and have at most max_members locations together.
+
+    Returns:
+        groups (:obj: `list`): lists of location indices, every location is in one group.
+    """
+    n_locations = len(locations)
+    aisles = [_parse_location(location) for location in locations]
+    group_of = list(range(n_locations))
+    groups = {i: [i] for i in range(n_locations)}
+
+    i, j = np.nonzero(np.triu(distances <= merge_distance, 1))
+    for a, b in sorted(zip(i.tolist(), j.tolist()), key=lambda pair: distances[pair[0], pair[1]]):
+        group_a, group_b = group_of[a], group_of[b]
+        if group_a == group_b:
+            continue
+        merged = groups[group_a] + groups[group_b]
+        block = distances[np.ix_(merged, merged)]
+        if not (block == 0).all():
+            same_aisle = all(aisles[m] is not None and aisles[m][0] == aisles[merged[0]][0] for m in merged)
+            if not same_aisle or len(merged) > max_members or block.max() > merge_distance:
+                continue
+        for m in groups[group_b]:
+            group_of[m] = group_a
+        groups[group_a] = merged
+        del groups[group_b]
+    return list(groups.values())
+
+
+def _copy_pick(pick, location):
+    """Returns a copy of pick at location."""
+    copy = Pick.__new__(Pick)
+    for column in Pick.__slots__:
+        setattr(copy, column, getattr(pick, column))
+    copy._warehouse_location = location
+    return copy
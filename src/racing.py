@@ -0,0 +1,397 @@
+import argparse
+import csv
+import math
+import multiprocessing
+import os
+import time
+from datetime import datetime
+
+import alns
+from heuristic import construct_batches
+from infrastructure import NAME_START_NODE, NAME_END_NODE, Batch, Warehouse, read_orders
+
+
+# configurations of race, a solve is a dict with a 'name', the 'solver' ('model', 'alns' or
+# 'heuristic') and, for 'model', gurobi 'params', 'max_n_batches' (int, or 'heuristic' for the
+# number of heuristic batches), 'symmetry_breaking' and 'fractional_cuts'. Only the bound of a
+# 'model' solve without 'max_n_batches' is a lower bound of the instance, see _has_bound
+CONFIGURATIONS = [
+    {'name': 'default', 'solver': 'model', 'params': {'Seed': 0}},
+    {'name': 'feasibility', 'solver': 'model', 'params': {'Seed': 1, 'MIPFocus': 1}},
+    {'name': 'bound', 'solver': 'model', 'params': {'Seed': 2, 'MIPFocus': 2, 'Cuts': 2}},
+    {'name': 'fractional_cuts', 'solver': 'model', 'params': {'Seed': 3}, 'fractional_cuts': True},
+    {'name': 'heuristic_batches', 'solver': 'model', 'params': {'Seed': 4}, 'max_n_batches': 'heuristic'},
+    {'name': 'alns', 'solver': 'alns'},
+]
+
+TUNING_FIELDS = ['timestamp', 'n_orders', 'instance', 'winner', 'objective', 'bound', 'proven', 'seconds']
+
+# progress of a solve in IncumbentChannel: runtime, objective, bound and state
+_FINISHED = 1.0
+_FAILED = 2.0
+
+
+class IncumbentChannel:
+    """Best plan of a race and the progress of every solve, in shared memory.
+
+    The plan is stored as the batch of every order, the distance of every batch and the routes
+    of the batches as node indices, separated by -1. A solve writes its plan if it is better
+    than the stored one, and reads it to continue from it.
+    """
+
+    def __init__(self, context, orders, n_workers):
+        """
+        Args:
+            context (:obj: `multiprocessing.context.BaseContext`): context of the worker processes.
+                                           orders (:obj: `dict`): Dict of all orders.
+                                                                  key: order_id (str) and item: infrastructure.Order
+                                                n_workers (int): number of solves.
+        """
+        self.order_ids = list(orders)
+        self.nodes = list(dict.fromkeys([NAME_START_NODE, NAME_END_NODE]
+                                        + [node for order in orders.values() for node in order.locations()]))
+        self._node_index = {node: i for i, node in enumerate(self.nodes)}
+        # a route visits the nodes of its orders once, may pass the start node before every one of
+        # them and ends in the end node; every batch has an order and its route ends with -1
+        capacity = 2 * sum(len(order.locations()) for order in orders.values()) + 3 * len(orders)
+        self._lock = context.Lock()
+        self._objective = context.RawValue('d', math.inf)
+        self._version = context.RawValue('i', 0)
+        self._owner = context.RawValue('i', -1)
+        self._n_batches = context.RawValue('i', 0)
+        self._batch_of = context.RawArray('i', len(self.order_ids))
+        self._distances = context.RawArray('d', len(self.order_ids))
+        self._routes = context.RawArray('i', capacity)
+        self._progress = context.RawArray('d', 4 * n_workers)
+        for worker in range(n_workers):
+            self._progress[4*worker + 1] = math.inf
+            self._progress[4*worker + 2] = -math.inf
+
+    def publish(self, worker, objective, batches):
+        """Stores the plan of worker if it is better than the stored plan, returns True if it was stored.
+
+        Raises:
+            ValueError: if the routes of batches are longer than any plan of the orders can be.
+        """
+        order_index = {order_id: o for o, order_id in enumerate(self.order_ids)}
+        routes = []
+        for batch in batches:
+            routes.extend(self._node_index[node] for node in batch.route)
+            routes.append(-1)
+        if len(routes) > len(self._routes):
+            raise ValueError("routes of " + str(len(routes)) + " nodes, the channel holds "
+                             + str(len(self._routes)))
+        with self._lock:
+            if objective >= self._objective.value - 1e-6:
+                return False
+            for k, batch in enumerate(batches):
+                for order_id in batch.orders:
+                    self._batch_of[order_index[order_id]] = k
+                self._distances[k] = batch.distance
+            self._routes[:len(routes)] = routes
+            self._n_batches.value = len(batches)
+            self._objective.value = objective
+            self._owner.value = worker
+            self._version.value += 1
+        return True
+
+    def objective(self):
+        """Returns the objective of the stored plan, inf if there is none."""
+        return self._objective.value
+
+    def version(self):
+        """Returns the number of plans stored so far."""
+        return self._version.value
+
+    def best(self):
+        """Returns the stored plan.
+
+        Returns:
+                       objective (float): total distance, inf if no plan is stored.
+            batches (:obj: `list`): list of infrastructure.Batch, with orders, route and distance set.
+                            owner (int): the worker that found the plan, -1 if none.
+                          version (int): number of plans stored so far.
+        """
+        with self._lock:
+            objective, owner, version = self._objective.value, self._owner.value, self._version.value
+            n_batches = self._n_batches.value
+            batch_of = list(self._batch_of)
+            distances = list(self._distances[:n_batches])
+            routes = list(self._routes)
+        batches = [Batch(distance=int(distance)) for distance in distances]
+        if n_batches > 0:
+            for o, k in enumerate(batch_of):
+                batches[k].orders.append(self.order_ids[o])
+        k = 0
+        for node in routes:
+            if k >= n_batches:
+                break
+            if node < 0:
+                k += 1
+            else:
+                batches[k].route.append(self.nodes[node])
+        return objective, batches, owner, version
+
+    def progress(self, worker, runtime, objective, bound, state=0.0):
+        """Stores the progress of worker."""
+        self._progress[4*worker:4*(worker + 1)] = [runtime, objective, bound, state]
+
+    def status(self):
+        """Returns the progress of every worker, a list of dicts with 'runtime', 'objective', 'bound',
+        'finished' and 'failed'."""
+        values = list(self._progress)
+        return [{'runtime': values[i], 'objective': values[i + 1], 'bound': values[i + 2],
+                 'finished': values[i + 3] == _FINISHED, 'failed': values[i + 3] == _FAILED}
+                for i in range(0, len(values), 4)]
+
+    def worker(self, worker):
+        """Returns the WorkerChannel of worker, to be passed to Model.optimize."""
+        return WorkerChannel(self, worker)
+
+
+class WorkerChannel:
+    """The view of one solve on an IncumbentChannel, see the channel of Model.optimize."""
+
+    def __init__(self, channel, worker):
+        self.channel = channel
+        self.worker = worker
+        self._seen = 0 # version of the last plan that was read
+        self._objective = math.inf # best objective of this solve
+
+    def publish(self, incumbent):
+        self._objective = min(self._objective, incumbent['objective'])
+        self.channel.publish(self.worker, incumbent['objective'], incumbent['batches'])
+
+    def progress(self, runtime, objective, bound):
+        self.channel.progress(self.worker, runtime, objective, bound)
+
+    def finish(self, runtime, objective, bound, failed=False):
+        """Stores the final progress of the solve."""
+        self.channel.progress(self.worker, runtime, objective, bound, _FAILED if failed else _FINISHED)
+
+    def fetch(self):
+        """Returns the stored plan if it is new and better than the best plan of this solve, else None."""
+        if self.channel.version() == self._seen or self.channel.objective() >= self._objective - 1e-6:
+            return None
+        objective, batches, owner, self._seen = self.channel.best()
+        if owner == self.worker or objective >= self._objective - 1e-6:
+            return None
+        self._objective = objective
+        return batches
+
+
+def race(dist_file, orders, volume=6, configurations=None, time_limit=60.0, abs_gap=0.0, poll_interval=0.05):
+    """Solves one instance with several configurations at once, in separate processes.
+
+    Every configuration is solved in its own process, see CONFIGURATIONS. The solves share their
+    plans through an IncumbentChannel: a Model solve continues from a better plan of another solve.
+    The race ends as soon as the best plan is within abs_gap of the best bound of any solve without
+    max_n_batches, or when all solves finished; the solves that are still running are terminated.
+
+    Args:
+                 dist_file (string): name of the distances csv.
+               orders (:obj: `dict`): Dict of all orders.
+                                      key: order_id (str) and item: infrastructure.Order
+             volume (int, optional): Maximum number of orders in a batch, default is 6.
+        configurations (:obj: `list`, optional): configurations (dicts), default is CONFIGURATIONS.
+         time_limit (float, optional): seconds of every solve, default is 60.
+            abs_gap (float, optional): target gap in millimetres, default is 0, ie proven optimal.
+      poll_interval (float, optional): seconds between two checks of the gap, default is 0.05.
+
+    Returns:
+        batches (:obj: `list`): list of infrastructure.Batch, with orders, route and distance set.
+          stats (:obj: `dict`): 'winner' (name of the configuration that found the plan, or that found
+                                an equally good plan and proved it), 'objective',
+                                'bound' (of the solves without max_n_batches), 'proven' (bool, the gap
+                                is at most abs_gap), 'seconds' and
+                                'solves' (list of dicts with 'name' and the progress, see
+                                IncumbentChannel.status).
+
+    Example:
+    >>> batches, stats = race("../data/dist.csv", read_orders("../data/example.csv"), time_limit=10)
+    >>> stats['objective'], stats['proven']
+    (189400.0, True)
+    """
+    start = time.perf_counter()
+    configurations = CONFIGURATIONS if configurations is None else configurations
+    Warehouse().read_distances(dist_file) # writes the binary cache the workers map
+    context = multiprocessing.get_context('spawn')
+    channel = IncumbentChannel(context, orders, len(configurations))
+    n_models = sum(1 for configuration in configurations if configuration.get('solver', 'model') == 'model')
+    threads = max(1, (os.cpu_count() or 1) // max(n_models, 1))
+    processes = [context.Process(target=_solve, daemon=True,
+                                 args=(dist_file, orders, volume, configuration, time_limit, abs_gap,
+                                       channel.worker(worker), threads))
+                 for worker, configuration in enumerate(configurations)]
+    for process in processes:
+        process.start()
+
+    proven = False
+    bounded = [_has_bound(configuration) for configuration in configurations]
+    while True:
+        time.sleep(poll_interval)
+        bound = max([status['bound'] for status, valid in zip(channel.status(), bounded) if valid], default=-math.inf)
+        if channel.objective() - bound <= abs_gap + 1e-6:
+            proven = True
+            break
+        if not any(process.is_alive() for process in processes):
+            break
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join()
+
+    objective, batches, owner, version = channel.best()
+    for batch in batches:
+        batch.picks = [pick for order_id in batch.orders for pick in orders[order_id].picks]
+    solves = [dict(status, name=configuration['name'])
+              for configuration, status in zip(configurations, channel.status())]
+    # a solve that found a plan as good as the stored one and proved it wins over the one that
+    # published first, eg. a model warm started from the plan of alns
+    for worker, (solve, valid) in enumerate(zip(solves, bounded)):
+        if valid and solve['objective'] <= objective + 1e-6 and objective - solve['bound'] <= abs_gap + 1e-6:
+            owner = worker
+            break
+    stats = {'winner': configurations[owner]['name'] if owner >= 0 else None, 'objective': objective,
+             'bound': max([solve['bound'] for solve, valid in zip(solves, bounded) if valid], default=-math.inf),
+             'proven': proven,
+             'seconds': time.perf_counter() - start, 'solves': solves}
+    return batches, stats
+
+
+def _has_bound(configuration):
+    """Returns True if the bound of the solve of configuration is a lower bound of the instance.
+    A model with max_n_batches is restricted, so its bound is not."""
+    return configuration.get('solver', 'model') == 'model' and configuration.get('max_n_batches') is None
+
+
+def _solve(dist_file, orders, volume, configuration, time_limit, abs_gap, channel, threads):
+    """Solves the instance with one configuration, see race. Runs in its own process."""
+    start = time.perf_counter()
+    try:
+        dist = Warehouse().read_distances(dist_file)
+        solver = configuration.get('solver', 'model')
+        if solver == 'model':
+            from model import Model # needs gurobipy
+            max_n_batches = configuration.get('max_n_batches')
+            if max_n_batches == 'heuristic':
+                max_n_batches = len(construct_batches(dist, orders, volume=volume))
+            model = Model(dist, orders, volume=volume, max_n_batches=max_n_batches,
+                          symmetry_breaking=configuration.get('symmetry_breaking', True))
+            model.Params.OutputFlag = 0
+            model.Params.Threads = threads
+            for name, value in configuration.get('params', {}).items():
+                model.setParam(name, value)
+            model.optimize(time_limit=time_limit, abs_gap=abs_gap, channel=channel,
+                           fractional_cuts=configuration.get('fractional_cuts', False))
+            objective = model.ObjVal if model.SolCount > 0 else math.inf
+            bound = model.ObjBound if model.SolCount > 0 else -math.inf
+            channel.finish(model.Runtime, objective, bound)
+            return
+        if solver == 'alns':
+            # the start solution is shared at once, alns only returns at its time limit
+            batches = construct_batches(dist, orders, volume=volume)
+            channel.publish({'objective': sum(batch.distance for batch in batches), 'batches': batches})
+            batches = alns.solve(dist, orders, volume=volume, time_limit=time_limit,
+                                 seed=configuration.get('seed'))
+        elif solver == 'heuristic':
+            batches = construct_batches(dist, orders, volume=volume)
+        else:
+            raise ValueError("unknown solver " + repr(solver))
+        objective = sum(batch.distance for batch in batches)
+        channel.publish({'objective': objective, 'batches': batches})
+        channel.finish(time.perf_counter() - start, objective, -math.inf)
+    except Exception:
+        channel.finish(time.perf_counter() - start, math.inf, -math.inf, failed=True)
+        raise
+
+
+def tune(dist_file, orders, sizes=(5, 10, 20), instances=3, volume=6, configurations=None, time_limit=60.0,
+         abs_gap=0.0, csv_file=None):
+    """Races instances of several sizes and records which configuration wins.
+
+    The instances of a size are consecutive chunks of the orders, in order of the orders.
+
+    Args:
+                  dist_file (string): name of the distances csv.
+                orders (:obj: `dict`): Dict of all orders.
+                                       key: order_id (str) and item: infrastructure.Order
+            sizes (:obj: `iterable`): numbers of orders of the instances, default is (5, 10, 20).
+              instances (int, optional): number of instances per size, default is 3.
+      volume, configurations, time_limit, abs_gap: see race.
+            csv_file (string, optional): the results are appended to this csv, with the columns
+                                         TUNING_FIELDS, so it keeps the history of all tuning runs.
+
+    Returns:
+        wins (:obj: `dict`): key: number of orders (int) and item: dict with key: configuration name
+                             and item: number of instances it won.
+    """
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    order_ids = list(orders)
+    wins = dict()
+    rows = []
+    for size in sizes:
+        wins[size] = dict()
+        for instance in range(instances):
+            chunk = order_ids[(instance * size):((instance + 1) * size)]
+            if len(chunk) < size:
+                break
+            batches, stats = race(dist_file, {order_id: orders[order_id] for order_id in chunk}, volume=volume,
+                                  configurations=configurations, time_limit=time_limit, abs_gap=abs_gap)
+            wins[size][stats['winner']] = wins[size].get(stats['winner'], 0) + 1
+            rows.append(dict(stats, timestamp=timestamp, n_orders=size, instance=instance))
+
+    if csv_file is not None:
+        new_file = not os.path.exists(csv_file)
+        with open(csv_file, 'a', newline='') as the_file:
+            writer = csv.DictWriter(the_file, fieldnames=TUNING_FIELDS)
+            if new_file:
+                writer.writeheader()
+            for row in rows:
+                writer.writerow({field: row.get(field) for field in TUNING_FIELDS})
+    return wins
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Race several solver configurations on one instance.")
+    parser.add_argument('orders_file', help="orders csv, eg. ../data/example.csv")
+    parser.add_argument('dist_file', help="distances csv, eg. ../data/dist.csv")
+    parser.add_argument('--num-picks', type=int, help="only read the orders of the first picks")
+    parser.add_argument('--volume', type=int, default=6, help="maximum number of orders in a batch")
+    parser.add_argument('--time-limit', type=float, default=60.0, help="seconds of every solve")
+    parser.add_argument('--abs-gap', type=float, default=0.0, help="target gap in millimetres")
+    parser.add_argument('--configurations', nargs='+', help="names of CONFIGURATIONS to race, default all")
+    parser.add_argument('--tune', action='store_true', help="race instances of --sizes orders and count the wins")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 20])
+    parser.add_argument('--instances', type=int, default=3, help="instances per size of --tune")
+    parser.add_argument('--csv', default="results/racing.csv", help="csv the results of --tune are appended to")
+    args = parser.parse_args()
+
+    configurations = CONFIGURATIONS
+    if args.configurations:
+        configurations = [configuration for configuration in CONFIGURATIONS
+                          if configuration['name'] in args.configurations]
+    orders = read_orders(args.orders_file, num_picks=args.num_picks)
+    if args.tune:
+        os.makedirs(os.path.dirname(args.csv) or '.', exist_ok=True)
+        wins = tune(args.dist_file, orders, sizes=args.sizes, instances=args.instances, volume=args.volume,
+                    configurations=configurations, time_limit=args.time_limit, abs_gap=args.abs_gap,
+                    csv_file=args.csv)
+        for size, size_wins in wins.items():
+            print(str(size) + " orders: " + str(size_wins))
+        return
+
+    batches, stats = race(args.dist_file, orders, volume=args.volume, configurations=configurations,
+                          time_limit=args.time_limit, abs_gap=args.abs_gap)
+    print("Number of orders: " + str(len(orders)))
+    print("Number of batches: " + str(len(batches)))
+    print("Total distance: " + str(sum(batch.distance for batch in batches)))
+    print("Winner: " + str(stats['winner']) + ", proven: " + str(stats['proven'])
+          + ", seconds: " + format(stats['seconds'], '.2f'))
+    for solve in stats['solves']:
+        print(solve['name'] + ": " + str(solve))
+
+
+if __name__ == '__main__':
+    main()
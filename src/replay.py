@@ -0,0 +1,238 @@
+import argparse
+import csv
+import time
+from datetime import datetime
+
+import numpy as np
+
+from infrastructure import NAME_START_NODE, NAME_END_NODE, Warehouse, read_orders, read_orders_columnar
+from order_store import DATE_FORMAT, OrderStore
+
+
+# columns of the orders csv that describe what was picked when, see load_history
+HISTORY_COLUMNS = ['_date', '_warehouse_location', '_batch', '_row', '_vehicle_nr']
+
+BATCH_FIELDS = ['date', 'batch', 'vehicle', 'n_orders', 'n_picks', 'distance', 'historical', 'planned', 'covered']
+DAY_FIELDS = ['date', 'n_batches', 'n_orders', 'distance', 'historical', 'planned', 'covered', 'saving']
+
+
+def load_history(source, dist):
+    """Reads the picks of the order history as arrays.
+
+    Args:
+        source (string or :obj: `OrderStore`): the orders csv, or an order_store.OrderStore, which
+                                               is much faster to read.
+                     dist (:obj: `DistanceMatrix`): distances of the warehouse.
+
+    Returns:
+        history (:obj: `dict`): one array per column, one entry per pick, in file order: 'order' (str),
+                                'date' (datetime64[D], Datum), 'batch' and 'vehicle' (int, Batch and Wagen Nr,
+                                -1 if empty), 'row' (int, Reihenfolge der Komm.) and 'location' (int,
+                                the index of Lagerort in dist).
+    """
+    if isinstance(source, OrderStore):
+        arrays = source.arrays()
+        locations = np.asarray(arrays['location'])
+        if source.n_warehouse_nodes != len(dist) or (len(locations) > 0 and locations.max() >= len(dist)):
+            locations = dist.indices([source.locations[location] for location in locations.tolist()])
+        return {'order': source.format_ids('_order', arrays['order']),
+                'date': np.asarray(arrays['date'], dtype='datetime64[D]'),
+                'batch': np.asarray(arrays['batch'], dtype=np.int64),
+                'vehicle': np.asarray(arrays['vehicle_nr'], dtype=np.int64),
+                'row': np.asarray(arrays['row'], dtype=np.int64),
+                'location': np.asarray(locations, dtype=np.intp)}
+
+    data = read_orders_columnar(source, columns=HISTORY_COLUMNS)
+    days, day_of = np.unique(np.array(data['_date']), return_inverse=True)
+    days = np.array([datetime.strptime(day, DATE_FORMAT) for day in days.tolist()], dtype='datetime64[D]')
+    return {'order': np.array(data['_order']), 'date': days[day_of],
+            'batch': _int_array(data['_batch']), 'vehicle': _int_array(data['_vehicle_nr']),
+            'row': _int_array(data['_row']), 'location': dist.indices(data['_warehouse_location'])}
+
+
+def evaluate_history(history, dist):
+    """Walks every historical batch in its pick sequence and returns how far it was walked.
+
+    A batch is the picks with the same Datum and Batch. Its route starts in NAME_START_NODE,
+    visits the locations of the picks ordered by Reihenfolge der Komm., ends in NAME_END_NODE and
+    walks back to NAME_START_NODE, as a Batch.distance of the planners. All batches are evaluated
+    at once, with one gather over the distance matrix. Picks without a Batch are left out.
+
+    Args:
+        history (:obj: `dict`): pick columns, see load_history.
+           dist (:obj: `DistanceMatrix`): distances of the warehouse.
+
+    Returns:
+        batches (:obj: `dict`): one array per field, one entry per batch, sorted by date and batch:
+                                'date', 'batch', 'vehicle' (of the first pick), 'n_orders',
+                                'n_picks' and 'distance' (int), and 'pick_batch', the batch
+                                index of every pick (-1 for picks without a batch).
+
+    Example:
+    >>> batches = evaluate_history(load_history("../data/example.csv", dist), dist)
+    >>> batches['batch'], batches['distance']
+    (array([1380]), array([232400]))
+    """
+    array = np.asarray(dist.array)
+    start, end = dist.index[NAME_START_NODE], dist.index[NAME_END_NODE]
+    picked = np.flatnonzero(history['batch'] >= 0)
+    if len(picked) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return {'date': history['date'][:0], 'batch': history['batch'][:0], 'vehicle': history['vehicle'][:0],
+                'n_orders': empty, 'n_picks': empty, 'distance': empty,
+                'pick_batch': np.full(len(history['batch']), -1, dtype=np.int64)}
+
+    # one integer key per (date, batch)
+    dates, date_code = np.unique(history['date'][picked], return_inverse=True)
+    batch_values, batch_code = np.unique(history['batch'][picked], return_inverse=True)
+    keys, batch_of = np.unique(date_code.astype(np.int64) * len(batch_values) + batch_code, return_inverse=True)
+    n_batches = len(keys)
+
+    # picks grouped by batch, in pick sequence
+    order = np.lexsort((history['row'][picked], batch_of))
+    sorted_picks = picked[order]
+    sorted_batch = batch_of[order]
+    locations = history['location'][sorted_picks]
+    first = np.flatnonzero(np.r_[True, sorted_batch[1:] != sorted_batch[:-1]])
+    last = np.r_[first[1:], len(sorted_picks)] - 1
+
+    steps = array[locations[:-1], locations[1:]].astype(np.int64)
+    inside = sorted_batch[1:] == sorted_batch[:-1]
+    walked = np.bincount(sorted_batch[1:][inside], weights=steps[inside], minlength=n_batches)
+    distance = (array[start, locations[first]].astype(np.int64) + np.rint(walked).astype(np.int64)
+                + array[locations[last], end] + int(array[end, start]))
+
+    order_ids, order_code = np.unique(history['order'][sorted_picks], return_inverse=True)
+    pairs = np.unique(sorted_batch.astype(np.int64) * len(order_ids) + order_code)
+    n_orders = np.bincount(pairs // max(len(order_ids), 1), minlength=n_batches)
+
+    pick_batch = np.full(len(history['batch']), -1, dtype=np.int64)
+    pick_batch[picked] = batch_of
+    return {'date': dates[keys // len(batch_values)], 'batch': batch_values[keys % len(batch_values)],
+            'vehicle': history['vehicle'][sorted_picks[first]], 'n_orders': n_orders,
+            'n_picks': np.diff(np.r_[first, len(sorted_picks)]), 'distance': distance, 'pick_batch': pick_batch}
+
+
+def route_distances(dist, batches):
+    """Returns the distance (int) of the route of every infrastructure.Batch, including the way back
+    from the last to the first node, as an array, computed with one gather over the distance matrix."""
+    routes = [dist.indices(batch.route) for batch in batches]
+    if len(routes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    lengths = np.array([len(route) for route in routes])
+    nodes = np.concatenate(routes)
+    following = np.concatenate([np.r_[route[1:], route[:1]] for route in routes])
+    owner = np.repeat(np.arange(len(routes)), lengths)
+    return np.bincount(owner, weights=np.asarray(dist.array)[nodes, following], minlength=len(routes)).astype(np.int64)
+
+
+def compare(history, batches, plan):
+    """Compares the historical batches with a plan of any backend, per batch and per day.
+
+    The distance of a batch is shared equally by its orders, so every order has a historical and
+    a planned share. A historical batch is compared with the planned shares of its orders, a day
+    with the planned shares of the orders of its batches. Orders that are not in the plan are
+    not compared, 'covered' is the share of orders that are.
+
+    Args:
+        history (:obj: `dict`): pick columns, see load_history.
+        batches (:obj: `dict`): historical batches, see evaluate_history.
+           plan (:obj: `list`): planned infrastructure.Batch objects, with orders and distance set.
+
+    Returns:
+        per_batch (:obj: `dict`): the fields of batches plus 'planned' (float), the planned shares of its
+                                  orders, 'historical' (float), the historical distance of the orders that
+                                  are planned, and 'covered' (float).
+          per_day (:obj: `dict`): one array per field of DAY_FIELDS, plus 'historical', one entry per day.
+    """
+    planned_share = dict()
+    for batch in plan:
+        for order_id in batch.orders:
+            planned_share[order_id] = batch.distance / len(batch.orders)
+
+    # the orders of every historical batch, once
+    picked = batches['pick_batch'] >= 0
+    pairs = {(batch_k, order_id) for batch_k, order_id in
+             zip(batches['pick_batch'][picked].tolist(), history['order'][picked].tolist())}
+    pair_batch = np.fromiter((batch_k for batch_k, order_id in pairs), dtype=np.int64, count=len(pairs))
+    pair_planned = np.fromiter((planned_share.get(order_id, np.nan) for batch_k, order_id in pairs),
+                               dtype=float, count=len(pairs))
+    n_batches = len(batches['distance'])
+    covered = ~np.isnan(pair_planned)
+    n_covered = np.bincount(pair_batch[covered], minlength=n_batches)
+
+    per_batch = {field: values for field, values in batches.items() if field != 'pick_batch'}
+    per_batch['planned'] = np.bincount(pair_batch[covered], weights=pair_planned[covered], minlength=n_batches)
+    per_batch['historical'] = batches['distance'] * n_covered / np.maximum(batches['n_orders'], 1)
+    per_batch['covered'] = n_covered / np.maximum(batches['n_orders'], 1)
+
+    dates, day_of = np.unique(batches['date'], return_inverse=True)
+    per_day = {'date': dates, 'n_batches': np.bincount(day_of, minlength=len(dates)),
+               'n_orders': np.bincount(day_of, weights=batches['n_orders'], minlength=len(dates)).astype(np.int64),
+               'distance': np.bincount(day_of, weights=batches['distance'], minlength=len(dates)).astype(np.int64)}
+    for field in ('planned', 'historical'):
+        per_day[field] = np.bincount(day_of, weights=per_batch[field], minlength=len(dates))
+    per_day['covered'] = (np.bincount(day_of, weights=n_covered, minlength=len(dates))
+                          / np.maximum(per_day['n_orders'], 1))
+    per_day['saving'] = 1 - per_day['planned'] / np.where(per_day['historical'] > 0, per_day['historical'], np.nan)
+    return per_batch, per_day
+
+
+def write_csv(table, fields, csv_file):
+    """Writes a table of compare (dict of arrays) as csv, with the columns fields."""
+    with open(csv_file, 'w', newline='') as the_file:
+        writer = csv.writer(the_file, delimiter=';')
+        writer.writerow(fields)
+        writer.writerows(zip(*[np.asarray(table[field]).tolist() for field in fields]))
+
+
+def _int_array(values):
+    """Returns the csv strings values as int64 array, -1 where empty."""
+    return np.array([int(value) if value else -1 for value in values], dtype=np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute how far the historical batches were walked, "
+                                                 "and compare them with the batches of a solver.")
+    parser.add_argument('orders', help="orders csv, or the directory of an order store")
+    parser.add_argument('dist_file', help="distances csv, eg. ../data/dist.csv")
+    parser.add_argument('--solver', choices=['heuristic', 'alns', 'set_partitioning'],
+                        help="batch every day with this solver and compare, see decomposition.solve")
+    parser.add_argument('--volume', type=int, default=6, help="maximum number of orders in a batch")
+    parser.add_argument('--time-limit', type=float, default=5.0, help="seconds of search per day")
+    parser.add_argument('--batches-csv', help="write the comparison per batch to this csv")
+    parser.add_argument('--days-csv', help="write the comparison per day to this csv")
+    args = parser.parse_args()
+
+    dist = Warehouse().read_distances(args.dist_file)
+    start = time.perf_counter()
+    source = OrderStore(args.orders) if not args.orders.endswith('.csv') else args.orders
+    history = load_history(source, dist)
+    load_seconds = time.perf_counter() - start
+    batches = evaluate_history(history, dist)
+    evaluate_seconds = time.perf_counter() - start - load_seconds
+    print("Number of picks: " + str(len(history['order'])))
+    print("Number of historical batches: " + str(len(batches['distance'])))
+    print("Historical distance: " + str(int(batches['distance'].sum())))
+    print("Load seconds: " + format(load_seconds, '.2f') + ", evaluate seconds: " + format(evaluate_seconds, '.2f'))
+
+    plan = []
+    if args.solver is not None:
+        import decomposition
+        orders = source.orders() if isinstance(source, OrderStore) else read_orders(source)
+        plan, stats = decomposition.solve(args.dist_file, orders, volume=args.volume, solver=args.solver,
+                                          time_limit=args.time_limit, key='date', repair=False)
+        print("Planned distance: " + str(sum(batch.distance for batch in plan)))
+    per_batch, per_day = compare(history, batches, plan)
+    for day in range(len(per_day['date'])):
+        print(str(per_day['date'][day]) + ": " + str(per_day['n_batches'][day]) + " batches, historical "
+              + str(per_day['distance'][day]) + ", planned " + format(per_day['planned'][day], '.0f')
+              + ", saving " + format(per_day['saving'][day], '.1%'))
+    if args.batches_csv:
+        write_csv(per_batch, BATCH_FIELDS, args.batches_csv)
+    if args.days_csv:
+        write_csv(per_day, DAY_FIELDS, args.days_csv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+from heuristic import nearest_neighbour_route, route_length, two_opt
+from infrastructure import NAME_START_NODE, NAME_END_NODE, distance_submatrix
+
+
+# location codes are F-aisle-slot, eg. F-15-18 is slot 18 in aisle 15
+LOCATION_PATTERN = re.compile(r'^[A-Za-z]+-(\d+)-(\d+)$')
+
+
+class RoutingOracle:
+    """Answers "how long is the walk through these locations?" for any set of nodes.
+
+    A route starts in NAME_START_NODE, visits all nodes and ends in NAME_END_NODE. Small sets
+    are routed exactly with Held-Karp dynamic programming; larger sets take the best of the
+    S-shape, largest gap and nearest neighbour routes, improved with 2-opt. Results are kept
+    in a bounded LRU cache keyed by the frozenset of node ids.
+
+    Attributes:
+        stats (:obj: `dict`): 'hits' and 'misses' of the cache, and 'exact' and 'heuristic'
+                              number of routes computed with each method.
+
+    Example:
+    >>> oracle = RoutingOracle(Warehouse().read_distances("../data/dist.csv"))
+    >>> oracle.route(['F-03-19', 'F-04-05', 'F-05-11', 'F-01-05', 'F-01-23'])
+    (189400, ['F-20-28', 'F-03-19', 'F-05-11', 'F-04-05', 'F-01-05', 'F-01-23', 'F-20-27'])
+    >>> oracle.hit_rate()
+    0.0
+    """
+
+    def __init__(self, dist, cache_size=100000, exact_limit=10, start=NAME_START_NODE, end=NAME_END_NODE):
+        """
+        Args:
+            dist (:obj: `DistanceMatrix` or `dict`): distances, eg dist['node_id_i']['node_id_j'].
+                        cache_size (int, optional): maximum number of routes in the cache.
+                       exact_limit (int, optional): sets of at most this many nodes, apart from the start
+                                                    and end node, are routed exactly. Default is 10.
+                       start, end (str, optional): start and end node of every route.
+        """
+        self._dist = dist
+        self._cache = OrderedDict()
+        self.cache_size = cache_size
+        self.exact_limit = exact_limit
+        self.start = start
+        self.end = end
+        self.stats = {'hits': 0, 'misses': 0, 'exact': 0, 'heuristic': 0}
+
+    def route(self, nodes):
+        """Returns the length and the visiting order of the route through nodes.
+
+        Args:
+            nodes (:obj: `iterable`): node ids (str); duplicates, the start and the end node are ignored.
+
+        Returns:
+                      length (int): length of the route, including the way back from the end to the
+                                    start node, as infrastructure.Batch.distance and the Model objective.
+            order (:obj: `list`): node ids in walking order, from the start to the end node.
+        """
+        key = frozenset(nodes) - {self.start, self.end}
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return cached[0], list(cached[1])
+
+        self.stats['misses'] += 1
+        result = self._compute(sorted(key))
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result[0], list(result[1])
+
+    def length(self, nodes):
+        """Returns only the length of the route through nodes, see route."""
+        return self.route(nodes)[0]
+
+    def hit_rate(self):
+        """Returns the share of route() calls answered from the cache, 0 before the first call."""
+        calls = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / calls if calls > 0 else 0.0
+
+    def clear(self):
+        """Empties the cache, the statistics are kept."""
+        self._cache.clear()
+
+    def _compute(self, nodes):
+        """Routes nodes, a sorted list of node ids without the start and end node."""
+        all_nodes = [self.start, self.end] + nodes
+        distances = distance_submatrix(self._dist, all_nodes).astype(np.int64)
+        interior = list(range(2, len(all_nodes)))
+
+        if len(nodes) <= self.exact_limit:
+            self.stats['exact'] += 1
+            path = held_karp(distances, interior, 0, 1)
+        else:
+            self.stats['heuristic'] += 1
+            candidates = [nearest_neighbour_route(distances, interior, 0, 1)]
+            aisles = _parse_locations(nodes)
+            if aisles is not None:
+                depot = _parse_location(self.start)
+                slots = [slot for picks in aisles.values() for slot, node in picks]
+                depot_aisle = depot[0] if depot is not None else max(aisles)
+                depot_at_back = depot is not None and 2 * depot[1] >= min(slots) + max(slots)
+                for path in (s_shape_route(aisles, depot_aisle, depot_at_back),
+                             largest_gap_route(aisles, depot_aisle, depot_at_back)):
+                    candidates.append([0] + [node + 2 for node in path] + [1])
+            path = min(candidates, key=lambda path: route_length(distances, path))
+            path = two_opt(distances, path)
+
+        return route_length(distances, path), [all_nodes[node] for node in path]
+
+
+def held_karp(distances, nodes, start, end):
+    """Shortest path from start through all nodes to end, with Held-Karp dynamic programming.
+
+    The states are (set of visited nodes, last node); for every set, the extensions to all
+    nodes outside the set are computed at once with numpy. Time is O(2^n n^2).
+
+    Args:
+        distances (:obj: `ndarray`): distances[i, j] between node i and node j.
+              nodes (:obj: `list`): node indices to visit, without start and end.
+                  start, end (int): start and end node.
+
+    Returns:
+        path (:obj: `list`): node indices from start to end.
+    """
+    n = len(nodes)
+    if n == 0:
+        return [start, end]
+    nodes = np.asarray(nodes, dtype=np.intp)
+    inner = distances[np.ix_(nodes, nodes)].astype(float)
+    full = (1 << n) - 1
+
+    cost = np.full((1 << n, n), np.inf)
+    parent = np.full((1 << n, n), -1, dtype=np.intp)
+    for j in range(n):
+        cost[1 << j, j] = distances[start, nodes[j]]
+
+    bits = 1 << np.arange(n)
+    for mask in range(1, full):
+        row = cost[mask]
+        if not np.isfinite(row).any():
+            continue
+        # best way to reach every node k from a last node j in mask
+        through = row[:, None] + inner
+        best_last = np.argmin(through, axis=0)
+        best_cost = through[best_last, np.arange(n)]
+        outside = np.flatnonzero((mask & bits) == 0)
+        next_masks = mask | bits[outside]
+        improved = best_cost[outside] < cost[next_masks, outside]
+        cost[next_masks[improved], outside[improved]] = best_cost[outside[improved]]
+        parent[next_masks[improved], outside[improved]] = best_last[outside[improved]]
+
+    last = int(np.argmin(cost[full] + distances[nodes, end]))
+    path = []
+    mask = full
+    while last >= 0:
+        path.append(int(nodes[last]))
+        previous = parent[mask, last]
+        mask &= ~(1 << last)
+        last = int(previous)
+    return [start] + path[::-1] + [end]
+
+
+def s_shape_route(aisles, depot_aisle, depot_at_back):
+    """S-shape (traversal) route: every aisle with picks is walked through completely, in
+    alternating directions, starting with the aisles furthest from the depot aisle.
+
+    Args:
+        aisles (:obj: `dict`): key: aisle (int) and item: list of (slot, node) in that aisle.
+                   depot_aisle (int): aisle of the start node.
+               depot_at_back (bool): True if the start node is at the high slot end of the aisles.
+
+    Returns:
+        path (:obj: `list`): the nodes in visiting order, without start and end node.
+    """
+    order = sorted(aisles, key=lambda aisle: -abs(aisle - depot_aisle))
+    path = []
+    from_back = depot_at_back
+    for aisle in order:
+        picks = sorted(aisles[aisle], reverse=from_back)
+        path.extend(node for slot, node in picks)
+        from_back = not from_back
+    return path
+
+
+def largest_gap_route(aisles, depot_aisle, depot_at_back):
+    """Largest gap route: the first and the last aisle are walked through; every other aisle is
+    entered from both cross aisles up to its largest gap between picks, and left the same way.
+
+    The route walks along the depot side cross aisle to the furthest aisle, visiting the depot
+    side part of every aisle, walks through the furthest aisle, comes back along the other cross
+    aisle visiting the other parts, and walks through the aisle closest to the depot.
+
+    Args:
+        See s_shape_route.
+
+    Returns:
+        path (:obj: `list`): the nodes in visiting order, without start and end node.
+    """
+    order = sorted(aisles, key=lambda aisle: -abs(aisle - depot_aisle))
+    if len(order) == 1:
+        return [node for slot, node in sorted(aisles[order[0]], reverse=depot_at_back)]
+    all_slots = [slot for picks in aisles.values() for slot, node in picks]
+    front, back = min(all_slots), max(all_slots)
+
+    near_part, far_part = dict(), dict()
+    for aisle in order[1:-1]:
+        slots = sorted(aisles[aisle])
+        # gaps from the front cross aisle to the first pick, between picks and to the back cross aisle
+        edges = [front] + [slot for slot, node in slots] + [back]
+        gaps = [edges[i+1] - edges[i] for i in range(len(edges) - 1)]
+        largest = int(np.argmax(gaps)) # picks before the gap are reached from the front
+        front_part, back_part = slots[:largest], slots[largest:]
+        near_part[aisle], far_part[aisle] = (back_part, front_part) if depot_at_back else (front_part, back_part)
+
+    path = []
+    # out along the depot side cross aisle, towards the furthest aisle
+    for aisle in reversed(order[1:-1]):
+        path.extend(node for slot, node in sorted(near_part[aisle], reverse=depot_at_back))
+    path.extend(node for slot, node in sorted(aisles[order[0]], reverse=depot_at_back))
+    # back along the other cross aisle
+    for aisle in order[1:-1]:
+        path.extend(node for slot, node in sorted(far_part[aisle], reverse=not depot_at_back))
+    path.extend(node for slot, node in sorted(aisles[order[-1]], reverse=not depot_at_back))
+    return path
+
+
+def _parse_location(node):
+    """Returns (aisle, slot) of a F-aisle-slot location code, or None."""
+    match = LOCATION_PATTERN.match(node)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def _parse_locations(nodes):
+    """Groups the nodes by aisle.
+
+    Returns:
+        aisles (:obj: `dict`): key: aisle (int) and item: list of (slot, index in nodes), or None
+                               if a node is not a F-aisle-slot location code.
+    """
+    aisles = dict()
+    for i, node in enumerate(nodes):
+        location = _parse_location(node)
+        if location is None:
+            return None
+        aisles.setdefault(location[0], []).append((location[1], i))
+    return aisles
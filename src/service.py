@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from decomposition import _init_worker, _solve_window
+from heuristic import chunked_batches
+from infrastructure import PICK_COLUMNS, Order, Pick, Warehouse, read_orders
+
+
+# one json object per line, in both directions
+ENCODING = 'utf-8'
+# maximum length of one request line, large submissions are split by the client
+LINE_LIMIT = 64 * 1024 * 1024
+
+
+class BatchingService:
+    """Long-running batching server, which keeps the distances and the worker processes warm.
+
+    The service reads the distances once, and starts a pool of worker processes that memory-map
+    the binary cache of the distance csv (see decomposition.solve). Clients connect over a Unix or
+    TCP socket and send one json object per line, answered by one json object per line:
+
+        {"op": "submit", "orders": [order, ...]}  adds orders to the pending orders, see order_from_json.
+        {"op": "plan", "time_limit": 0.5}         batches the pending orders and releases them.
+        {"op": "stats"}                           returns the latency percentiles and counters.
+
+    A plan request can also set "solver", "budget" (seconds until an answer, default time_limit
+    + budget_margin), "release" (false keeps the orders pending) and "orders" (order ids, default
+    all pending orders). Every answer has "ok", and "id" if the request had one. At most
+    max_workers plans are solved at a time and at most max_queue wait for a worker; further plan
+    requests are rejected with "error": "busy", so clients back off instead of piling up. If a
+    plan does not finish within its budget, the batches of heuristic.chunked_batches, which takes
+    linear time, are returned with "fallback": true.
+
+    Example:
+    >>> service = BatchingService("../data/dist.csv", volume=6, max_workers=4)
+    >>> asyncio.run(service.serve_unix("/tmp/batching.sock"))
+    """
+
+    def __init__(self, dist_file, volume=6, solver='alns', time_limit=0.5, budget_margin=1.0,
+                 max_workers=None, max_queue=16, seed=None):
+        """
+        Args:
+                   dist_file (string): name of the distances csv.
+               volume (int, optional): Maximum number of orders in a batch, default is 6.
+               solver (str, optional): default solver of a plan, 'alns' (default), 'heuristic'
+                                       or 'set_partitioning', see decomposition.solve.
+         time_limit (float, optional): default seconds of search per plan, default is 0.5.
+      budget_margin (float, optional): seconds on top of the time limit before a plan falls back
+                                       to the heuristic, default is 1.
+          max_workers (int, optional): number of worker processes, default is the number of cores.
+            max_queue (int, optional): number of plans that may wait for a worker, default is 16.
+                 seed (int, optional): seed of the random number generators.
+        """
+        self.dist_file = dist_file
+        self.dist = Warehouse().read_distances(dist_file) # writes the binary cache the workers map
+        self.volume = volume
+        self.solver = solver
+        self.time_limit = time_limit
+        self.budget_margin = budget_margin
+        self.max_workers = max_workers or os.cpu_count()
+        self.max_queue = max_queue
+        self.seed = seed
+        self._executor = None
+        self._slots = None
+        self._waiting = 0 # plans waiting for a worker
+        self._solving = 0 # plans in the worker processes
+        self._pending = dict() # orders that are submitted and not released, in order of submission
+        self._latencies = dict() # key: op and item: deque of the latest latencies in seconds
+        self._counters = {'requests': 0, 'errors': 0, 'rejected': 0, 'fallbacks': 0,
+                          'orders_submitted': 0, 'orders_released': 0}
+
+    async def serve_unix(self, path):
+        """Serves on the Unix socket path until cancelled."""
+        if os.path.exists(path):
+            os.remove(path)
+        await self._serve(asyncio.start_unix_server(self._handle_connection, path=path, limit=LINE_LIMIT))
+
+    async def serve_tcp(self, host='127.0.0.1', port=8765):
+        """Serves on host:port until cancelled."""
+        await self._serve(asyncio.start_server(self._handle_connection, host=host, port=port, limit=LINE_LIMIT))
+
+    async def _serve(self, starting):
+        self._slots = asyncio.Semaphore(self.max_workers)
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                 initargs=(self.dist_file,)) as self._executor:
+            # start every worker now, so the first plans do not pay for the process start
+            await asyncio.gather(*[asyncio.get_running_loop().run_in_executor(self._executor, _solve_window,
+                                                                               {}, self.volume, 'heuristic', 0, None)
+                                   for worker in range(self.max_workers)])
+            server = await starting
+            async with server:
+                await server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        """Answers the requests of one connection, in order."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write((json.dumps(await self.handle_line(line)) + '\n').encode(ENCODING))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_line(self, line):
+        """Answers one request line, see BatchingService."""
+        start = time.perf_counter()
+        self._counters['requests'] += 1
+        op = None
+        request = dict()
+        try:
+            request = json.loads(line)
+            op = request.get('op')
+            if op == 'submit':
+                response = self.submit(request.get('orders', []))
+            elif op == 'plan':
+                response = await self.plan(**{key: request[key] for key in
+                                              ('orders', 'solver', 'time_limit', 'budget', 'release')
+                                              if key in request})
+            elif op == 'stats':
+                response = self.stats()
+            else:
+                raise ValueError("unknown op " + repr(op))
+            response = dict(response)
+            response.setdefault('ok', True)
+        except Exception as error:
+            # also a failed solve, eg. a broken worker pool, is answered, the connection stays open
+            self._counters['errors'] += 1
+            response = {'ok': False, 'error': str(error) or type(error).__name__}
+        if 'id' in request:
+            response['id'] = request['id']
+        if op in ('submit', 'plan', 'stats'):
+            self._latencies.setdefault(op, deque(maxlen=10000)).append(time.perf_counter() - start)
+        return response
+
+    def submit(self, orders):
+        """Adds orders, a list of json orders (see order_from_json), to the pending orders. Orders
+        whose id is already pending, or given twice, are rejected with all others."""
+        orders = [order_from_json(data) for data in orders]
+        counts = Counter(order._order_id for order in orders)
+        duplicates = sorted(order_id for order_id, count in counts.items() if count > 1 or order_id in self._pending)
+        if len(duplicates) > 0:
+            raise ValueError("duplicate orders: " + ", ".join(duplicates))
+        unknown = {pick._warehouse_location for order in orders for pick in order.picks
+                   if pick._warehouse_location not in self.dist}
+        if len(unknown) > 0:
+            raise ValueError("unknown locations: " + ", ".join(sorted(unknown)))
+        for order in orders:
+            self._pending[order._order_id] = order
+        self._counters['orders_submitted'] += len(orders)
+        return {'pending': len(self._pending)}
+
+    async def plan(self, orders=None, solver=None, time_limit=None, budget=None, release=True):
+        """Batches pending orders in a worker process.
+
+        Args:
+            orders (:obj: `list`, optional): ids of pending orders, default is all pending orders.
+                    solver (str, optional): default is the solver of the service.
+              time_limit (float, optional): seconds of search, default is the time limit of the service.
+                  budget (float, optional): seconds until the answer, default is time_limit + budget_margin.
+                  release (bool, optional): remove the planned orders from the pending orders, so no
+                                            later plan batches them again. Default is True.
+
+        Returns:
+            response (:obj: `dict`): 'batches' (list of json batches, see Batch.to_dict), 'distance'
+                                     (int) in total, 'fallback' (bool) and 'seconds' (float), or
+                                     'error': 'busy' if max_queue plans already wait.
+        """
+        start = time.perf_counter()
+        solver = solver or self.solver
+        time_limit = self.time_limit if time_limit is None else time_limit
+        budget = time_limit + self.budget_margin if budget is None else budget
+        order_ids = list(self._pending) if orders is None else list(orders)
+        missing = [order_id for order_id in order_ids if order_id not in self._pending]
+        if len(missing) > 0:
+            raise ValueError("orders not pending: " + ", ".join(missing))
+        if self._solving + self._waiting >= self.max_workers + self.max_queue:
+            self._counters['rejected'] += 1
+            return {'ok': False, 'error': 'busy'}
+
+        plan_orders = {order_id: self._pending[order_id] for order_id in order_ids}
+        if release:
+            # no other plan may batch these orders, they are put back if the plan fails
+            for order_id in order_ids:
+                del self._pending[order_id]
+        try:
+            batches, fallback = await self._solve(plan_orders, solver, time_limit, start + budget)
+        except BaseException:
+            if release:
+                self._pending.update(plan_orders)
+            raise
+        if release:
+            self._counters['orders_released'] += len(order_ids)
+        return {'batches': [batch.to_dict() for batch in batches],
+                'distance': int(sum(batch.distance for batch in batches)),
+                'fallback': fallback, 'seconds': time.perf_counter() - start}
+
+    async def _solve(self, orders, solver, time_limit, deadline):
+        """Solves in a worker process, or falls back to heuristic.chunked_batches at the deadline.
+
+        Returns:
+            batches (:obj: `list`): list of infrastructure.Batch.
+                  fallback (bool): True if the heuristic batches are returned.
+        """
+        if len(orders) == 0:
+            return [], False
+        loop = asyncio.get_running_loop()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(deadline - time.perf_counter(), 0))
+        except asyncio.TimeoutError:
+            future = None
+        else:
+            # the worker is only free again when the solve is done, also if the answer fell back
+            self._solving += 1
+            future = loop.run_in_executor(self._executor, _solve_window, orders, self.volume, solver,
+                                          time_limit, self.seed)
+            future.add_done_callback(self._release_slot)
+        finally:
+            self._waiting -= 1
+
+        if future is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), max(deadline - time.perf_counter(), 0)), False
+            except asyncio.TimeoutError:
+                pass
+        # the fallback runs in the service process after the deadline, so it must be cheap
+        self._counters['fallbacks'] += 1
+        return await loop.run_in_executor(None, chunked_batches, self.dist, orders, self.volume), True
+
+    def _release_slot(self, future):
+        self._solving -= 1
+        self._slots.release()
+
+    def stats(self):
+        """Returns the latency percentiles of every op and the counters of the service.
+
+        Returns:
+            stats (:obj: `dict`): 'latency' (dict with key: op and item: dict of 'count', 'p50',
+                                  'p90', 'p99' and 'max' in seconds), 'counters' (dict), 'pending'
+                                  (int) orders, 'solving' and 'waiting' (int) plans.
+        """
+        return {'latency': {op: latency_percentiles(values) for op, values in self._latencies.items()},
+                'counters': dict(self._counters), 'pending': len(self._pending),
+                'solving': self._solving, 'waiting': self._waiting}
+
+
+class Client:
+    """Asyncio client of a BatchingService.
+
+    Example:
+    >>> client = await Client.connect_unix("/tmp/batching.sock")
+    >>> await client.submit(read_orders("../data/example.csv"))
+    {'pending': 2, 'ok': True}
+    >>> (await client.plan(time_limit=0.1))['distance']
+    189400
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def connect_unix(cls, path):
+        return cls(*await asyncio.open_unix_connection(path, limit=LINE_LIMIT))
+
+    @classmethod
+    async def connect_tcp(cls, host='127.0.0.1', port=8765):
+        return cls(*await asyncio.open_connection(host, port, limit=LINE_LIMIT))
+
+    async def request(self, op, **fields):
+        """Sends one request and returns the answer (dict)."""
+        async with self._lock: # one request at a time on a connection, answers come in order
+            message = dict(fields, op=op, id=next(self._ids))
+            self._writer.write((json.dumps(message) + '\n').encode(ENCODING))
+            await self._writer.drain()
+            line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("the batching service closed the connection")
+        return json.loads(line)
+
+    async def submit(self, orders):
+        """Submits orders, a dict with key: order_id (str) and item: infrastructure.Order."""
+        return await self.request('submit', orders=[order_to_json(order) for order in orders.values()])
+
+    async def plan(self, **options):
+        """Requests a plan, options are the arguments of BatchingService.plan."""
+        return await self.request('plan', **options)
+
+    async def stats(self):
+        return await self.request('stats')
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+
+def order_to_json(order):
+    """Returns an infrastructure.Order as json object: {"order_id": "000001", "picks": [pick, ...]},
+    where a pick maps the Pick attribute names without the underscore, eg. "warehouse_location",
+    to their values. Attributes that are None are left out."""
+    return {'order_id': order._order_id,
+            'picks': [{column[1:]: getattr(pick, column) for column in PICK_COLUMNS
+                       if getattr(pick, column) is not None} for pick in order.picks]}
+
+
+def order_from_json(data):
+    """Returns the infrastructure.Order of a json order, see order_to_json. Every pick needs a
+    "warehouse_location"; a pick can also be given as the location alone, eg. "F-01-05"."""
+    order = Order(str(data['order_id']))
+    for pick_data in data['picks']:
+        if isinstance(pick_data, str):
+            pick_data = {'warehouse_location': pick_data}
+        if 'warehouse_location' not in pick_data:
+            raise ValueError("pick of order " + order._order_id + " has no warehouse_location")
+        pick = Pick([pick_data.get(column[1:]) for column in PICK_COLUMNS])
+        pick._order = order._order_id
+        order.picks.append(pick)
+    if len(order.picks) == 0:
+        raise ValueError("order " + order._order_id + " has no picks")
+    return order
+
+
+def latency_percentiles(values):
+    """Returns 'count', 'p50', 'p90', 'p99' and 'max' of the latencies values (seconds)."""
+    if len(values) == 0:
+        return {'count': 0, 'p50': None, 'p90': None, 'p99': None, 'max': None}
+    p50, p90, p99 = np.percentile(np.asarray(values, dtype=float), [50, 90, 99]).tolist()
+    return {'count': len(values), 'p50': p50, 'p90': p90, 'p99': p99, 'max': float(max(values))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve batch plans over a socket, or talk to the service.")
+    parser.add_argument('command', choices=['serve', 'submit', 'plan', 'stats'])
+    parser.add_argument('--socket', help="Unix socket path, eg. /tmp/batching.sock")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--dist', default="../data/dist.csv", help="distances csv of serve")
+    parser.add_argument('--orders', help="orders csv of submit")
+    parser.add_argument('--volume', type=int, default=6)
+    parser.add_argument('--solver', default='alns', choices=['alns', 'heuristic', 'set_partitioning'])
+    parser.add_argument('--time-limit', type=float, default=0.5, help="seconds of search per plan")
+    parser.add_argument('--workers', type=int, help="number of processes, default is the number of cores")
+    parser.add_argument('--max-queue', type=int, default=16, help="plans that may wait for a worker")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        service = BatchingService(args.dist, volume=args.volume, solver=args.solver, time_limit=args.time_limit,
+                                  max_workers=args.workers, max_queue=args.max_queue, seed=args.seed)
+        serving = service.serve_unix(args.socket) if args.socket else service.serve_tcp(args.host, args.port)
+        try:
+            asyncio.run(serving)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    async def talk():
+        if args.socket:
+            client = await Client.connect_unix(args.socket)
+        else:
+            client = await Client.connect_tcp(args.host, args.port)
+        try:
+            if args.command == 'submit':
+                return await client.submit(read_orders(args.orders))
+            elif args.command == 'plan':
+                return await client.plan(solver=args.solver, time_limit=args.time_limit)
+            return await client.stats()
+        finally:
+            await client.close()
+
+    print(json.dumps(asyncio.run(talk()), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import time
+
+import gurobipy as gp
+import numpy as np
+
+from heuristic import BatchingInstance, cheapest_insertion
+from infrastructure import Batch, Plan
+from routing import RoutingOracle
+from similarity import OrderIndex
+
+
+class SetPartitioningModel(gp.Model):
+    """Batching model that chooses whole batches, ie columns, instead of building tours edge by edge.
+
+    Every column is a set of at most VOL orders, with the length of its route (from the
+    routing.RoutingOracle) as cost. The master problem picks columns so that every order is in
+    exactly one chosen column. Columns are generated on the LP relaxation: a pricing heuristic
+    grows batches from the orders with the highest dual values and adds every batch with negative
+    reduced cost. The master is then solved with binary columns.
+
+    There is no symmetry between batches and no x variables, so the model stays small and its
+    LP relaxation is much tighter than the one of model.Model.
+
+    Attributes:
+              _nodes (:obj: `list`): all node names (str) of the orders, and the start and end node.
+             _orders (:obj: `list`): order ids, orders are indexed by their position in this list.
+            _columns (:obj: `list`): _columns[c] is the tuple of sorted order indices of column c.
+             _routes (:obj: `list`): _routes[c] is the route (node names) of column c.
+             _lambda (:obj: `list`): _lambda[c] is the gurobi variable of column c.
+        _constants (:obj: `dict`): VOL, and max_n_batches (None, the number of batches is free).
+    """
+
+    def __init__(self, dist, orders, volume=6, oracle=None, n_neighbours=15):
+        """
+        Args:
+                 dist (:obj: `dict`): distances, eg dist['node_id_i']['node_id_j'], or a DistanceMatrix.
+               orders (:obj: `dict`): Dict of all orders.
+                                      key: order_id (str) and item: infrastructure.Order
+             volume (int, optional): Maximum number of orders in a batch, default is 6.
+            oracle (:obj: `RoutingOracle`, optional): oracle for the column costs, eg. one shared
+                                      with other models over the same distances.
+            n_neighbours (int, optional): number of closest orders tried when a batch is grown in pricing,
+                                      see similarity.OrderIndex.
+        """
+        self._instance = BatchingInstance.from_orders(dist, orders)
+        self._nodes = self._instance.nodes
+        self._orders = list(orders)
+        self._constants = {'VOL': volume, 'max_n_batches': None}
+        self._oracle = oracle if oracle is not None else RoutingOracle(dist)
+        index = OrderIndex(dist, orders)
+        position = {order_id: o for o, order_id in enumerate(self._orders)}
+        self._neighbours = [[position[other] for other in index.nearest(order_id, k=n_neighbours)]
+                            for order_id in self._orders]
+        self._cg_stats = {'iterations': 0, 'columns': 0, 'lp_bound': None, 'seconds': 0.0}
+
+        super().__init__()
+        self.ModelSense = gp.GRB.MINIMIZE
+        # Every order is picked in exactly one batch
+        self._cover = [self.addConstr(gp.LinExpr() == 1) for order in self._orders]
+        self._columns = []
+        self._column_index = dict()
+        self._routes = []
+        self._lambda = []
+
+        # start columns: every order on its own, which is always feasible, and the heuristic batches
+        for order in range(len(self._orders)):
+            self._add_column((order,))
+        for batch in self._instance.construct(volume):
+            self._add_column(tuple(sorted(batch)))
+        super().update()
+
+    def _add_column(self, column):
+        """Adds the column (tuple of sorted order indices) if it is new. Returns True if added."""
+        if column in self._column_index:
+            return False
+        nodes = set()
+        for order in column:
+            nodes.update(self._nodes[node] for node in self._instance.order_nodes[order].tolist())
+        cost, route = self._oracle.route(nodes)
+        var = super().addVar(obj=cost, lb=0.0, ub=1.0, vtype=gp.GRB.BINARY,
+                             column=gp.Column([1.0] * len(column), [self._cover[order] for order in column]))
+        self._column_index[column] = len(self._columns)
+        self._columns.append(column)
+        self._routes.append(route)
+        self._lambda.append(var)
+        return True
+
+    def optimize(self, MIPGap=None, max_iterations=50, max_new_columns=200, time_limit=None):
+        """Generates columns on the LP relaxation and then solves the master with binary columns.
+
+        Args:
+            MIPGap (float, optional): MIPGap of the final, binary master problem, see model.Model.optimize.
+            max_iterations (int, optional): maximum number of pricing rounds.
+            max_new_columns (int, optional): maximum number of columns added per pricing round.
+            time_limit (float, optional): seconds for the column generation; the binary master is
+                                          always solved with the columns found so far.
+        """
+        start = time.perf_counter()
+        if MIPGap is not None:
+            self.Params.MIPGap = MIPGap
+
+        for iteration in range(max_iterations):
+            super().setAttr('VType', self._lambda, [gp.GRB.CONTINUOUS] * len(self._lambda))
+            super().optimize()
+            self._cg_stats['iterations'] += 1
+            self._cg_stats['lp_bound'] = self.ObjVal
+            duals = np.array(super().getAttr('Pi', self._cover))
+            new_columns = self._price(duals, max_new_columns)
+            if new_columns == 0:
+                break
+            if time_limit is not None and time.perf_counter() - start > time_limit:
+                break
+
+        super().setAttr('VType', self._lambda, [gp.GRB.BINARY] * len(self._lambda))
+        super().optimize()
+        self._cg_stats['columns'] = len(self._columns)
+        self._cg_stats['seconds'] = time.perf_counter() - start
+
+    def _price(self, duals, max_new_columns, tolerance=1e-6):
+        """Pricing heuristic: grows a batch from every order, highest dual value first.
+
+        Orders from the closest orders of the seed are added while their dual value is larger than
+        the length they add to the route (estimated with cheapest insertion). Every batch with a
+        negative reduced cost, ie route length minus the sum of its duals, is added as a column.
+
+        Returns:
+            n_new (int): number of columns added.
+        """
+        distances = self._instance.distances
+        start, end = self._instance.START, self._instance.END
+        n_new = 0
+        for seed in np.argsort(-duals).tolist():
+            batch = [seed]
+            delta, route = cheapest_insertion(distances, [start, end], self._instance.order_nodes[seed].tolist())
+            while len(batch) < self._constants['VOL']:
+                best_gain, best = tolerance, None
+                for order in self._neighbours[seed]:
+                    if order in batch:
+                        continue
+                    added, new_route = cheapest_insertion(distances, route,
+                                                          self._instance.order_nodes[order].tolist())
+                    if duals[order] - added > best_gain:
+                        best_gain, best = duals[order] - added, (order, new_route)
+                if best is None:
+                    break
+                batch.append(best[0])
+                route = best[1]
+
+                column = tuple(sorted(batch))
+                if column not in self._column_index:
+                    cost = self._oracle.length(self._nodes[node] for order in column
+                                               for node in self._instance.order_nodes[order].tolist())
+                    if cost - duals[list(column)].sum() < -tolerance and self._add_column(column):
+                        n_new += 1
+            if n_new >= max_new_columns:
+                break
+        super().update()
+        return n_new
+
+    def column_generation_stats(self):
+        """Returns the statistics of the last optimize().
+
+        Returns:
+            stats (:obj: `dict`): 'iterations' (int) LP solves, 'columns' (int) in the master,
+                                  'lp_bound' (float) last LP objective and 'seconds' (float).
+        """
+        return dict(self._cg_stats)
+
+    def batches(self, orders=None):
+        """Returns the chosen columns as a list of infrastructure.Batch.
+
+        Args:
+            orders (:obj: `dict`, optional): the orders, to fill in the picks of the batches.
+        """
+        batches = []
+        for column, var in enumerate(self._lambda):
+            if var.X > 0.5:
+                batch = Batch(orders=[self._orders[order] for order in self._columns[column]],
+                              route=self._routes[column], distance=int(round(var.Obj)))
+                if orders is not None:
+                    for order_id in batch.orders:
+                        batch.picks.extend(orders[order_id].picks)
+                batches.append(batch)
+        return batches
+
+    def solution(self, orders=None):
+        """Returns the chosen columns as an infrastructure.Plan, see batches."""
+        return Plan(self.batches(orders=orders))
+
+    def solution_batches(self):
+        """Lists every chosen batch, in the same format as model.Model.solution_batches."""
+        results_string = str()
+        for batch_k, batch in enumerate(self.batches()):
+            results_string += 'batch: ' + str(batch_k) + '\t'
+            results_string += 'orders: ' + str(batch.orders) + '\t'
+            results_string += 'route: ' + str(batch.route) + '\t'
+            results_string += 'distance: ' + str(batch.distance)
+            results_string += '\n'
+        return results_string
@@ -0,0 +1,157 @@
+import numpy as np
+
+from infrastructure import distance_submatrix
+
+
+class OrderIndex:
+    """Answers "which orders are closest to this one?" without scanning all orders.
+
+    The proximity of order p to order o is the mean distance from the locations of p to the
+    closest location of o; it is 0 if all locations of p are locations of o. The index keeps an
+    inverted index from location to the orders with a pick there. A query walks the locations by
+    their distance to the locations of o, closest first, and only scores the orders found there,
+    until no order further away can be closer than the k-th closest found. Orders can be added
+    and removed at any time.
+
+    Attributes:
+        stats (:obj: `dict`): 'queries' and 'scored' number of orders whose proximity was computed.
+
+    Example:
+    >>> index = OrderIndex(dist, read_orders("../data/example.csv"))
+    >>> index.nearest('000001', k=1)
+    ['000002']
+    >>> index.orders_at('F-04-05')
+    ['000001']
+    """
+
+    def __init__(self, dist, orders=None):
+        """
+        Args:
+            dist (:obj: `DistanceMatrix` or `dict`): distances, eg dist['node_id_i']['node_id_j'].
+                       orders (:obj: `dict`, optional): Dict of the first orders.
+                                                        key: order_id (str) and item: infrastructure.Order
+        """
+        self._dist = dist
+        self._nodes = []
+        self._node_index = dict()
+        self._distances = np.zeros((0, 0), dtype=np.int64)
+        self._order_nodes = dict()
+        self._orders_at = []
+        self.stats = {'queries': 0, 'scored': 0}
+        if orders is not None:
+            self.add(orders)
+
+    def __len__(self):
+        return len(self._order_nodes)
+
+    def __contains__(self, order_id):
+        return order_id in self._order_nodes
+
+    def add(self, orders):
+        """Adds orders to the index.
+
+        Args:
+            orders (:obj: `dict`): key: order_id (str) and item: infrastructure.Order, not yet in the index.
+        """
+        duplicates = [order_id for order_id in orders if order_id in self._order_nodes]
+        if len(duplicates) > 0:
+            raise ValueError("orders already in the index: " + str(duplicates))
+        locations = {order_id: list(dict.fromkeys(order.locations())) for order_id, order in orders.items()}
+        new_nodes = list(dict.fromkeys(node for nodes_o in locations.values() for node in nodes_o
+                                       if node not in self._node_index))
+        if len(new_nodes) > 0:
+            self._add_nodes(new_nodes)
+        for order_id, nodes_o in locations.items():
+            indices = np.array([self._node_index[node] for node in nodes_o], dtype=np.intp)
+            self._order_nodes[order_id] = indices
+            for node in indices.tolist():
+                self._orders_at[node][order_id] = None
+
+    def remove(self, order_ids):
+        """Removes orders from the index.
+
+        Args:
+            order_ids (:obj: `iterable`): order ids (str) in the index.
+        """
+        order_ids = list(order_ids)
+        missing = [order_id for order_id in order_ids if order_id not in self._order_nodes]
+        if len(missing) > 0:
+            raise ValueError("orders not in the index: " + str(missing))
+        for order_id in order_ids:
+            for node in self._order_nodes.pop(order_id).tolist():
+                del self._orders_at[node][order_id]
+
+    def orders_at(self, location):
+        """Returns the ids (str) of the orders with a pick at location."""
+        node = self._node_index.get(location)
+        return list(self._orders_at[node]) if node is not None else []
+
+    def proximity(self, order_id, others):
+        """Returns the proximity of every order of others to order_id, as a float ndarray.
+
+        Args:
+                order_id (str): order in the index.
+            others (:obj: `list`): order ids (str) in the index.
+        """
+        return self._proximity(self._closest(self._order_nodes[order_id]), others)
+
+    def nearest(self, order_id, k=10, exclude=()):
+        """Returns the k orders that are closest to order_id, see the class.
+
+        Args:
+                   order_id (str): order in the index.
+               k (int, optional): number of orders, default is 10.
+            exclude (:obj: `iterable`, optional): order ids (str) that are not returned, eg. the orders
+                                                  already in a batch.
+
+        Returns:
+            order_ids (:obj: `list`): at most k order ids (str), closest first, not order_id itself.
+        """
+        self.stats['queries'] += 1
+        skip = set(exclude)
+        skip.add(order_id)
+        closest = self._closest(self._order_nodes[order_id])
+        by_distance = np.argsort(closest, kind='stable')
+        sorted_closest = closest[by_distance]
+        # the locations at the same distance are taken together
+        ends = np.r_[np.flatnonzero(np.diff(sorted_closest)) + 1, len(by_distance)]
+
+        candidates = []
+        scores = np.empty(0)
+        seen = set()
+        begin = 0
+        for end in ends.tolist():
+            found = [other for node in by_distance[begin:end].tolist() for other in self._orders_at[node]
+                     if other not in skip and other not in seen]
+            found = list(dict.fromkeys(found))
+            seen.update(found)
+            candidates.extend(found)
+            scores = np.r_[scores, self._proximity(closest, found)]
+            begin = end
+            # orders not found yet have all their locations at least this far away
+            further = sorted_closest[end] if end < len(sorted_closest) else np.inf
+            if len(candidates) >= k and np.partition(scores, k - 1)[k - 1] <= further:
+                break
+        return [candidates[i] for i in np.argsort(scores, kind='stable')[:k].tolist()]
+
+    def _closest(self, nodes):
+        """Distance from every location of the index to the closest of nodes, as an ndarray."""
+        return self._distances[:, nodes].min(axis=1)
+
+    def _proximity(self, closest, others):
+        """Mean of closest over the locations of every order of others."""
+        self.stats['scored'] += len(others)
+        if len(others) == 0:
+            return np.empty(0)
+        nodes = [self._order_nodes[other] for other in others]
+        lengths = np.array([len(nodes_o) for nodes_o in nodes])
+        offsets = np.r_[0, np.cumsum(lengths)][:-1]
+        return np.add.reduceat(closest[np.concatenate(nodes)], offsets) / lengths
+
+    def _add_nodes(self, nodes):
+        """Adds locations to the index and extends the distances between the locations."""
+        self._nodes.extend(nodes)
+        for node in nodes:
+            self._node_index[node] = len(self._orders_at)
+            self._orders_at.append(dict())
+        self._distances = np.asarray(distance_submatrix(self._dist, self._nodes), dtype=np.int64)
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# the modules of src are imported as top level modules, as main.py does
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+DATA_DIR = os.path.join(os.path.dirname(SRC_DIR), 'data')
+sys.path.insert(0, SRC_DIR)
+
+from infrastructure import Warehouse, read_orders # noqa: E402
+
+
+ORDERS_HEADER = ("Auftrag;Datum;Lagerort;Begin Komm. am;Begin Komm. um;Ende Komm. am;Ende Komm. Auftrag um;"
+                 "Ende Komm. Pos. um;Batch;Reihenfolge der Komm.;Wagen Nr;Artikel;Kistennummer;Erstellt am;Erstellt um;\n")
+
+
+@pytest.fixture(scope='session')
+def dist():
+    """The distances of ../data/dist.csv, without writing the binary cache."""
+    return Warehouse().read_distances(os.path.join(DATA_DIR, 'dist.csv'), cache=False)
+
+
+@pytest.fixture
+def make_orders(tmp_path):
+    """Returns a function that writes orders as a csv, key: order id and item: list of locations,
+    and reads them with read_orders."""
+    def make(locations):
+        data_file = tmp_path / "orders.csv"
+        rows = [order_id + ";02.07.17;" + location + ";02.07.17;08:14;02.07.17;09:15;09:09;;;;;1;30.06.17;11:53;\n"
+                for order_id, order_locations in locations.items() for location in order_locations]
+        data_file.write_text(ORDERS_HEADER + "".join(rows))
+        return read_orders(str(data_file))
+    return make
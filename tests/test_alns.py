@@ -0,0 +1,29 @@
+import os
+
+from conftest import DATA_DIR
+from alns import ALNS, solve
+from heuristic import BatchingInstance, route_length
+from infrastructure import read_orders
+
+
+def test_new_batch_is_priced_as_its_route(dist):
+    instance = BatchingInstance.from_orders(dist, read_orders(os.path.join(DATA_DIR, 'example.csv')))
+    search = ALNS(instance, volume=1, seed=0)
+    cost = int(search.costs.sum())
+    backup = dict()
+    search._remove([0], backup)
+
+    # every batch is full, so the order can only open a new batch
+    (delta, k), = search._best_insertions(0)
+    search._insert(0, k, backup)
+
+    assert delta == route_length(instance.distances, search.routes[k]) == search.costs[k]
+    assert int(search.costs.sum()) == cost
+
+
+def test_solve_plans_every_order(dist):
+    orders = read_orders(os.path.join(DATA_DIR, 'example.csv'))
+    batches = solve(dist, orders, volume=6, time_limit=0.5, seed=0)
+
+    assert sorted(order_id for batch in batches for order_id in batch.orders) == sorted(orders)
+    assert sum(batch.distance for batch in batches) == 189400
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+
+from bounding import lower_bound, route_bound
+from conftest import DATA_DIR
+from heuristic import route_length
+from infrastructure import read_orders
+from routing import RoutingOracle, held_karp
+
+
+def _partitions(items, volume):
+    """Yields every partition of items into groups of at most volume."""
+    if len(items) == 0:
+        yield []
+        return
+    first, rest = items[0], items[1:]
+    for partition in _partitions(rest, volume):
+        yield [[first]] + partition
+        for g, group in enumerate(partition):
+            if len(group) < volume:
+                yield partition[:g] + [[first] + group] + partition[(g + 1):]
+
+
+def test_lower_bound_of_the_example_is_below_the_optimum(dist):
+    bound, parts = lower_bound(dist, read_orders(os.path.join(DATA_DIR, 'example.csv')), volume=6)
+    assert bound == 155800 <= 189400
+    assert parts['min_batches'] == 1
+
+
+def test_lower_bound_is_below_the_brute_force_optimum(dist, make_orders):
+    oracle = RoutingOracle(dist)
+    for instance in range(4):
+        orders = make_orders({'%06d' % o: ['F-%02d-%02d' % (1 + (5 * o + 7 * instance + 3 * k) % 20,
+                                                           (11 * o + 13 * instance + 17 * k) % 28 + 1)
+                                           for k in range(1 + (o + instance) % 3)] for o in range(1, 6)})
+        optimum = min(sum(oracle.length(node for order_id in group for node in orders[order_id].locations())
+                          for group in partition)
+                      for partition in _partitions(list(orders), 2))
+
+        assert lower_bound(dist, orders, volume=2, exact_limit=2)[0] <= optimum
+        assert lower_bound(dist, orders, volume=2)[0] <= optimum
+
+
+def test_route_bound_of_a_large_order_is_below_its_exact_route(dist):
+    nodes = ['F-20-28', 'F-20-27', 'F-03-19', 'F-04-05', 'F-05-11', 'F-01-05', 'F-01-23', 'F-07-02', 'F-09-14',
+             'F-12-20']
+    distances = dist.submatrix(nodes).astype(np.int64)
+    exact = route_length(distances, held_karp(distances, list(range(2, len(nodes))), 0, 1))
+
+    assert route_bound(distances, list(range(2, len(nodes))), 0, 1, exact_limit=8, names=nodes) == exact
+    assert route_bound(distances, list(range(2, len(nodes))), 0, 1, exact_limit=3, names=nodes) <= exact
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from conftest import ORDERS_HEADER
+from decomposition import _boundary_batches, _boundary_interval, split_orders
+from infrastructure import Batch, read_orders
+
+
+def _write_orders(tmp_path, created):
+    """Writes one pick per order, key: order id and item: (Datum, Erstellt am, Erstellt um)."""
+    data_file = tmp_path / "orders.csv"
+    rows = [order_id + ";" + date + ";F-03-19;02.07.17;08:14;02.07.17;09:15;09:09;;;;;1;" + on + ";" + at + ";\n"
+            for order_id, (date, on, at) in created.items()]
+    data_file.write_text(ORDERS_HEADER + "".join(rows))
+    return read_orders(str(data_file))
+
+
+def test_split_orders_handles_missing_creation_times(tmp_path):
+    orders = _write_orders(tmp_path, {'000001': ('30.06.17', '30.06.17', '11:53'),
+                                      '000002': ('30.06.17', '', ''),
+                                      '000003': ('', '', ''),
+                                      '000004': ('30.06.17', '30.06.17', '12:10')})
+    windows = split_orders(orders, window=60, overlap=30)
+
+    # without Erstellt am/um the order is created at the start of its Datum, without both last
+    assert windows == [(['000002'], []), (['000001'], ['000004']), (['000004'], []), (['000003'], [])]
+
+
+def test_boundary_batches_are_the_open_batches_near_the_boundary():
+    start = datetime(2017, 6, 30, 11, 0)
+    created = {'a': start, 'b': start + timedelta(minutes=55), 'c': start + timedelta(minutes=62),
+               'd': start + timedelta(minutes=110), 'e': None}
+    interval = _boundary_interval(created, ['a', 'b', 'e'], ['c', 'd'], timedelta(minutes=10))
+    assert interval == (start + timedelta(minutes=45), start + timedelta(minutes=72))
+
+    plan = [Batch(orders=['a']), Batch(orders=['b']), Batch(orders=['a', 'b']), Batch(orders=['d', 'e'])]
+    assert [batch.orders for batch in _boundary_batches(plan, created, interval, volume=2)] == [['b']]
@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+
+from conftest import DATA_DIR
+from heuristic import chunked_batches, construct_batches, route_length, two_opt
+from infrastructure import NAME_END_NODE, NAME_START_NODE, distance_submatrix, read_orders
+
+
+def test_chunked_batches_plan_every_order_once(dist, make_orders):
+    orders = make_orders({'%06d' % o: ['F-%02d-%02d' % (1 + o % 19, (7 * o) % 29)] for o in range(1, 30)})
+    batches = chunked_batches(dist, orders, volume=3, chunk_size=6)
+
+    assert sorted(order_id for batch in batches for order_id in batch.orders) == sorted(orders)
+    assert all(len(batch.orders) <= 3 for batch in batches)
+
+
+def test_chunked_batches_equal_construct_batches_in_one_chunk(dist):
+    orders = read_orders(os.path.join(DATA_DIR, 'example.csv'))
+    assert ([batch.to_dict() for batch in chunked_batches(dist, orders, volume=6)]
+            == [batch.to_dict() for batch in construct_batches(dist, orders, volume=6)])
+
+
+def test_construct_batches_route_every_pick_with_its_distance(dist, make_orders):
+    orders = make_orders({'%06d' % o: ['F-%02d-%02d' % (1 + (3 * o + k) % 19, (5 * o + 11 * k) % 29 + 1)
+                                       for k in range(1 + o % 3)] for o in range(1, 15)})
+    batches = construct_batches(dist, orders, volume=4)
+
+    assert sorted(order_id for batch in batches for order_id in batch.orders) == sorted(orders)
+    for batch in batches:
+        assert len(batch.orders) <= 4
+        assert batch.route[0] == NAME_START_NODE and batch.route[-1] == NAME_END_NODE
+        assert set(batch.route[1:-1]) == {pick._warehouse_location for pick in batch.picks}
+        distances = distance_submatrix(dist, batch.route)
+        assert batch.distance == route_length(distances, range(len(batch.route)))
+
+
+def test_two_opt_keeps_the_ends_and_never_lengthens_a_path():
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        points = rng.random((9, 2))
+        distances = np.rint(1000 * np.hypot(*(points[:, None] - points[None, :]).transpose(2, 0, 1))).astype(np.int64)
+        path = [0] + rng.permutation(np.arange(2, 9)).tolist() + [1]
+        improved = two_opt(distances, path)
+
+        assert improved[0] == 0 and improved[-1] == 1 and sorted(improved) == sorted(path)
+        assert route_length(distances, improved) <= route_length(distances, path)
@@ -0,0 +1,35 @@
+import csv
+import json
+import os
+
+from conftest import DATA_DIR
+from heuristic import construct_batches
+from infrastructure import NAME_END_NODE, NAME_START_NODE, Plan, read_orders, write_plan_json
+
+
+def test_plan_exports_every_stop_and_its_totals(dist, tmp_path):
+    orders = read_orders(os.path.join(DATA_DIR, 'example.csv'))
+    plan = Plan(construct_batches(dist, orders, volume=1), orders)
+    totals = plan.totals()
+    assert totals == {'n_batches': 2, 'n_orders': 2, 'n_picks': 5,
+                      'distance': sum(batch.distance for batch in plan)}
+
+    assert plan.write_csv(str(tmp_path / "plan.csv")) == totals
+    assert plan.write_json(str(tmp_path / "plan.json")) == totals
+    # batches can be a generator
+    assert write_plan_json((batch for batch in plan), str(tmp_path / "generated.json")) == totals
+    assert (tmp_path / "generated.json").read_text() == (tmp_path / "plan.json").read_text()
+
+    with open(tmp_path / "plan.csv", newline='') as the_file:
+        rows = list(csv.DictReader(the_file, delimiter=';'))
+    assert len(rows) == sum(len(batch.route) for batch in plan)
+    for batch_k, batch in enumerate(plan):
+        stops = [row for row in rows if row['Batch'] == str(batch_k)]
+        assert [row['Lagerort'] for row in stops] == batch.route
+        assert [row['Auftraege'] for row in stops[1:-1]] == batch.orders * (len(batch.route) - 2)
+        assert stops[0]['Lagerort'] == NAME_START_NODE and stops[-1]['Lagerort'] == NAME_END_NODE
+        assert stops[0]['Auftraege'] == ''
+
+    with open(tmp_path / "plan.json") as the_file:
+        exported = json.load(the_file)
+    assert exported == {'batches': [batch.to_dict() for batch in plan], 'totals': totals}
@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import DATA_DIR
+from layout import Layout
+
+
+@pytest.fixture(scope='module')
+def layout():
+    return Layout.read(os.path.join(DATA_DIR, 'layout.json'))
+
+
+def test_layout_distances_reproduce_the_distances_csv(dist, layout):
+    layout_dist = layout.distances()
+    nodes = list(dist.nodes)
+    assert sorted(layout_dist.nodes) == sorted(nodes)
+
+    assert np.array_equal(layout_dist.submatrix(nodes), dist.submatrix(nodes))
+    assert layout_dist.distance('F-20-28', 'F-03-19') == dist['F-20-28']['F-03-19']
+
+
+def test_layout_distances_compute_only_the_rows_used(layout):
+    layout_dist = layout.distances()
+    nodes = ['F-20-28', 'F-03-19', 'F-04-05']
+    submatrix = layout_dist.submatrix(nodes)
+    assert layout_dist.computed_rows() == 3
+
+    # Floyd-Warshall over the full matrix agrees with the Dijkstra rows
+    idx = layout_dist.indices(nodes)
+    assert np.array_equal(layout_dist.array[np.ix_(idx, idx)], submatrix)
+    assert layout_dist.computed_rows() == len(layout.nodes)
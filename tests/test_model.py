@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+gp = pytest.importorskip('gurobipy')
+
+from conftest import DATA_DIR # noqa: E402
+from infrastructure import read_orders # noqa: E402
+from model import Model, _subtour_components # noqa: E402
+
+
+def test_release_then_fix_all_heuristic_batches_is_feasible(dist, make_orders):
+    orders = make_orders({'000001': ['F-14-01', 'F-09-16'], '000002': ['F-13-25', 'F-10-15'],
+                          '000003': ['F-19-28', 'F-07-16'], '000004': ['F-10-04']})
+    model = Model(dist, {order_id: orders[order_id] for order_id in ['000001', '000002', '000003']}, volume=2)
+    model.setParam('OutputFlag', 0)
+    model.optimize(time_limit=10)
+    model.add_orders({'000004': orders['000004']})
+    model.optimize(time_limit=10)
+    released = model.release([0])
+
+    model.optimize(fix_share=1.0, time_limit=10)
+
+    assert model.SolCount > 0
+    batches = model.incumbent_batches()
+    assert batches[0].orders == released[0].orders
+    assert sorted(order_id for batch in batches.values() for order_id in batch.orders) == sorted(orders)
+
+
+def test_solve_parameters_hold_for_one_solve(dist):
+    model = Model(dist, read_orders(os.path.join(DATA_DIR, 'example.csv')), volume=6)
+    model.setParam('OutputFlag', 0)
+    model.optimize(time_limit=10, abs_gap=500, fractional_cuts=True, lower_bound=155800)
+
+    for name in ('TimeLimit', 'MIPGapAbs', 'PreCrush', 'BestObjStop'):
+        assert model.getParamInfo(name)[2] == model.getParamInfo(name)[-1]
+
+
+def test_subtour_components_match_a_graph_search():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        edge_i, edge_j = rng.integers(0, 12, size=(2, 10))
+        neighbours = {node: set() for node in range(12)}
+        for i, j in zip(edge_i.tolist(), edge_j.tolist()):
+            neighbours[i].add(j)
+            neighbours[j].add(i)
+        expected = set()
+        seen = set()
+        for node in sorted(set(edge_i.tolist()) | set(edge_j.tolist())):
+            if node in seen:
+                continue
+            component = {node}
+            stack = [node]
+            while stack:
+                for neighbour in neighbours[stack.pop()] - component:
+                    component.add(neighbour)
+                    stack.append(neighbour)
+            seen |= component
+            if 0 not in component and 1 not in component:
+                expected.add(tuple(sorted(component)))
+
+        assert set(_subtour_components(12, edge_i, edge_j, (0, 1))) == expected
+
+
+def test_model_finds_the_optimum_of_the_example(dist):
+    orders = read_orders(os.path.join(DATA_DIR, 'example.csv'))
+    model = Model(dist, orders, volume=6)
+    model.setParam('OutputFlag', 0)
+    model.optimize(time_limit=30)
+
+    assert round(model.ObjVal) == 189400
+    assert model.solution(orders).totals() == {'n_batches': 1, 'n_orders': 2, 'n_picks': 5, 'distance': 189400}
+
+
+def test_warm_start_is_the_first_incumbent(dist, make_orders):
+    orders = make_orders({'%06d' % o: ['F-%02d-%02d' % (1 + (3 * o) % 19, (7 * o) % 28 + 1)] for o in range(1, 6)})
+    model = Model(dist, orders, volume=2)
+    model.setParam('OutputFlag', 0)
+    model.setParam('NodeLimit', 0)
+    model.setParam('Heuristics', 0) # gurobi finds no incumbent of its own at the root
+    model.optimize(time_limit=10)
+
+    assert model.SolCount > 0
+    assert round(model.ObjVal) == sum(batch.distance for batch in model.heuristic_batches())
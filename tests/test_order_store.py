@@ -0,0 +1,62 @@
+from infrastructure import PICK_COLUMNS, read_orders
+from order_store import OrderStore, convert_orders
+
+from conftest import ORDERS_HEADER
+
+
+def test_round_trip_keeps_end_date_without_end_pos_time(tmp_path):
+    data_file = tmp_path / "orders.csv"
+    data_file.write_text(ORDERS_HEADER
+                         + "000001;02.07.17;F-03-19;02.07.17;08:14;02.07.17;09:15;09:09;1380;76;1000;000010;1;30.06.17;11:53;\n"
+                         + "000001;02.07.17;F-04-05;02.07.17;08:14;02.07.17;09:15;;1380;70;1000;000011;1;30.06.17;11:53;\n")
+    convert_orders(str(data_file), str(tmp_path / "orders.store"))
+
+    expected = read_orders(str(data_file))
+    orders = OrderStore(str(tmp_path / "orders.store")).orders()
+
+    picks = orders['000001'].picks
+    assert [pick._end_on for pick in picks] == ['02.07.17', '02.07.17']
+    assert [pick._end_pos_at for pick in picks] == ['09:09', '']
+    for pick, expected_pick in zip(picks, expected['000001'].picks):
+        assert [getattr(pick, name) for name in PICK_COLUMNS] == [getattr(expected_pick, name) for name in PICK_COLUMNS]
+
+
+def _round_trip(tmp_path, rows):
+    data_file = tmp_path / "orders.csv"
+    data_file.write_text(ORDERS_HEADER + "".join(rows))
+    convert_orders(str(data_file), str(tmp_path / "orders.store"))
+    return read_orders(str(data_file)), OrderStore(str(tmp_path / "orders.store"))
+
+
+def test_round_trip_keeps_article_and_box_ids_that_are_not_numbers(tmp_path):
+    expected, store = _round_trip(tmp_path, [
+        "000001;02.07.17;F-03-19;02.07.17;08:14;02.07.17;09:15;09:09;1380;76;1000;A-10;K1;30.06.17;11:53;\n",
+        "000001;02.07.17;F-04-05;02.07.17;08:14;02.07.17;09:15;09:05;1380;70;1000;000011;;30.06.17;11:53;\n"])
+
+    picks = store.orders()['000001'].picks
+    assert [pick._id for pick in picks] == ['A-10', '000011']
+    assert [pick._box_nr for pick in picks] == ['K1', '']
+    assert '_id' in store.strings and '_batch' not in store.strings
+    for pick, expected_pick in zip(picks, expected['000001'].picks):
+        assert [getattr(pick, name) for name in PICK_COLUMNS] == [getattr(expected_pick, name) for name in PICK_COLUMNS]
+
+
+def test_round_trip_keeps_zero_padding_of_different_widths(tmp_path):
+    expected, store = _round_trip(tmp_path, [
+        "000001;02.07.17;F-03-19;02.07.17;08:14;02.07.17;09:15;09:09;1380;76;1000;000010;1;30.06.17;11:53;\n",
+        "000001;02.07.17;F-04-05;02.07.17;08:14;02.07.17;09:15;09:05;1380;70;1000;0011;12;30.06.17;11:53;\n"])
+
+    picks = store.orders()['000001'].picks
+    assert [pick._id for pick in picks] == ['000010', '0011']
+    assert [pick._box_nr for pick in picks] == ['1', '12']
+    assert '_box_nr' not in store.strings
+
+
+def test_format_ids_as_in_the_csv(tmp_path):
+    expected, store = _round_trip(tmp_path, [
+        "000001;02.07.17;F-03-19;02.07.17;08:14;02.07.17;09:15;09:09;1380;76;1000;A-10;;30.06.17;11:53;\n",
+        "000002;02.07.17;F-04-05;02.07.17;08:14;02.07.17;09:15;09:05;;70;1000;000011;;30.06.17;11:53;\n"])
+
+    assert store.format_ids('_order', store.order_ids).tolist() == ['000001', '000002']
+    assert store.format_ids('_batch', store.columns['batch']).tolist() == ['1380', '']
+    assert store.format_ids('_id', store.columns['id']).tolist() == ['A-10', '000011']
@@ -0,0 +1,39 @@
+import pytest
+
+gp = pytest.importorskip('gurobipy')
+
+from model import Model # noqa: E402
+from preprocessing import Reduction # noqa: E402
+
+
+def _optimum(dist, orders):
+    model = Model(dist, orders, volume=6)
+    model.setParam('OutputFlag', 0)
+    model.optimize(time_limit=30)
+    return round(model.ObjVal), model
+
+
+@pytest.mark.parametrize('locations', [
+    {'000001': ['F-05-27', 'F-04-14', 'F-05-06', 'F-03-25'],
+     '000002': ['F-05-19', 'F-03-03', 'F-04-09', 'F-03-02', 'F-05-25']},
+    {'000001': ['F-03-06', 'F-04-20', 'F-04-01', 'F-04-18'],
+     '000002': ['F-03-18', 'F-05-23', 'F-03-16', 'F-05-10']},
+    {'000001': ['F-03-19', 'F-03-19', 'F-04-05'], '000002': ['F-04-05', 'F-05-11']},
+])
+def test_reduction_keeps_the_optimum(dist, make_orders, locations):
+    orders = make_orders(locations)
+    optimum, _ = _optimum(dist, orders)
+
+    reduction = Reduction(dist, orders, merge_distance=0)
+    # no edge between super-nodes is left out, dropping the edges that pass another location of the
+    # orders cut off every optimal route of the first two instances
+    assert reduction.stats['edges'] == len(reduction.dist) * (len(reduction.dist) - 1) // 2
+    reduced, model = _optimum(reduction.dist, reduction.orders)
+    assert reduced == optimum
+    assert reduction.stats['reduced_picks'] == sum(len(order.locations()) for order in orders.values())
+
+    # the routes over super-nodes walk all locations at the distance of the objective
+    batches = [reduction.expand_batch(batch, orders) for batch in model.incumbent_batches().values()]
+    assert sum(batch.distance for batch in batches) == optimum
+    for batch in batches:
+        assert set(batch.route) >= {pick._warehouse_location for pick in batch.picks}
@@ -0,0 +1,47 @@
+import math
+import multiprocessing
+import os
+
+import pytest
+
+from conftest import DATA_DIR
+from heuristic import construct_batches
+from infrastructure import NAME_START_NODE, NAME_END_NODE, Batch, read_orders
+from racing import IncumbentChannel, race
+
+
+def test_channel_stores_plan_and_rejects_too_long_routes(dist):
+    orders = read_orders(os.path.join(DATA_DIR, 'example.csv'))
+    channel = IncumbentChannel(multiprocessing.get_context('spawn'), orders, 1)
+    batches = construct_batches(dist, orders, volume=1)
+    objective = sum(batch.distance for batch in batches)
+
+    assert channel.publish(0, objective, batches)
+    stored, stored_batches, owner, version = channel.best()
+    assert (stored, owner, version) == (objective, 0, 1)
+    assert [(batch.orders, batch.route) for batch in stored_batches] == [(batch.orders, batch.route) for batch in batches]
+
+    too_long = Batch(orders=list(orders), route=[NAME_START_NODE] * 100 + [NAME_END_NODE], distance=0)
+    with pytest.raises(ValueError):
+        channel.publish(0, 0.0, [too_long])
+
+
+def test_restricted_model_is_no_proof():
+    pytest.importorskip('gurobipy')
+    configurations = [{'name': 'heuristic_batches', 'solver': 'model', 'max_n_batches': 'heuristic'}]
+    batches, stats = race(os.path.join(DATA_DIR, 'dist.csv'), read_orders(os.path.join(DATA_DIR, 'example.csv')),
+                          configurations=configurations, time_limit=10)
+
+    assert stats['objective'] == sum(batch.distance for batch in batches)
+    assert stats['bound'] == -math.inf
+    assert not stats['proven']
+
+
+def test_solve_that_proves_the_plan_wins():
+    pytest.importorskip('gurobipy')
+    configurations = [{'name': 'default', 'solver': 'model'}, {'name': 'alns', 'solver': 'alns'}]
+    batches, stats = race(os.path.join(DATA_DIR, 'dist.csv'), read_orders(os.path.join(DATA_DIR, 'example.csv')),
+                          configurations=configurations, time_limit=10)
+
+    assert stats['proven']
+    assert stats['winner'] == 'default'
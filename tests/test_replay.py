@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+
+from conftest import DATA_DIR
+from infrastructure import NAME_END_NODE, NAME_START_NODE, Batch, read_orders
+from order_store import OrderStore, convert_orders
+from replay import compare, evaluate_history, load_history
+
+
+def test_historical_batch_is_walked_in_pick_sequence(dist):
+    orders = read_orders(os.path.join(DATA_DIR, 'example.csv'))
+    batches = evaluate_history(load_history(os.path.join(DATA_DIR, 'example.csv'), dist), dist)
+
+    picks = sorted((pick for order in orders.values() for pick in order.picks), key=lambda pick: int(pick._row))
+    route = [NAME_START_NODE] + [pick._warehouse_location for pick in picks] + [NAME_END_NODE, NAME_START_NODE]
+    assert batches['batch'].tolist() == [1380]
+    assert batches['n_orders'].tolist() == [2] and batches['n_picks'].tolist() == [len(picks)]
+    assert batches['distance'].tolist() == [sum(dist[i][j] for i, j in zip(route[:-1], route[1:]))] == [232400]
+
+
+def test_order_store_history_equals_csv_history(dist, tmp_path):
+    convert_orders(os.path.join(DATA_DIR, 'example.csv'), str(tmp_path / "orders.store"))
+    from_csv = load_history(os.path.join(DATA_DIR, 'example.csv'), dist)
+    from_store = load_history(OrderStore(str(tmp_path / "orders.store")), dist)
+
+    for column in from_csv:
+        assert np.array_equal(from_csv[column], from_store[column]), column
+
+
+def test_compare_shares_the_distance_of_a_batch_by_its_orders(dist):
+    history = load_history(os.path.join(DATA_DIR, 'example.csv'), dist)
+    batches = evaluate_history(history, dist)
+    plan = [Batch(orders=['000001'], distance=1000), Batch(orders=['000002', '000003'], distance=3000)]
+    per_batch, per_day = compare(history, batches, plan)
+
+    assert per_batch['planned'].tolist() == [2500.0]
+    assert per_batch['historical'].tolist() == [232400.0] and per_batch['covered'].tolist() == [1.0]
+    assert per_day['saving'].tolist() == [1 - 2500 / 232400]
@@ -0,0 +1,34 @@
+import itertools
+
+import numpy as np
+
+from heuristic import route_length
+from routing import RoutingOracle, held_karp, s_shape_route
+
+
+def test_held_karp_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        distances = rng.integers(1, 100, size=(8, 8)) # not symmetric
+        nodes = list(range(2, 8))
+        best = min(route_length(distances, [0] + list(order) + [1]) for order in itertools.permutations(nodes))
+
+        path = held_karp(distances, nodes, 0, 1)
+        assert path[0] == 0 and path[-1] == 1 and sorted(path[1:-1]) == nodes
+        assert route_length(distances, path) == best
+
+
+def test_s_shape_route_walks_the_aisles_in_alternating_directions():
+    aisles = {1: [(5, 'a'), (20, 'b')], 3: [(9, 'c')], 6: [(2, 'd'), (12, 'e'), (7, 'f')]}
+    # the furthest aisle from the depot first, entered from the front
+    assert s_shape_route(aisles, depot_aisle=1, depot_at_back=False) == ['d', 'f', 'e', 'c', 'a', 'b']
+    assert s_shape_route(aisles, depot_aisle=1, depot_at_back=True) == ['e', 'f', 'd', 'c', 'b', 'a']
+
+
+def test_heuristic_routes_are_never_shorter_than_exact_routes(dist):
+    nodes = ['F-03-19', 'F-04-05', 'F-05-11', 'F-01-05', 'F-01-23', 'F-07-02', 'F-09-14', 'F-12-20']
+    exact = RoutingOracle(dist).route(nodes)
+    heuristic = RoutingOracle(dist, exact_limit=0).route(nodes)
+
+    assert sorted(heuristic[1][1:-1]) == sorted(nodes)
+    assert heuristic[0] >= exact[0]
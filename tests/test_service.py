@@ -0,0 +1,37 @@
+import asyncio
+import json
+import os
+
+from conftest import DATA_DIR
+from infrastructure import read_orders
+from service import BatchingService, order_to_json
+
+
+def test_duplicate_orders_are_rejected():
+    service = BatchingService(os.path.join(DATA_DIR, 'dist.csv'))
+    orders = [order_to_json(order) for order in read_orders(os.path.join(DATA_DIR, 'example.csv')).values()]
+
+    async def requests():
+        return [await service.handle_line(json.dumps({'op': 'submit', 'orders': orders, 'id': 1})),
+                await service.handle_line(json.dumps({'op': 'submit', 'orders': orders[:1], 'id': 2})),
+                await service.handle_line(json.dumps({'op': 'submit', 'orders': [orders[0], orders[0]]}))]
+    first, again, twice = asyncio.run(requests())
+
+    assert first == {'pending': 2, 'ok': True, 'id': 1}
+    assert again == {'ok': False, 'error': "duplicate orders: 000001", 'id': 2}
+    assert not twice['ok']
+    assert service.stats()['pending'] == 2
+
+
+def test_failed_solve_is_answered():
+    service = BatchingService(os.path.join(DATA_DIR, 'dist.csv'))
+    orders = [order_to_json(order) for order in read_orders(os.path.join(DATA_DIR, 'example.csv')).values()]
+
+    async def requests():
+        await service.handle_line(json.dumps({'op': 'submit', 'orders': orders}))
+        # the service is not serving, so there is no worker pool to solve in
+        return await service.handle_line(json.dumps({'op': 'plan'}))
+    response = asyncio.run(requests())
+
+    assert response['ok'] is False
+    assert service.stats()['pending'] == 2
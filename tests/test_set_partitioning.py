@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+gp = pytest.importorskip('gurobipy')
+
+from conftest import DATA_DIR # noqa: E402
+from heuristic import construct_batches # noqa: E402
+from infrastructure import read_orders # noqa: E402
+from routing import RoutingOracle # noqa: E402
+from set_partitioning import SetPartitioningModel # noqa: E402
+
+
+def test_set_partitioning_finds_the_optimum_of_the_example(dist):
+    model = SetPartitioningModel(dist, read_orders(os.path.join(DATA_DIR, 'example.csv')), volume=6)
+    model.setParam('OutputFlag', 0)
+    model.optimize()
+
+    assert round(model.ObjVal) == 189400
+
+
+def test_set_partitioning_covers_every_order_once_with_routed_columns(dist, make_orders):
+    orders = make_orders({'%06d' % o: ['F-%02d-%02d' % (1 + (3 * o + k) % 19, (5 * o + 11 * k) % 28 + 1)
+                                       for k in range(1 + o % 3)] for o in range(1, 13)})
+    model = SetPartitioningModel(dist, orders, volume=3)
+    model.setParam('OutputFlag', 0)
+    model.optimize()
+    batches = model.batches(orders)
+
+    assert sorted(order_id for batch in batches for order_id in batch.orders) == sorted(orders)
+    oracle = RoutingOracle(dist)
+    for batch in batches:
+        assert len(batch.orders) <= 3
+        assert batch.distance == oracle.length(pick._warehouse_location for pick in batch.picks)
+    # the batches of the constructive heuristic are columns of the master
+    heuristic = construct_batches(dist, orders, volume=3)
+    assert sum(batch.distance for batch in batches) <= sum(batch.distance for batch in heuristic)
+    assert model.column_generation_stats()['lp_bound'] <= model.ObjVal + 1e-6
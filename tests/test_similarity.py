@@ -0,0 +1,40 @@
+import pytest
+
+from similarity import OrderIndex
+
+
+def _locations(o):
+    return ['F-%02d-%02d' % (1 + (7 * o + 3 * k) % 20, (13 * o + 5 * k) % 28 + 1) for k in range(1 + o % 4)]
+
+
+def _brute_force_proximity(dist, orders, order_id, other):
+    """Mean distance from the locations of other to the closest location of order_id."""
+    locations = orders[order_id].locations()
+    others = orders[other].locations()
+    return sum(min(dist[node][location] for location in locations) for node in others) / len(others)
+
+
+def test_nearest_matches_a_brute_force_ranking(dist, make_orders):
+    orders = make_orders({'%06d' % o: _locations(o) for o in range(1, 41)})
+    index = OrderIndex(dist, orders)
+    for order_id in list(orders)[:10]:
+        ranking = sorted(_brute_force_proximity(dist, orders, order_id, other) for other in orders if other != order_id)
+        nearest = index.nearest(order_id, k=5)
+
+        assert order_id not in nearest
+        scores = [_brute_force_proximity(dist, orders, order_id, other) for other in nearest]
+        assert scores == pytest.approx(ranking[:5])
+        assert index.proximity(order_id, nearest).tolist() == pytest.approx(scores)
+
+
+def test_removed_and_excluded_orders_are_not_returned(dist, make_orders):
+    orders = make_orders({'%06d' % o: _locations(o) for o in range(1, 21)})
+    index = OrderIndex(dist, {order_id: orders[order_id] for order_id in list(orders)[:10]})
+    index.add({order_id: orders[order_id] for order_id in list(orders)[10:]})
+    first = index.nearest('000001', k=3)
+
+    index.remove(first[:1])
+    assert first[0] not in index.nearest('000001', k=19)
+    assert first[1] not in index.nearest('000001', k=3, exclude=first[1:2])
+    with pytest.raises(ValueError):
+        index.add({'000002': orders['000002']})